@@ -1,7 +1,11 @@
 from fastapi import FastAPI, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from ingestion import process_submission, get_all_hazards
-from db import init_storage, save_hazard
+from fastapi.responses import JSONResponse
+from ingestion import process_submission, get_all_hazards, get_classification_queue
+from classification import ClassificationQueueFull
+from db import init_storage
+from io_utils import FORM_OVERHEAD_BYTES, BodySizeLimit, UploadRejected
+from config import UPLOAD_MAX_BYTES
 import uvicorn
 
 app = FastAPI(title="AccessNowSG Backend")
@@ -12,6 +16,7 @@ app.add_middleware(
     allow_headers=["*"],
     allow_methods=["*"],
 )
+app.add_middleware(BodySizeLimit, limits={"/upload": UPLOAD_MAX_BYTES + FORM_OVERHEAD_BYTES})
 
 # Initialize hazard DB on boot
 init_storage()
@@ -23,10 +28,25 @@ async def upload_hazard(
     longitude: float = Form(...),
     device_id: str = Form(...),
 ):
-    """Receive image + GPS → AI → hazard object."""
-    hazard = await process_submission(file, latitude, longitude, device_id)
-    save_hazard(hazard)
-    return {"status": "ok", "hazard": hazard}
+    """Receive image + GPS → queued AI classification job (poll /jobs/{id} for the hazard)."""
+    try:
+        result = await process_submission(file, latitude, longitude, device_id)
+    except UploadRejected as e:
+        return JSONResponse({"error": e.error, "details": e.details}, status_code=e.status_code)
+    except ClassificationQueueFull as e:
+        return JSONResponse({"error": "Classification is at capacity, retry shortly", "details": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    if result.get("duplicate"):
+        # Same photo, or the same hazard photographed again at this spot: already saved
+        return {"status": "duplicate", "hazard": result}
+    return {"status": "queued", "job": result}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """Progress of a classification job; the saved hazard is in "result" once done."""
+    status = get_classification_queue().status(job_id)
+    if status is None:
+        return JSONResponse({"error": "Unknown job", "details": f"No classification job {job_id}"}, status_code=404)
+    return status
 
 @app.get("/hazards")
 def hazards():
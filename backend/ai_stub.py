@@ -10,3 +10,7 @@ def classify_hazard(image_path):
     label = random.choice(HAZARD_TYPES)
     confidence = round(random.uniform(0.4, 0.95), 2)
     return label, confidence
+
+def classify_hazards(image_paths):
+    # Batched entry point: a real model runs one forward pass over all images
+    return [classify_hazard(path) for path in image_paths]
@@ -0,0 +1,211 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ClassificationQueueFull(Exception):
+    """Too many classification jobs are waiting; the caller should answer 503."""
+
+
+class ClassificationJob:
+    """One photo waiting for, undergoing, or done with hazard classification."""
+
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+    def __init__(self, seq: int, payload: Dict[str, Any], key: Any = None):
+        self.job_id = uuid.uuid4().hex
+        self.seq = seq
+        self.payload = payload
+        self.key = key
+        self.status = self.QUEUED
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.batch_size: Optional[int] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+
+
+class ClassificationQueue:
+    """
+    Job queue in front of hazard classification.
+
+    submit() only enqueues and returns a job, so uploads never wait on the
+    model. Worker threads take the oldest job, then keep collecting until
+    they hold max_batch jobs or max_wait seconds have passed, and run one
+    `classify_batch` call for the whole micro-batch. `on_result` turns each
+    job's classification into its stored result (the saved hazard).
+    Finished jobs stay queryable until max_jobs newer ones have finished.
+    Jobs submitted with a key (e.g. the photo they classify) are collapsed:
+    while one job for a key is queued or running, submitting the same key
+    returns that job instead of classifying again.
+    """
+
+    def __init__(
+        self,
+        classify_batch: Callable[[List[Dict[str, Any]]], List[Any]],
+        on_result: Callable[[Dict[str, Any], Any], Any],
+        workers: int = 2,
+        max_batch: int = 16,
+        max_wait: float = 0.05,
+        max_pending: int = 1000,
+        max_jobs: int = 10000
+    ):
+        """
+        Args:
+            classify_batch: job payloads -> one classification (or Exception) per payload, in order
+            on_result: (payload, classification) -> job result; runs in the worker
+            workers: worker threads
+            max_batch: most jobs per classify_batch call
+            max_wait: seconds a worker waits for a batch to fill after its first job
+            max_pending: queued jobs beyond which submit() raises ClassificationQueueFull
+            max_jobs: finished jobs kept for status queries
+        """
+        self.classify_batch = classify_batch
+        self.on_result = on_result
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.max_jobs = max_jobs
+        self._queue: "queue.Queue[ClassificationJob]" = queue.Queue()
+        self._jobs: "OrderedDict[str, ClassificationJob]" = OrderedDict()
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        self._active: Dict[Any, ClassificationJob] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._seq = 0
+        self._dequeued_seq = 0
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self.rejected = 0
+        self.collapsed = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"classify-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, payload: Dict[str, Any], key: Any = None) -> ClassificationJob:
+        """
+        Enqueue a job and return it straight away; with a key that already has
+        a queued or running job, return that job instead.
+        """
+        self.start()
+        with self._lock:
+            active = self._active.get(key) if key is not None else None
+            if active is not None:
+                self.collapsed += 1
+                return active
+            if self._queue.qsize() >= self.max_pending:
+                self.rejected += 1
+                raise ClassificationQueueFull(f"{self._queue.qsize()} classification jobs already queued")
+            self._seq += 1
+            job = ClassificationJob(self._seq, payload, key)
+            self._jobs[job.job_id] = job
+            if key is not None:
+                self._active[key] = job
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[ClassificationJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """JSON-ready progress of a job, or None if it is unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = {
+                "job_id": job.job_id,
+                "status": job.status,
+                "submitted_at": job.submitted_at,
+                "started_at": job.started_at,
+                "finished_at": job.finished_at
+            }
+            if job.status == job.QUEUED:
+                status["queued_ahead"] = max(job.seq - self._dequeued_seq - 1, 0)
+            if job.batch_size is not None:
+                status["batch_size"] = job.batch_size
+            if job.status == job.DONE:
+                status["result"] = job.result
+            if job.error is not None:
+                status["error"] = job.error
+            return status
+
+    def _next_batch(self) -> List[ClassificationJob]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self) -> None:
+        while True:
+            batch = self._next_batch()
+            now = time.time()
+            with self._lock:
+                for job in batch:
+                    job.status, job.started_at, job.batch_size = job.RUNNING, now, len(batch)
+                    self._dequeued_seq = max(self._dequeued_seq, job.seq)
+                self.batches += 1
+            try:
+                results = self.classify_batch([job.payload for job in batch])
+            except Exception as e:
+                logger.error(f"Classification batch of {len(batch)} failed: {e}")
+                results = [e] * len(batch)
+            for job, classification in zip(batch, results):
+                if isinstance(classification, Exception):
+                    self._finish(job, error=str(classification))
+                    continue
+                try:
+                    self._finish(job, result=self.on_result(job.payload, classification))
+                except Exception as e:
+                    logger.error(f"Storing classification for job {job.job_id} failed: {e}")
+                    self._finish(job, error=str(e))
+
+    def _finish(self, job: ClassificationJob, result: Any = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            job.finished_at = time.time()
+            job.result, job.error = result, error
+            job.status = job.FAILED if error is not None else job.DONE
+            if job.key is not None and self._active.get(job.key) is job:
+                del self._active[job.key]
+            if error is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self._finished[job.job_id] = None
+            while len(self._finished) > self.max_jobs:
+                expired, _ = self._finished.popitem(last=False)
+                self._jobs.pop(expired, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "max_pending": self.max_pending,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "collapsed": self.collapsed
+        }
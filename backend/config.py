@@ -5,7 +5,72 @@ load_dotenv()
 
 # Configuration values
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+# Photo uploads are streamed to disk UPLOAD_CHUNK_SIZE bytes at a time and refused (413) beyond UPLOAD_MAX_BYTES
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+# Photos within PHOTO_NEAR_DUP_METERS whose perceptual hashes differ in at most PHOTO_NEAR_DUP_BITS bits (0 = off) are one hazard
+PHOTO_NEAR_DUP_METERS = float(os.getenv("PHOTO_NEAR_DUP_METERS", "15"))
+PHOTO_NEAR_DUP_BITS = int(os.getenv("PHOTO_NEAR_DUP_BITS", "10"))
+# Hazard classification queue: worker threads, micro-batch size and fill wait (s), queued jobs
+# before uploads get 503, and finished jobs kept for /jobs/{id}
+CLASSIFY_WORKERS = int(os.getenv("CLASSIFY_WORKERS", "2"))
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "16"))
+CLASSIFY_MAX_WAIT = float(os.getenv("CLASSIFY_MAX_WAIT", "0.05"))
+CLASSIFY_MAX_PENDING = int(os.getenv("CLASSIFY_MAX_PENDING", "1000"))
+CLASSIFY_MAX_JOBS = int(os.getenv("CLASSIFY_MAX_JOBS", "10000"))
 HAZARD_FILE = os.getenv("HAZARD_FILE", "sample_hazards.geojson")
+# Hazard storage: "geojson" (HAZARD_FILE + append-only log) or "sqlite" (HAZARD_DB, seeded from HAZARD_FILE)
+HAZARD_BACKEND = os.getenv("HAZARD_BACKEND", "geojson")
+HAZARD_DB = os.getenv("HAZARD_DB", "hazards.db")
+# Prebuilt graph artifact from `python -m routing.build_graph` (empty = built-in sample graph)
+GRAPH_FILE = os.getenv("GRAPH_FILE", "")
+# Routing engine: "networkx", "csr" (array-backed graph with A*) or "cch" (contraction
+# hierarchy, preprocessed by build_graph.py --cch or on first use)
+ROUTE_ENGINE = os.getenv("ROUTE_ENGINE", "networkx")
+# Route computation pool: ROUTE_WORKERS processes, each preloading the graph
+# (0 = a thread pool in the API process); beyond ROUTE_MAX_PENDING queued or
+# running requests /route answers 503
+ROUTE_WORKERS = int(os.getenv("ROUTE_WORKERS", "0"))
+ROUTE_MAX_PENDING = int(os.getenv("ROUTE_MAX_PENDING", "32"))
+# Largest number of routes accepted by one POST /route/batch
+ROUTE_BATCH_MAX = int(os.getenv("ROUTE_BATCH_MAX", "1000"))
+# Most alternative routes one /route request may ask for
+ROUTE_ALTERNATIVES_MAX = int(os.getenv("ROUTE_ALTERNATIVES_MAX", "3"))
+# Largest sources x targets product accepted by POST /route/matrix
+ROUTE_MATRIX_MAX = int(os.getenv("ROUTE_MATRIX_MAX", "250000"))
+# Live navigation sessions (/navigate): how many are kept, and seconds of inactivity before one expires
+NAVIGATION_MAX_SESSIONS = int(os.getenv("NAVIGATION_MAX_SESSIONS", "10000"))
+NAVIGATION_SESSION_TTL = float(os.getenv("NAVIGATION_SESSION_TTL", "1800"))
+# Longest travel time (minutes) and most thresholds one /isochrone request may ask for
+ISOCHRONE_MAX_MINUTES = float(os.getenv("ISOCHRONE_MAX_MINUTES", "60"))
+ISOCHRONE_MAX_THRESHOLDS = int(os.getenv("ISOCHRONE_MAX_THRESHOLDS", "8"))
+# Rendered /heatmap tiles kept in memory (dropped automatically when hazards change)
+HEATMAP_CACHE_SIZE = int(os.getenv("HEATMAP_CACHE_SIZE", "2048"))
+# OneMap proxy: upstream URL, timeout (s), response cache, and circuit breaker
+# (consecutive failures before failing fast to the local engine, seconds before retrying)
+ONEMAP_URL = os.getenv("ONEMAP_URL", "https://www.onemap.gov.sg/api/public/routingsvc/route")
+ONEMAP_TIMEOUT = float(os.getenv("ONEMAP_TIMEOUT", "5"))
+ONEMAP_CACHE_SIZE = int(os.getenv("ONEMAP_CACHE_SIZE", "1024"))
+ONEMAP_CACHE_TTL = float(os.getenv("ONEMAP_CACHE_TTL", "300"))
+ONEMAP_BREAKER_FAILURES = int(os.getenv("ONEMAP_BREAKER_FAILURES", "3"))
+ONEMAP_BREAKER_RESET = float(os.getenv("ONEMAP_BREAKER_RESET", "30"))
+# /ingest_iot: sample rate (Hz) and seconds buffered per device, rough-surface RMS vibration (g) and
+# sustained slope tilt (degrees) thresholds, radius (m) within which detections reinforce an existing
+# hazard, seconds before an idle device's buffer is reused, and largest accepted body
+IMU_RATE_HZ = float(os.getenv("IMU_RATE_HZ", "10"))
+IMU_WINDOW_SECONDS = float(os.getenv("IMU_WINDOW_SECONDS", "10"))
+IMU_VIBRATION_G = float(os.getenv("IMU_VIBRATION_G", "0.35"))
+IMU_TILT_DEGREES = float(os.getenv("IMU_TILT_DEGREES", "5"))
+IMU_MERGE_METERS = float(os.getenv("IMU_MERGE_METERS", "10"))
+IMU_DEVICE_TTL = float(os.getenv("IMU_DEVICE_TTL", "300"))
+IMU_MAX_BODY_BYTES = int(os.getenv("IMU_MAX_BODY_BYTES", str(4 * 1024 * 1024)))
+# Raw IMU traces: directory, samples per chunk file, seconds samples may stay buffered, zlib chunks
+# (smaller, but not memory-mapped on read), and most points one /traces request returns
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+TRACE_CHUNK_SAMPLES = int(os.getenv("TRACE_CHUNK_SAMPLES", "6000"))
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "60"))
+TRACE_COMPRESS = os.getenv("TRACE_COMPRESS", "false").lower() in ("1", "true", "yes")
+TRACE_MAX_POINTS = int(os.getenv("TRACE_MAX_POINTS", "100000"))
 CORS_ALLOW_ORIGINS = os.getenv("CORS_ALLOW_ORIGINS", "*").split(",")
 
 # Example for other thresholds
@@ -1,18 +1,27 @@
 import json
 import os
 
+from hazard_store import HazardStore
+
 DB_PATH = "data/hazard_data.geojson"
 
+_store = None
+
 def init_storage():
+    global _store
     os.makedirs("data", exist_ok=True)
     if not os.path.exists(DB_PATH):
         with open(DB_PATH, "w") as f:
             f.write(json.dumps({"type": "FeatureCollection", "features": []}))
+    _store = HazardStore(DB_PATH)
 
-def save_hazard(hazard_obj):
-    with open(DB_PATH, "r") as f:
-        data = json.load(f)
+def get_store():
+    """Hazard store behind DB_PATH (snapshot + append-only log)."""
+    if _store is None:
+        init_storage()
+    return _store
 
+def save_hazard(hazard_obj):
     feature = {
         "type": "Feature",
         "geometry": hazard_obj["geometry"],
@@ -25,7 +34,4 @@ def save_hazard(hazard_obj):
         }
     }
 
-    data["features"].append(feature)
-
-    with open(DB_PATH, "w") as f:
-        json.dump(data, f, indent=2)
+    get_store().add(feature)
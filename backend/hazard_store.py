@@ -0,0 +1,690 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class HazardStore:
+    """
+    Hazard storage engine: GeoJSON snapshot + append-only write-ahead log.
+
+    All reads are served from an in-memory id -> feature dict. Every write
+    appends one JSON line to the log (O(1)), and the log is folded into a fresh
+    snapshot every `compact_every` records. On startup the snapshot is loaded
+    and the log replayed, so a crash loses at most a half-written last line.
+    Log records are idempotent (add = upsert, delete of a missing id is a
+    no-op), which makes replaying over a newer snapshot harmless.
+
+    Other processes sharing the same files pick up new records with refresh(),
+    which only reads the part of the log appended since the last call.
+    """
+
+    def __init__(self, snapshot_path: str, log_path: Optional[str] = None, compact_every: int = 500, fsync: bool = False):
+        """
+        Args:
+            snapshot_path: GeoJSON FeatureCollection file holding the compacted state
+            log_path: write-ahead log file (defaults to snapshot_path + '.wal')
+            compact_every: fold the log into the snapshot after this many records (0 = never)
+            fsync: fsync the log after each write for durability across power loss
+        """
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path or snapshot_path + ".wal"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.version = 0
+        self._writer = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._features: Dict[str, Dict[str, Any]] = {}
+        self._listeners: List[Callable[[str, str, Optional[Dict[str, Any]]], None]] = []
+        self._log_offset = 0
+        self._log_records = 0
+        self._snapshot_stamp = None
+        self._loading = False
+        with self._locked():
+            # Under the file lock, so a record another process is appending is not mistaken for torn
+            self._truncate_torn_tail()
+        self._load()
+
+    # Reads
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def __contains__(self, hazard_id: str) -> bool:
+        return hazard_id in self._features
+
+    def get(self, hazard_id: str) -> Optional[Dict[str, Any]]:
+        return self._features.get(hazard_id)
+
+    def all(self) -> List[Dict[str, Any]]:
+        """All hazard features, oldest first."""
+        with self._lock:
+            return list(self._features.values())
+
+    def feature_collection(self) -> Dict[str, Any]:
+        """All hazards as a GeoJSON FeatureCollection."""
+        return {"type": "FeatureCollection", "features": self.all()}
+
+    def query(
+        self,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        since: Optional[str] = None,
+        hazard_type: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Filter hazards. The file backend scans memory; see SQLiteHazardStore for indexed queries.
+        Args:
+            bbox: (min_lng, min_lat, max_lng, max_lat), inclusive
+            since: ISO timestamp; keep hazards last seen at or after it
+            hazard_type: keep hazards with this properties['type']
+            limit: page size (None = everything)
+            cursor: next_cursor from the previous page
+        Returns:
+            (features, next_cursor); next_cursor is None on the last page
+        Raises:
+            ValueError: since is not an ISO timestamp, or cursor is not one we returned
+        """
+        since_dt = parse_since(since) if since else None
+        start = parse_cursor(cursor) if cursor else 0
+        matches = [f for f in self.all() if _matches(f, bbox, since_dt, hazard_type)]
+        if limit is None:
+            return matches[start:], None
+        page = matches[start:start + limit]
+        more = start + limit < len(matches)
+        return page, str(start + limit) if more else None
+
+    def next_id(self, prefix: str = "hazard") -> str:
+        """
+        A new hazard id, <prefix>_<uuid4 hex>. Random rather than counted, so
+        threads and worker processes never hand out the same id (add() would
+        then silently replace one hazard with the other).
+        """
+        return new_hazard_id(prefix)
+
+    # Writes
+
+    def add(self, feature: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Insert or replace a hazard feature. Its id is taken from properties['id'].
+        Returns:
+            The stored feature
+        """
+        hazard_id = feature["properties"]["id"]
+        self._write({"op": "add", "id": hazard_id, "feature": feature})
+        return feature
+
+    def update(self, hazard_id: str, properties: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Merge properties into an existing hazard.
+        Returns:
+            The updated feature, or None if the id is unknown
+        """
+        with self._lock:
+            if not self._write({"op": "update", "id": hazard_id, "properties": properties}):
+                return None
+            return self._features[hazard_id]
+
+    def delete(self, hazard_id: str) -> int:
+        """
+        Remove a hazard.
+        Returns:
+            Number of hazards removed (0 or 1)
+        """
+        return 1 if self._write({"op": "delete", "id": hazard_id}) else 0
+
+    def subscribe(self, callback: Callable[[str, str, Optional[Dict[str, Any]]], None]) -> None:
+        """
+        Register callback(op, hazard_id, feature) for every applied change.
+        op is 'add', 'update' or 'delete'; after a full reload it is 'reload'
+        with hazard_id and feature set to None. Callbacks run under the store lock
+        and must not block.
+        """
+        self._listeners.append(callback)
+
+    # Maintenance
+
+    def compact(self) -> None:
+        """Write the in-memory state as a new snapshot and truncate the log."""
+        with self._locked():
+            # Fold in anything other processes appended, so truncating the log loses nothing
+            self._replay(skip_own=True)
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.feature_collection(), f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            # A crash here leaves the old log next to the new snapshot; replaying it is idempotent
+            with open(self.log_path, "w"):
+                pass
+            self._snapshot_stamp = self._stat(self.snapshot_path)
+            self._log_offset = 0
+            self._log_records = 0
+            logger.info(f"Compacted hazard log into {self.snapshot_path} ({len(self._features)} hazards)")
+
+    def refresh(self) -> bool:
+        """
+        Pick up changes written by other processes. Cheap when nothing changed:
+        two stat() calls, then only the newly appended part of the log is read.
+        Returns:
+            True if anything changed
+        """
+        with self._lock:
+            if self._stat(self.snapshot_path) != self._snapshot_stamp:
+                # Someone else compacted (or replaced the snapshot): start over
+                self._load()
+                self._notify("reload", None, None)
+                return True
+            size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+            if size < self._log_offset:
+                self._load()
+                self._notify("reload", None, None)
+                return True
+            if size == self._log_offset:
+                return False
+            return self._replay(skip_own=True) > 0
+
+    # Internals
+
+    def _load(self) -> None:
+        self._loading = True
+        try:
+            self._load_files()
+        finally:
+            self._loading = False
+
+    def _load_files(self) -> None:
+        self._features = {}
+        self._log_offset = 0
+        self._log_records = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                data = json.load(f)
+            for i, feature in enumerate(data.get("features", [])):
+                props = feature.setdefault("properties", {})
+                if props.get("id") is None:
+                    props["id"] = f"hazard{i + 1}"
+                self._features[props["id"]] = feature
+        self._snapshot_stamp = self._stat(self.snapshot_path)
+        replayed = self._replay(skip_own=False)
+        self.version += 1
+        if replayed:
+            logger.info(f"Replayed {replayed} hazard log records from {self.log_path}")
+
+    def _truncate_torn_tail(self) -> None:
+        # A crash mid-append can leave a partial last line; drop it so new records start clean
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+                logger.warning(f"Dropped torn record at end of {self.log_path}")
+
+    def _replay(self, skip_own: bool) -> int:
+        if not os.path.exists(self.log_path):
+            return 0
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            chunk = f.read()
+        end = chunk.rfind(b"\n") + 1
+        applied = 0
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping unreadable hazard log record: {line[:80]!r}")
+                continue
+            if skip_own and record.get("w") == self._writer:
+                continue
+            self._log_records += 1
+            self._apply(record)
+            applied += 1
+        self._log_offset += end
+        return applied
+
+    def _write(self, record: Dict[str, Any]) -> bool:
+        """
+        Append a record and apply it. Returns False, writing nothing, for an
+        update or delete of an id that does not exist once other processes'
+        records are in.
+        """
+        record["w"] = self._writer
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._locked():
+            # Replay other processes' records first, so memory applies changes in log order
+            self.refresh()
+            if record["op"] != "add" and record["id"] not in self._features:
+                return False
+            fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # One write() per record, so concurrent appenders never interleave
+                os.write(fd, line)
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._apply(record)
+            self._log_records += 1
+            if self.compact_every and self._log_records >= self.compact_every:
+                self.compact()
+        return True
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None or self._lock_depth:
+                # Already holding the file lock (e.g. compact() from _write): flocking a
+                # second descriptor of the lock file would wait on ourselves
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with open(self.log_path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        op = record.get("op")
+        hazard_id = record.get("id")
+        if op == "add":
+            feature = record["feature"]
+            self._features.pop(hazard_id, None)
+            self._features[hazard_id] = feature
+        elif op == "update":
+            old = self._features.get(hazard_id)
+            if old is None:
+                return
+            # Copy rather than edit in place: readers may still hold the old feature
+            feature = dict(old, properties=dict(old["properties"], **record.get("properties", {})))
+            self._features[hazard_id] = feature
+        elif op == "delete":
+            if self._features.pop(hazard_id, None) is None:
+                return
+            feature = None
+        else:
+            logger.warning(f"Unknown hazard log op: {op}")
+            return
+        self.version += 1
+        self._notify(op, hazard_id, feature)
+
+    def _notify(self, op: str, hazard_id: Optional[str], feature: Optional[Dict[str, Any]]) -> None:
+        if self._loading:
+            return
+        for callback in self._listeners:
+            try:
+                callback(op, hazard_id, feature)
+            except Exception as e:
+                logger.error(f"Hazard store listener failed: {e}")
+
+    @staticmethod
+    def _stat(path: str):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class SQLiteHazardStore:
+    """
+    Hazard backend on the standard library's sqlite3, for city-scale hazard sets.
+
+    Uses WAL journaling so readers in other workers never block the writer, an
+    R*Tree virtual table on hazard coordinates for bounding-box queries, and
+    B-tree indexes on type and last_seen. Same interface as HazardStore; a
+    `changes` table carries the change feed between processes for refresh().
+    """
+
+    def __init__(self, db_path: str, seed_file: Optional[str] = None, keep_changes: int = 10000):
+        """
+        Args:
+            db_path: SQLite database file
+            seed_file: GeoJSON file imported when the database is empty (optional)
+            keep_changes: change-feed rows kept by compact()
+        """
+        self.db_path = db_path
+        self.keep_changes = keep_changes
+        self.version = 0
+        self._writer = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[str, str, Optional[Dict[str, Any]]], None]] = []
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        self._seen_change = self._conn.execute("SELECT COALESCE(MAX(version), 0) FROM changes").fetchone()[0]
+        if seed_file and len(self) == 0 and os.path.exists(seed_file):
+            with open(seed_file, "r") as f:
+                for feature in json.load(f).get("features", []):
+                    if feature.get("properties", {}).get("id") is not None:
+                        self.add(feature)
+
+    def _create_schema(self) -> None:
+        c = self._conn
+        c.execute("""CREATE TABLE IF NOT EXISTS hazards (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            type TEXT,
+            last_seen TEXT,
+            feature TEXT NOT NULL)""")
+        c.execute("CREATE INDEX IF NOT EXISTS hazards_type ON hazards(type, seq)")
+        c.execute("CREATE INDEX IF NOT EXISTS hazards_last_seen ON hazards(last_seen)")
+        c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS hazards_rtree USING rtree(seq, min_lng, max_lng, min_lat, max_lat)")
+        c.execute("""CREATE TABLE IF NOT EXISTS changes (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            op TEXT NOT NULL,
+            id TEXT NOT NULL,
+            writer TEXT NOT NULL)""")
+
+    # Reads
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM hazards").fetchone()[0]
+
+    def __contains__(self, hazard_id: str) -> bool:
+        return self.get(hazard_id) is not None
+
+    def get(self, hazard_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT feature FROM hazards WHERE id = ?", (hazard_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        """All hazard features, oldest first."""
+        return self.query()[0]
+
+    def feature_collection(self) -> Dict[str, Any]:
+        """All hazards as a GeoJSON FeatureCollection."""
+        return {"type": "FeatureCollection", "features": self.all()}
+
+    def query(
+        self,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        since: Optional[str] = None,
+        hazard_type: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Indexed hazard query; arguments and result as in HazardStore.query.
+        Pages are keyset-paginated on insertion order, so the cursor stays
+        valid while other requests add or delete hazards.
+        """
+        since_dt = parse_since(since) if since else None
+        seq = parse_cursor(cursor) if cursor else None
+        sql = "SELECT h.seq, h.feature FROM hazards h"
+        where = []
+        params: List[Any] = []
+        if bbox is not None:
+            sql += " JOIN hazards_rtree r ON r.seq = h.seq"
+            where.append("r.min_lng <= ? AND r.max_lng >= ? AND r.min_lat <= ? AND r.max_lat >= ?")
+            params += [bbox[2], bbox[0], bbox[3], bbox[1]]
+        if since_dt is not None:
+            where.append("h.last_seen >= ?")
+            params.append(_format_time(since_dt))
+        if hazard_type:
+            where.append("h.type = ?")
+            params.append(hazard_type)
+        if seq is not None:
+            where.append("h.seq > ?")
+            params.append(seq)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY h.seq"
+        if limit is not None:
+            # One extra row tells us whether there is another page
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = str(rows[-1][0])
+        return [json.loads(feature) for _, feature in rows], next_cursor
+
+    def next_id(self, prefix: str = "hazard") -> str:
+        """A new hazard id; see HazardStore.next_id."""
+        return new_hazard_id(prefix)
+
+    # Writes
+
+    def add(self, feature: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert or replace a hazard feature keyed on properties['id']."""
+        hazard_id = feature["properties"]["id"]
+        with self._lock, self._transaction():
+            self._delete_row(hazard_id)
+            self._insert_row(feature)
+            self._record("add", hazard_id)
+        self._notify("add", hazard_id, feature)
+        return feature
+
+    def update(self, hazard_id: str, properties: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Merge properties into an existing hazard; None if the id is unknown."""
+        with self._lock, self._transaction():
+            row = self._conn.execute("SELECT seq, feature FROM hazards WHERE id = ?", (hazard_id,)).fetchone()
+            if row is None:
+                return None
+            old = json.loads(row[1])
+            feature = dict(old, properties=dict(old["properties"], **properties))
+            props = feature["properties"]
+            self._conn.execute(
+                "UPDATE hazards SET type = ?, last_seen = ?, feature = ? WHERE seq = ?",
+                (props.get("type"), _normalize_time(_last_seen(props)), json.dumps(feature), row[0])
+            )
+            self._record("update", hazard_id)
+        self._notify("update", hazard_id, feature)
+        return feature
+
+    def delete(self, hazard_id: str) -> int:
+        """Remove a hazard. Returns the number removed (0 or 1)."""
+        with self._lock, self._transaction():
+            removed = self._delete_row(hazard_id)
+            if removed:
+                self._record("delete", hazard_id)
+        if removed:
+            self._notify("delete", hazard_id, None)
+        return removed
+
+    def subscribe(self, callback: Callable[[str, str, Optional[Dict[str, Any]]], None]) -> None:
+        """Register callback(op, hazard_id, feature); see HazardStore.subscribe."""
+        self._listeners.append(callback)
+
+    # Maintenance
+
+    def compact(self) -> None:
+        """Trim the change feed and checkpoint the WAL into the main database file."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM changes WHERE version <= (SELECT MAX(version) FROM changes) - ?",
+                (self.keep_changes,)
+            )
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def refresh(self) -> bool:
+        """
+        Replay changes other processes committed since the last call.
+        Returns:
+            True if anything changed
+        """
+        with self._lock:
+            oldest = self._conn.execute("SELECT MIN(version) FROM changes").fetchone()[0]
+            if oldest is not None and oldest > self._seen_change + 1:
+                # Fell behind a compaction: the feed no longer covers us
+                self._seen_change = self._conn.execute("SELECT MAX(version) FROM changes").fetchone()[0]
+                self.version += 1
+                self._notify("reload", None, None)
+                return True
+            rows = self._conn.execute(
+                "SELECT version, op, id, writer FROM changes WHERE version > ? ORDER BY version",
+                (self._seen_change,)
+            ).fetchall()
+        changed = False
+        for version, op, hazard_id, writer in rows:
+            self._seen_change = version
+            if writer == self._writer:
+                continue
+            self._notify(op, hazard_id, None if op == "delete" else self.get(hazard_id))
+            changed = True
+        return changed
+
+    # Internals
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _insert_row(self, feature: Dict[str, Any]) -> None:
+        props = feature["properties"]
+        lng, lat = feature["geometry"]["coordinates"][:2]
+        cur = self._conn.execute(
+            "INSERT INTO hazards (id, type, last_seen, feature) VALUES (?, ?, ?, ?)",
+            (props["id"], props.get("type"), _normalize_time(_last_seen(props)), json.dumps(feature))
+        )
+        self._conn.execute(
+            "INSERT INTO hazards_rtree (seq, min_lng, max_lng, min_lat, max_lat) VALUES (?, ?, ?, ?, ?)",
+            (cur.lastrowid, lng, lng, lat, lat)
+        )
+
+    def _delete_row(self, hazard_id: str) -> int:
+        row = self._conn.execute("SELECT seq FROM hazards WHERE id = ?", (hazard_id,)).fetchone()
+        if row is None:
+            return 0
+        self._conn.execute("DELETE FROM hazards_rtree WHERE seq = ?", (row[0],))
+        self._conn.execute("DELETE FROM hazards WHERE seq = ?", (row[0],))
+        return 1
+
+    def _record(self, op: str, hazard_id: str) -> None:
+        cur = self._conn.execute("INSERT INTO changes (op, id, writer) VALUES (?, ?, ?)", (op, hazard_id, self._writer))
+        if cur.lastrowid == self._seen_change + 1:
+            self._seen_change = cur.lastrowid
+        self.version += 1
+
+    def _notify(self, op: str, hazard_id: Optional[str], feature: Optional[Dict[str, Any]]) -> None:
+        for callback in self._listeners:
+            try:
+                callback(op, hazard_id, feature)
+            except Exception as e:
+                logger.error(f"Hazard store listener failed: {e}")
+
+
+def open_hazard_store(backend: str, hazard_file: str, db_path: Optional[str] = None):
+    """
+    Open the configured hazard backend.
+    Args:
+        backend: 'geojson' (default file + log store) or 'sqlite'
+        hazard_file: GeoJSON snapshot; seeds the SQLite database on first run
+        db_path: SQLite database file (defaults to hazard_file with a .db suffix)
+    Returns:
+        HazardStore or SQLiteHazardStore
+    """
+    if backend == "sqlite":
+        return SQLiteHazardStore(db_path or os.path.splitext(hazard_file)[0] + ".db", seed_file=hazard_file)
+    if backend != "geojson":
+        raise ValueError(f"Unknown hazard backend: {backend}")
+    return HazardStore(hazard_file)
+
+
+def _last_seen(props: Dict[str, Any]) -> Optional[str]:
+    return props.get("last_seen") or props.get("timestamp")
+
+
+def new_hazard_id(prefix: str = "hazard") -> str:
+    """Hazard id unique across threads and processes without coordination."""
+    return f"{prefix}_{uuid.uuid4().hex}"
+
+
+def parse_since(value: str) -> datetime.datetime:
+    """
+    A `since` query parameter as an aware UTC datetime.
+    Raises:
+        ValueError: not an ISO 8601 timestamp
+    """
+    dt = _parse_time(value)
+    if dt is None:
+        raise ValueError(f"Not an ISO timestamp: {value!r}")
+    return dt
+
+
+def parse_cursor(value: str) -> int:
+    """
+    A `cursor` query parameter (a next_cursor returned by query()) as an int.
+    Raises:
+        ValueError: not a non-negative integer
+    """
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        cursor = -1
+    if cursor < 0:
+        raise ValueError(f"Not a cursor returned by this API: {value!r}")
+    return cursor
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(datetime.timezone.utc)
+
+
+def _normalize_time(value: Optional[str]) -> Optional[str]:
+    # Fixed-width UTC strings compare correctly as text, which is what the index sees
+    dt = _parse_time(value)
+    return _format_time(dt) if dt else value
+
+
+def _format_time(dt: datetime.datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _matches(feature: Dict[str, Any], bbox, since_dt, hazard_type) -> bool:
+    props = feature.get("properties", {})
+    if hazard_type and props.get("type") != hazard_type:
+        return False
+    if bbox is not None:
+        lng, lat = feature["geometry"]["coordinates"][:2]
+        if not (bbox[0] <= lng <= bbox[2] and bbox[1] <= lat <= bbox[3]):
+            return False
+    if since_dt is not None:
+        seen = _parse_time(_last_seen(props))
+        if seen is None or seen < since_dt:
+            return False
+    return True
@@ -0,0 +1,396 @@
+import datetime
+import json
+import logging
+import math
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sample columns, in ring-buffer order. Accelerometer in g and gyroscope in
+# rad/s, as reported by expo-sensors (frontend/hooks/useSensorData.ts).
+CHANNELS = ("t", "ax", "ay", "az", "gx", "gy", "gz", "lat", "lng")
+T, AX, AY, AZ, GX, GY, GZ, LAT, LNG = range(len(CHANNELS))
+
+# Binary batch: b"IMU1", uint8 device id length, device id (UTF-8), uint32 sample
+# count, then the samples as little-endian records of this dtype. A body may hold
+# several batches back to back.
+BINARY_MAGIC = b"IMU1"
+SAMPLE_DTYPE = np.dtype([
+    ("t", "<f8"), ("ax", "<f4"), ("ay", "<f4"), ("az", "<f4"),
+    ("gx", "<f4"), ("gy", "<f4"), ("gz", "<f4"), ("lat", "<f8"), ("lng", "<f8")
+])
+
+ROUGH_SURFACE = "rough_surface"
+STEEP_SLOPE = "steep_slope"
+EVENT_TYPES = (ROUGH_SURFACE, STEEP_SLOPE)
+METERS_PER_DEGREE = 111320.0
+
+
+class ImuFormatError(ValueError):
+    """An /ingest_iot body could not be parsed."""
+
+
+def parse_batches(body: bytes, content_type: str = "") -> List[Tuple[str, np.ndarray]]:
+    """
+    Decode an /ingest_iot body into per-device sample arrays.
+    Accepts the binary format above (application/octet-stream), NDJSON with one
+    columnar batch per line (application/x-ndjson), or a single columnar JSON
+    batch: {"device_id": ..., "t": [...], "ax": [...], ..., "lat": ..., "lng": ...}.
+    Gyroscope columns are optional, and lat/lng may be a single fix for the batch.
+    Returns:
+        (device_id, float64 array of shape (n, len(CHANNELS))) per batch, sorted by time
+    Raises:
+        ImuFormatError: malformed body
+    """
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type == "application/octet-stream" or body.startswith(BINARY_MAGIC):
+        batches = _parse_binary(body)
+    elif content_type == "application/x-ndjson":
+        batches = [_parse_columns(_json(line)) for line in body.splitlines() if line.strip()]
+    else:
+        batches = [_parse_columns(_json(body))]
+    return [(device_id, samples[np.argsort(samples[:, T], kind="stable")]) for device_id, samples in batches if len(samples)]
+
+
+def encode_binary(device_id: str, samples: np.ndarray) -> bytes:
+    """One binary batch for `samples` (rows in CHANNELS order); the inverse of parse_batches."""
+    name = device_id.encode("utf-8")
+    records = np.empty(len(samples), dtype=SAMPLE_DTYPE)
+    for i, channel in enumerate(CHANNELS):
+        records[channel] = samples[:, i]
+    return BINARY_MAGIC + struct.pack("<B", len(name)) + name + struct.pack("<I", len(samples)) + records.tobytes()
+
+
+def _json(text: bytes) -> Dict[str, Any]:
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise ImuFormatError(f"Invalid JSON: {e}")
+    if not isinstance(data, dict):
+        raise ImuFormatError("Expected a JSON object per batch")
+    return data
+
+
+def _parse_columns(data: Dict[str, Any]) -> Tuple[str, np.ndarray]:
+    device_id = data.get("device_id")
+    if not device_id:
+        raise ImuFormatError("Missing device_id")
+    try:
+        t = np.asarray(data["t"], dtype=np.float64)
+        samples = np.zeros((len(t), len(CHANNELS)))
+        for i, channel in enumerate(CHANNELS):
+            if channel in data:
+                samples[:, i] = np.asarray(data[channel], dtype=np.float64)
+            elif channel in ("ax", "ay", "az", "lat", "lng"):
+                raise KeyError(channel)
+    except KeyError as e:
+        raise ImuFormatError(f"Missing column {e}")
+    except (TypeError, ValueError) as e:
+        raise ImuFormatError(f"Bad column in batch from {device_id}: {e}")
+    return str(device_id), samples
+
+
+def _parse_binary(body: bytes) -> List[Tuple[str, np.ndarray]]:
+    batches = []
+    view = memoryview(body)
+    offset = 0
+    while offset < len(body):
+        if bytes(view[offset:offset + 4]) != BINARY_MAGIC or offset + 5 > len(body):
+            raise ImuFormatError(f"Bad batch header at byte {offset}")
+        name_len = view[offset + 4]
+        start = offset + 5 + name_len
+        if start + 4 > len(body):
+            raise ImuFormatError(f"Truncated batch header at byte {offset}")
+        device_id = bytes(view[offset + 5:start]).decode("utf-8", errors="replace")
+        (count,) = struct.unpack_from("<I", body, start)
+        end = start + 4 + count * SAMPLE_DTYPE.itemsize
+        if end > len(body):
+            raise ImuFormatError(f"Truncated batch from {device_id}: expected {count} samples")
+        records = np.frombuffer(body, dtype=SAMPLE_DTYPE, count=count, offset=start + 4)
+        samples = np.empty((count, len(CHANNELS)))
+        for i, channel in enumerate(CHANNELS):
+            samples[:, i] = records[channel]
+        batches.append((device_id, samples))
+        offset = end
+    return batches
+
+
+def _rolling_mean(x: np.ndarray, k: int) -> np.ndarray:
+    """Trailing mean over k samples (fewer at the start)."""
+    c = np.cumsum(np.concatenate(([0.0], x)))
+    n = np.minimum(np.arange(1, len(x) + 1), k)
+    return (c[1:] - c[np.arange(1, len(x) + 1) - n]) / n
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """[start, end) index ranges of consecutive True values."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def detect_events(
+    samples: np.ndarray,
+    rate_hz: float = 10.0,
+    vibration_g: float = 0.35,
+    vibration_seconds: float = 1.0,
+    tilt_degrees: float = 5.0,
+    tilt_seconds: float = 3.0,
+    tilt_jitter_degrees: float = 2.0
+) -> List[Dict[str, Any]]:
+    """
+    Find rough surfaces and slopes in a window of samples, all in NumPy.
+
+    Rough surface: the RMS of acceleration magnitude around its trailing mean,
+    over vibration_seconds, exceeds vibration_g (gravity and slow motion cancel
+    out; kerbs, cobbles and broken paving do not).
+    Steep slope: the device's tilt from vertical, computed as in
+    useSensorData.ts (acos(az / |a|), for a device mounted level), averages at
+    least tilt_degrees over tilt_seconds while varying by less than
+    tilt_jitter_degrees and without vibration, so handling the phone does not count.
+    Returns:
+        events with type, start/end indices ([start, end)), peak and severity (0..1)
+    """
+    n = len(samples)
+    if n == 0:
+        return []
+    acc = samples[:, AX:AZ + 1]
+    magnitude = np.sqrt(np.einsum("ij,ij->i", acc, acc))
+    kv = max(int(round(rate_hz * vibration_seconds)), 1)
+    deviation = magnitude - _rolling_mean(magnitude, kv)
+    rms = np.sqrt(_rolling_mean(deviation * deviation, kv))
+    rough = rms > vibration_g
+
+    kt = max(int(round(rate_hz * tilt_seconds)), 1)
+    cos_tilt = np.divide(samples[:, AZ], magnitude, out=np.ones(n), where=magnitude > 0)
+    tilt = np.degrees(np.arccos(np.clip(cos_tilt, -1.0, 1.0)))
+    tilt_mean = _rolling_mean(tilt, kt)
+    tilt_std = np.sqrt(np.maximum(_rolling_mean(tilt * tilt, kt) - tilt_mean * tilt_mean, 0.0))
+    sloped = (tilt_mean >= tilt_degrees) & (tilt_std < tilt_jitter_degrees) & ~rough
+    sloped[:kt - 1] = False  # need a full window before calling it sustained
+
+    events = []
+    for start, end in _runs(rough):
+        peak = float(rms[start:end].max())
+        events.append({"type": ROUGH_SURFACE, "start": start, "end": end, "peak": peak,
+                       "severity": min(1.0, peak / (3 * vibration_g))})
+    for start, end in _runs(sloped):
+        # The run is flagged from the end of its first full window; the slope began there
+        start = max(start - kt + 1, 0)
+        peak = float(tilt_mean[start:end].max())
+        # ~5 degrees is the steepest ramp wheelchair guidelines allow; 15 is impassable
+        events.append({"type": STEEP_SLOPE, "start": start, "end": end, "peak": peak,
+                       "severity": min(1.0, peak / 15.0)})
+    return events
+
+
+class DeviceWindows:
+    """
+    Ring-buffered sample windows for many devices in one preallocated array.
+
+    Device i owns row i of a (capacity, window, channels) float64 array and
+    new samples are written with one fancy-indexed assignment, so ingesting a
+    batch allocates nothing per sample. Rows of devices idle for longer than
+    `ttl` seconds are reused; the array doubles when every row is in use.
+    """
+
+    def __init__(self, window: int = 100, capacity: int = 1024, ttl: float = 300.0, clock=time.monotonic):
+        self.window = window
+        self.ttl = ttl
+        self.clock = clock
+        self.slots: Dict[str, int] = {}
+        self.data = np.zeros((capacity, window, len(CHANNELS)))
+        self.written = np.zeros(capacity, dtype=np.int64)
+        self.last_seen = np.zeros(capacity)
+        # End time of the last event emitted per device and event type
+        self.emitted_until = np.full((capacity, len(EVENT_TYPES)), -np.inf)
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def slot(self, device_id: str) -> int:
+        slot = self.slots.get(device_id)
+        if slot is None:
+            if not self._free:
+                self._reclaim()
+            slot = self._free.pop()
+            self.slots[device_id] = slot
+            self.written[slot] = 0
+            self.emitted_until[slot] = -np.inf
+        self.last_seen[slot] = self.clock()
+        return slot
+
+    def append(self, device_id: str, samples: np.ndarray) -> int:
+        """Write samples into the device's ring; returns its slot."""
+        slot = self.slot(device_id)
+        samples = samples[-self.window:]
+        index = (self.written[slot] + np.arange(len(samples))) % self.window
+        self.data[slot, index] = samples
+        self.written[slot] += len(samples)
+        return slot
+
+    def samples(self, slot: int) -> np.ndarray:
+        """The device's buffered samples, oldest first."""
+        count = min(int(self.written[slot]), self.window)
+        index = (self.written[slot] - count + np.arange(count)) % self.window
+        return self.data[slot, index]
+
+    def _reclaim(self) -> None:
+        idle_before = self.clock() - self.ttl
+        for device_id, slot in list(self.slots.items()):
+            if self.last_seen[slot] < idle_before:
+                del self.slots[device_id]
+                self._free.append(slot)
+        if self._free:
+            return
+        capacity = len(self.written)
+        self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+        self.written = np.concatenate([self.written, np.zeros_like(self.written)])
+        self.last_seen = np.concatenate([self.last_seen, np.zeros_like(self.last_seen)])
+        self.emitted_until = np.concatenate([self.emitted_until, np.full_like(self.emitted_until, -np.inf)])
+        self._free = list(range(2 * capacity - 1, capacity - 1, -1))
+
+
+class ImuPipeline:
+    """
+    /ingest_iot: decode sample batches, buffer them per device, detect rough
+    surfaces and slopes, and turn them into hazard candidates in the hazard store.
+
+    An event is emitted once it has ended (or fills the whole window), at the
+    mean position of its samples. A candidate within merge_meters of an
+    existing hazard of the same type reinforces that hazard (reports,
+    confidence, last_seen) instead of adding another.
+    """
+
+    def __init__(
+        self,
+        hazard_store=None,
+        trace_store=None,
+        rate_hz: float = 10.0,
+        window_seconds: float = 10.0,
+        vibration_g: float = 0.35,
+        tilt_degrees: float = 5.0,
+        merge_meters: float = 10.0,
+        device_ttl: float = 300.0
+    ):
+        """
+        Args:
+            hazard_store: HazardStore/SQLiteHazardStore receiving candidates (None = detect only)
+            trace_store: TraceStore keeping the raw samples for reprocessing (optional)
+            rate_hz: expected sample rate
+            window_seconds: samples kept per device for detection
+            vibration_g: RMS vibration that marks a rough surface
+            tilt_degrees: sustained tilt that marks a slope
+            merge_meters: distance within which a candidate reinforces an existing hazard
+            device_ttl: seconds after which an idle device's window may be reused
+        """
+        self.hazard_store = hazard_store
+        self.trace_store = trace_store
+        self.rate_hz = rate_hz
+        self.vibration_g = vibration_g
+        self.tilt_degrees = tilt_degrees
+        self.merge_meters = merge_meters
+        self.windows = DeviceWindows(max(int(rate_hz * window_seconds), 1), ttl=device_ttl)
+        self._lock = threading.Lock()
+        self.samples_ingested = 0
+        self.candidates_emitted = 0
+
+    def ingest(self, body: bytes, content_type: str = "") -> Dict[str, Any]:
+        """
+        Process one /ingest_iot body.
+        Returns:
+            counts of devices and samples, and the hazard candidates emitted
+        Raises:
+            ImuFormatError: malformed body
+        """
+        batches = parse_batches(body, content_type)
+        candidates = []
+        with self._lock:
+            for device_id, samples in batches:
+                candidates += self._ingest_device(device_id, samples)
+            self.samples_ingested += sum(len(s) for _, s in batches)
+        if self.trace_store is not None:
+            for device_id, samples in batches:
+                self.trace_store.append(device_id, samples)
+        hazards = [self._store(c) for c in candidates]
+        self.candidates_emitted += len(hazards)
+        return {
+            "status": "iot data received",
+            "devices": len({d for d, _ in batches}),
+            "samples": sum(len(s) for _, s in batches),
+            "candidates": hazards
+        }
+
+    def _ingest_device(self, device_id: str, samples: np.ndarray) -> List[Dict[str, Any]]:
+        slot = self.windows.append(device_id, samples)
+        window = self.windows.samples(slot)
+        candidates = []
+        for event in detect_events(window, self.rate_hz, vibration_g=self.vibration_g, tilt_degrees=self.tilt_degrees):
+            kind = EVENT_TYPES.index(event["type"])
+            start, end = event["start"], event["end"]
+            # Wait for events still running at the newest sample, unless they fill the whole window
+            still_open = end == len(window) and not (start == 0 and len(window) == self.windows.window)
+            if still_open or window[start, T] <= self.windows.emitted_until[slot, kind]:
+                continue
+            located = window[start:end][~np.isnan(window[start:end, LAT]) & (window[start:end, LAT] != 0)]
+            if not len(located):
+                continue
+            self.windows.emitted_until[slot, kind] = window[end - 1, T]
+            candidates.append({
+                "type": event["type"],
+                "lat": float(located[:, LAT].mean()),
+                "lng": float(located[:, LNG].mean()),
+                "severity": round(event["severity"], 3),
+                "peak": round(event["peak"], 3),
+                "duration": float(window[end - 1, T] - window[start, T]),
+                "device_id": device_id
+            })
+        return candidates
+
+    def _store(self, candidate: Dict[str, Any]) -> Dict[str, Any]:
+        """Add the candidate to the hazard store, or reinforce a nearby hazard of the same type."""
+        if self.hazard_store is None:
+            return candidate
+        now = datetime.datetime.now(datetime.UTC).isoformat()
+        dlat = self.merge_meters / METERS_PER_DEGREE
+        dlng = dlat / max(math.cos(math.radians(candidate["lat"])), 1e-6)
+        box = (candidate["lng"] - dlng, candidate["lat"] - dlat, candidate["lng"] + dlng, candidate["lat"] + dlat)
+        nearby, _ = self.hazard_store.query(bbox=box, hazard_type=candidate["type"], limit=1)
+        if nearby:
+            props = nearby[0]["properties"]
+            reports = props.get("reports", 1) + 1
+            self.hazard_store.update(props["id"], {
+                "reports": reports,
+                "last_seen": now,
+                "severity": max(props.get("severity", 0.0), candidate["severity"]),
+                "confidence": round(min(0.95, props.get("confidence", 0.5) + 0.1), 2)
+            })
+            return {**candidate, "hazard_id": props["id"], "merged": True}
+        hazard_id = self.hazard_store.next_id("imu")
+        self.hazard_store.add({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [candidate["lng"], candidate["lat"]]},
+            "properties": {
+                "id": hazard_id,
+                "type": candidate["type"],
+                "severity": candidate["severity"],
+                # One sensor trace is weak evidence; repeated reports raise it
+                "confidence": 0.5,
+                "last_seen": now,
+                "source": "imu",
+                "reports": 1
+            }
+        })
+        return {**candidate, "hazard_id": hazard_id, "merged": False}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "devices": len(self.windows),
+            "samples": self.samples_ingested,
+            "candidates": self.candidates_emitted
+        }
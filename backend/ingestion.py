@@ -1,16 +1,58 @@
 import os
 import uuid
-from ai_stub import classify_hazard
-from io_utils import save_image
+from ai_stub import classify_hazards
+from classification import ClassificationQueue
+from photo_store import get_photo_store
+from db import get_store, save_hazard
 from datetime import datetime
+from config import CLASSIFY_WORKERS, CLASSIFY_BATCH_SIZE, CLASSIFY_MAX_WAIT, CLASSIFY_MAX_PENDING, CLASSIFY_MAX_JOBS
 import json
 
+_queue = None
+
 async def process_submission(upload_file, lat, lon, device_id):
-    # Step 1: Save image locally
-    file_path = save_image(upload_file)
+    """
+    Store the photo and queue it for classification.
+    Returns the queued job ({"job_id", "status", "photo_id"}), or, for a
+    duplicate of a photo that is already a hazard, that hazard with "duplicate" set.
+    A duplicate of a photo still waiting for classification gets that photo's job.
+    Raises ClassificationQueueFull when too many jobs are waiting.
+    """
+    # Step 1: Store image by content hash; retries and re-shots of a known hazard are not classified again
+    photo = await get_photo_store().put(upload_file, lat, lon)
+    if photo.duplicate and photo.hazard_id:
+        return {
+            "id": photo.hazard_id,
+            "duplicate": photo.duplicate,
+            "photo_id": photo.photo_id,
+            "duplicate_of": photo.duplicate_of,
+            "feature": get_store().get(photo.hazard_id)
+        }
+
+    # Step 2: Queue for batched AI hazard classification; a worker saves the hazard (see store_classification).
+    # Keyed on the original photo, so duplicates arriving before it is classified share its job
+    original = photo.duplicate_of or photo.photo_id
+    job = get_classification_queue().submit({
+        "image_path": photo.path,
+        "photo_id": original,
+        "lat": lat,
+        "lon": lon,
+        "device_id_hash": hash(device_id)
+    }, key=original)
+    return {"job_id": job.job_id, "status": job.status, "photo_id": photo.photo_id}
 
-    # Step 2: Get AI hazard classification
-    label, confidence = classify_hazard(file_path)
+def classify_batch(payloads):
+    return classify_hazards([p["image_path"] for p in payloads])
+
+def store_classification(payload, classification):
+    """Runs in a classification worker: turn one result into a hazard and save it."""
+    label, confidence = classification
+    photo = get_photo_store().get(payload["photo_id"])
+    if photo is not None and photo.hazard_id:
+        # A duplicate queued just after the original's job finished: reuse its hazard
+        existing = get_store().get(photo.hazard_id)
+        if existing is not None:
+            return {"id": photo.hazard_id, "feature": existing}
 
     # Step 3: Prepare hazard object
     hazard = {
@@ -18,19 +60,34 @@ async def process_submission(upload_file, lat, lon, device_id):
         "type": label,
         "confidence": confidence,
         "timestamp": datetime.utcnow().isoformat(),
-        "device_id_hash": hash(device_id),
+        "device_id_hash": payload["device_id_hash"],
         "geometry": {
             "type": "Point",
-            "coordinates": [lon, lat]
+            "coordinates": [payload["lon"], payload["lat"]]
         },
         "properties": {
-            "image_path": file_path,
+            "image_path": payload["image_path"],
+            "photo_id": payload["photo_id"],
             "severity": estimate_severity(label, confidence),
         }
     }
 
+    # Step 4: Save it, and remember it for later duplicates of the photo
+    save_hazard(hazard)
+    get_photo_store().link_hazard(payload["photo_id"], hazard["id"])
     return hazard
 
+def get_classification_queue():
+    """Process-wide classification queue; workers start with the first job."""
+    global _queue
+    if _queue is None:
+        _queue = ClassificationQueue(
+            classify_batch, store_classification,
+            workers=CLASSIFY_WORKERS, max_batch=CLASSIFY_BATCH_SIZE, max_wait=CLASSIFY_MAX_WAIT,
+            max_pending=CLASSIFY_MAX_PENDING, max_jobs=CLASSIFY_MAX_JOBS
+        )
+    return _queue
+
 def estimate_severity(label, confidence):
     """Simple rules for MVP."""
     if confidence < 0.5:
@@ -40,6 +97,7 @@ def estimate_severity(label, confidence):
     return "medium"
 
 def get_all_hazards():
-    """Read from hazard_data.geojson"""
-    with open("data/hazard_data.geojson", "r") as f:
-        return json.load(f)
+    """Read from the hazard_data.geojson store (in memory, refreshed from its log)"""
+    store = get_store()
+    store.refresh()
+    return store.feature_collection()
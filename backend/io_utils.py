@@ -1,14 +1,157 @@
+import hashlib
+import logging
 import os
 import uuid
+from dataclasses import dataclass
+from typing import Dict, Optional
 
-UPLOAD_FOLDER = "uploads"
+import aiofiles
+import aiofiles.os
+from starlette.responses import JSONResponse
 
-def save_image(file):
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    fname = f"{uuid.uuid4()}_{file.filename}"
-    file_path = os.path.join(UPLOAD_FOLDER, fname)
+from config import UPLOAD_DIR, UPLOAD_CHUNK_SIZE, UPLOAD_MAX_BYTES
 
-    with open(file_path, "wb") as f:
-        f.write(file.file.read())
+logger = logging.getLogger(__name__)
 
-    return file_path
+UPLOAD_FOLDER = UPLOAD_DIR
+
+# Room for the other multipart fields and part headers next to the file
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+# Leading bytes of the image formats accepted by /submit_photo and /upload
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+)
+
+
+class UploadRejected(Exception):
+    """An upload was refused (too large, not an image); carries the API error body and status code."""
+
+    def __init__(self, error: str, details: str, status_code: int):
+        super().__init__(f"{error}: {details}")
+        self.error = error
+        self.details = details
+        self.status_code = status_code
+
+
+class BodySizeLimit:
+    """
+    ASGI middleware refusing request bodies by their declared Content-Length.
+    Starlette reads a whole multipart body (spooling it to a temporary file)
+    before the handler runs, so the limit stream_upload enforces only bounds
+    what is kept. Checking the header first means an oversized upload is
+    answered 413 before any of it is received. Bodies sent without a
+    Content-Length (chunked) are not checked here.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        """
+        Args:
+            app: ASGI application to wrap
+            limits: request path -> largest accepted Content-Length in bytes
+        """
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is not None:
+            length = dict(scope.get("headers") or []).get(b"content-length")
+            if length is not None and (not length.isdigit() or int(length) > limit):
+                response = JSONResponse(
+                    {"error": "Request too large", "details": f"Request bodies for this endpoint are limited to {limit} bytes"},
+                    status_code=413
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+@dataclass
+class SavedUpload:
+    """Where an upload was written, and what was learned while streaming it."""
+    path: str
+    size: int
+    sha256: str
+    content_type: str
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Content type from an upload's first bytes, or None if it is not a JPEG or PNG."""
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Client filename without any directory part, so it cannot escape the upload folder."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    return name or "upload"
+
+
+async def stream_upload(
+    file,
+    dest_dir: str = UPLOAD_FOLDER,
+    name: Optional[str] = None,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> SavedUpload:
+    """
+    Stream an UploadFile to disk in fixed-size chunks.
+    Chunks are read and written through worker threads, so the event loop never
+    blocks on disk I/O and at most one chunk of the photo is held in memory. The
+    SHA-256 is computed while streaming, the content type is sniffed from the
+    first chunk, and the size limit is checked after every chunk.
+    Args:
+        file: Starlette/FastAPI UploadFile
+        dest_dir: directory to write into
+        name: final file name (default "{uuid}_{filename}")
+        max_bytes: largest accepted upload
+        chunk_size: bytes per read/write
+    Returns:
+        SavedUpload with the final path, size, hex SHA-256 and content type
+    Raises:
+        UploadRejected: the upload is not a JPEG/PNG (415) or exceeds max_bytes (413);
+            nothing is left on disk
+    """
+    await aiofiles.os.makedirs(dest_dir, exist_ok=True)
+    name = name or f"{uuid.uuid4()}_{safe_filename(file.filename)}"
+    path = os.path.join(dest_dir, name)
+    # Written under a temporary name so a rejected or torn upload is never visible
+    tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    content_type = None
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                if content_type is None:
+                    content_type = sniff_image_type(chunk)
+                    if content_type is None:
+                        raise UploadRejected("Unsupported file type", "Only JPEG and PNG images are accepted", 415)
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected("File too large", f"Uploads are limited to {max_bytes} bytes", 413)
+                digest.update(chunk)
+                await out.write(chunk)
+        if content_type is None:
+            raise UploadRejected("Empty file", "The upload contained no data", 400)
+        await aiofiles.os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    logger.info(f"Upload saved: {path} ({size} bytes, {content_type})")
+    return SavedUpload(path=path, size=size, sha256=digest.hexdigest(), content_type=content_type)
+
+
+async def save_image(file) -> str:
+    """Stream an uploaded image into UPLOAD_FOLDER and return its path."""
+    return (await stream_upload(file)).path
@@ -1,17 +1,16 @@
 
-from fastapi import FastAPI, UploadFile, File, Form, Body
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Body, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, Field
-import httpx
 
-import uuid
 import os
 import logging
 import json
-import aiofiles
 import datetime
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 # Load environment variables first
@@ -19,7 +18,24 @@ load_dotenv()
 
 from routing import engine
 from routing import features
-from config import UPLOAD_DIR, HAZARD_FILE, CORS_ALLOW_ORIGINS, PROXIMITY_THRESHOLD
+from routing.graph_store import GraphStore
+from routing.heatmap import AccessibilityHeatmap
+from routing.replan import NavigationSessions
+from hazard_store import open_hazard_store, parse_cursor, parse_since
+from imu import ImuFormatError, ImuPipeline
+from io_utils import FORM_OVERHEAD_BYTES, BodySizeLimit, UploadRejected
+from trace_store import TraceStore
+from photo_store import PhotoStore
+from route_executor import RouteError, RouteExecutor, RouteExecutorSaturated, compute_isochrones, start_navigation, update_navigation
+from onemap import CircuitBreaker, OneMapClient, OneMapError, OneMapUnavailable, encode_polyline, parse_latlng
+from config import (
+    UPLOAD_DIR, UPLOAD_MAX_BYTES, HAZARD_FILE, HAZARD_BACKEND, HAZARD_DB, GRAPH_FILE, ROUTE_ENGINE, CORS_ALLOW_ORIGINS, PROXIMITY_THRESHOLD,
+    ROUTE_WORKERS, ROUTE_MAX_PENDING, ROUTE_BATCH_MAX, ROUTE_MATRIX_MAX, ROUTE_ALTERNATIVES_MAX,
+    NAVIGATION_MAX_SESSIONS, NAVIGATION_SESSION_TTL, HEATMAP_CACHE_SIZE, ISOCHRONE_MAX_MINUTES, ISOCHRONE_MAX_THRESHOLDS,
+    ONEMAP_URL, ONEMAP_TIMEOUT, ONEMAP_CACHE_SIZE, ONEMAP_CACHE_TTL, ONEMAP_BREAKER_FAILURES, ONEMAP_BREAKER_RESET,
+    IMU_RATE_HZ, IMU_WINDOW_SECONDS, IMU_VIBRATION_G, IMU_TILT_DEGREES, IMU_MERGE_METERS, IMU_DEVICE_TTL, IMU_MAX_BODY_BYTES,
+    TRACE_DIR, TRACE_CHUNK_SAMPLES, TRACE_FLUSH_SECONDS, TRACE_COMPRESS, TRACE_MAX_POINTS
+)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger(__name__)
@@ -30,7 +46,20 @@ if os.getenv("ONEMAP_API_KEY"):
 else:
     logger.warning("ONEMAP_API_KEY not found - will use fallback routes")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled OneMap connection pool for the life of the process
+    await onemap_client.start()
+    await route_executor.warm_up()
+    trace_store.start()
+    yield
+    await onemap_client.aclose()
+    route_executor.shutdown()
+    # Writes out buffered samples and pending rollups
+    trace_store.stop()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="CloudElites Routing API",
     description="Accessible routing, hazard ingestion, and extensible data integration for hackathon/demo.",
     version="1.0.0",
@@ -51,10 +80,60 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Refuse oversized uploads from Content-Length, before Starlette spools the multipart body
+app.add_middleware(BodySizeLimit, limits={"/submit_photo": UPLOAD_MAX_BYTES + FORM_OVERHEAD_BYTES})
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Photos are stored once per content hash under UPLOAD_DIR, with near-duplicate detection
+photo_store = PhotoStore(UPLOAD_DIR, max_bytes=UPLOAD_MAX_BYTES)
+
+# Hazards live in memory, backed by HAZARD_FILE plus an append-only log next to it
+# (or in SQLite when HAZARD_BACKEND=sqlite)
+hazard_store = open_hazard_store(HAZARD_BACKEND, HAZARD_FILE, HAZARD_DB)
+# Routing graph is built once per process and shared by all /route calls; with
+# GRAPH_FILE set it comes from a memory-mapped artifact (python -m routing.build_graph)
+graph_store = GraphStore(hazard_store, loader=lambda: engine.load_graph(GRAPH_FILE), proximity_threshold=PROXIMITY_THRESHOLD)
+# Live navigations keep incremental planners on graph_store's graph; hazard changes
+# repair the sessions whose route they touch
+navigation_sessions = NavigationSessions(NAVIGATION_MAX_SESSIONS, NAVIGATION_SESSION_TTL)
+graph_store.subscribe(navigation_sessions.edges_changed)
+# Accessibility heatmap tiles over graph_store's graph, cached per hazard epoch
+accessibility_heatmap = AccessibilityHeatmap(HEATMAP_CACHE_SIZE)
+# /route runs in this pool, off the event loop, with a cap on queued work
+route_executor = RouteExecutor(
+    {
+        "hazard_backend": HAZARD_BACKEND, "hazard_file": HAZARD_FILE, "hazard_db": HAZARD_DB,
+        "graph_file": GRAPH_FILE, "route_engine": ROUTE_ENGINE, "proximity_threshold": PROXIMITY_THRESHOLD
+    },
+    workers=ROUTE_WORKERS,
+    max_pending=ROUTE_MAX_PENDING,
+    store=graph_store
+)
+# Raw IMU traces, kept as columnar chunk files with 1s/1min rollups
+trace_store = TraceStore(TRACE_DIR, chunk_samples=TRACE_CHUNK_SAMPLES, flush_seconds=TRACE_FLUSH_SECONDS, compress=TRACE_COMPRESS)
+# IMU streams: per-device ring buffers, vectorised detection, candidates written to hazard_store
+imu_pipeline = ImuPipeline(
+    hazard_store,
+    trace_store,
+    rate_hz=IMU_RATE_HZ,
+    window_seconds=IMU_WINDOW_SECONDS,
+    vibration_g=IMU_VIBRATION_G,
+    tilt_degrees=IMU_TILT_DEGREES,
+    merge_meters=IMU_MERGE_METERS,
+    device_ttl=IMU_DEVICE_TTL
+)
+# OneMap proxy client: pooled, cached, coalesced, and falls back to the local engine when OneMap struggles
+onemap_client = OneMapClient(
+    ONEMAP_URL,
+    api_key=os.getenv("ONEMAP_API_KEY"),
+    timeout=ONEMAP_TIMEOUT,
+    cache_size=ONEMAP_CACHE_SIZE,
+    cache_ttl=ONEMAP_CACHE_TTL,
+    breaker=CircuitBreaker(ONEMAP_BREAKER_FAILURES, ONEMAP_BREAKER_RESET)
+)
+
 class HazardRequest(BaseModel):
     lng: float = Field(..., json_schema_extra={"example": 103.851959})
     lat: float = Field(..., json_schema_extra={"example": 1.290270})
@@ -83,13 +162,8 @@ class HazardResponse(BaseModel):
 )
 async def add_hazard(req: HazardRequest):
     logger.info(f"Received add_hazard request: {req}")
-    try:
-        async with aiofiles.open("sample_hazards.geojson", "r") as f:
-                geojson = json.loads(await f.read())
-    except Exception as e:
-        logger.error(f"Error reading hazards file: {e}")
-        return JSONResponse({"error": "Failed to read hazards file", "details": str(e)}, status_code=500)
-    new_id = req.hazard_id or f"hazard{len(geojson['features'])+1}"
+    # Random ids: two workers (or the classification and IMU threads) never pick the same one
+    new_id = req.hazard_id or hazard_store.next_id()
     feature = {
         "type": "Feature",
         "geometry": {"type": "Point", "coordinates": [req.lng, req.lat]},
@@ -101,10 +175,9 @@ async def add_hazard(req: HazardRequest):
             "last_seen": req.last_seen or datetime.datetime.now(datetime.UTC).isoformat()
         }
     }
-    geojson['features'].append(feature)
     try:
-        async with aiofiles.open("sample_hazards.geojson", "w") as f:
-                await f.write(json.dumps(geojson, indent=2))
+        # Log appends fsync and wait on the file lock, and every few hundred compact: keep them off the event loop
+        await run_in_threadpool(hazard_store.add, feature)
     except Exception as e:
         logger.error(f"Error writing hazards file: {e}")
         return JSONResponse({"error": "Failed to write hazards file", "details": str(e)}, status_code=500)
@@ -123,40 +196,18 @@ async def get_onemap_route(
     routeType: str = "walk"
 ):
     logger.info(f"Proxying OneMap route request: {start} -> {end}, type={routeType}")
-    
-    url = "https://www.onemap.gov.sg/api/public/routingsvc/route"
-    params = {
-        "start": start,
-        "end": end,
-        "routeType": routeType
-    }
-    
-    # Note: OneMap API authentication
-    # Try adding API key as both header and query parameter
-    headers = {}
-    onemap_api_key = os.getenv("ONEMAP_API_KEY")
-    if onemap_api_key:
-        # Add as query parameter (common pattern for public APIs)
-        params["token"] = onemap_api_key
-        # Also try as header
-        headers["Authorization"] = f"Bearer {onemap_api_key}"
-        headers["X-API-Key"] = onemap_api_key
-        logger.info("Using OneMap API key for authentication")
-    else:
-        logger.warning("No ONEMAP_API_KEY found in environment - API may fail with 401")
-    
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, params=params, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            logger.info(f"OneMap route fetched successfully: {len(data.get('route_geometry', ''))} chars")
-            return data
-    except httpx.HTTPStatusError as e:
-        logger.error(f"OneMap API error: {e.response.status_code} - {e.response.text}")
-        
+        start_point, end_point = parse_latlng(start), parse_latlng(end)
+    except ValueError as e:
+        return JSONResponse({"error": "Invalid coordinates, expected 'lat,lng'", "details": str(e)}, status_code=400)
+    try:
+        data = await onemap_client.route(start_point, end_point, routeType)
+        logger.info(f"OneMap route fetched: {len(data.get('route_geometry', ''))} chars")
+        return data
+    except OneMapError as e:
+        logger.error(f"OneMap API error: {e.status_code} - {e.details}")
         # If 401, provide helpful message
-        if e.response.status_code == 401:
+        if e.status_code == 401:
             return JSONResponse(
                 {
                     "error": "OneMap API authentication required", 
@@ -165,17 +216,40 @@ async def get_onemap_route(
                 },
                 status_code=401
             )
-        
         return JSONResponse(
-            {"error": "OneMap API request failed", "details": str(e)},
-            status_code=e.response.status_code
+            {"error": "OneMap API request failed", "details": e.details},
+            status_code=e.status_code
         )
-    except Exception as e:
-        logger.error(f"Error fetching OneMap route: {e}")
+    except OneMapUnavailable as e:
+        logger.warning(f"OneMap unavailable, using local engine: {e}")
+    # Same bounded pool and backpressure as /route, off the event loop
+    try:
+        body = await route_executor.run({
+            "from_lat": start_point[0], "from_lng": start_point[1],
+            "to_lat": end_point[0], "to_lng": end_point[1], "profile": "safest"
+        })
+    except RouteExecutorSaturated as e:
+        logger.warning(f"Route pool saturated: {e}")
+        return JSONResponse({"error": "Routing is at capacity, retry shortly", "details": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    except RouteError as e:
+        logger.error(f"Error computing local fallback route: {e}")
         return JSONResponse(
-            {"error": "Failed to fetch route", "details": str(e)},
-            status_code=500
+            {"error": "Failed to fetch route", "details": e.details},
+            status_code=503
         )
+    return local_onemap_route(start_point, end_point, body)
+
+def local_onemap_route(start: tuple, end: tuple, body: dict) -> dict:
+    """
+    Shape a local /route response like a OneMap response (encoded
+    route_geometry) so clients of /route/onemap keep working.
+    """
+    points = [tuple(start)] + [(p["lat"], p["lng"]) for p in body["route"]] + [tuple(end)]
+    return {
+        "status_message": "Found route between points (local engine, OneMap unavailable)",
+        "route_geometry": encode_polyline(points),
+        "source": "local"
+    }
 
 @app.delete(
     "/hazards/{hazard_id}",
@@ -187,27 +261,19 @@ async def get_onemap_route(
 async def delete_hazard(hazard_id: str):
     logger.info(f"Received delete_hazard request: {hazard_id}")
     try:
-        async with aiofiles.open("sample_hazards.geojson", "r") as f:
-                geojson = json.loads(await f.read())
-    except Exception as e:
-        logger.error(f"Error reading hazards file: {e}")
-        return JSONResponse({"error": "Failed to read hazards file", "details": str(e)}, status_code=500)
-    before = len(geojson['features'])
-    geojson['features'] = [f for f in geojson['features'] if f['properties']['id'] != hazard_id]
-    after = len(geojson['features'])
-    try:
-        async with aiofiles.open("sample_hazards.geojson", "w") as f:
-                await f.write(json.dumps(geojson, indent=2))
+        removed = await run_in_threadpool(hazard_store.delete, hazard_id)
     except Exception as e:
         logger.error(f"Error writing hazards file: {e}")
         return JSONResponse({"error": "Failed to write hazards file", "details": str(e)}, status_code=500)
-    return {"status": "deleted", "removed": before - after}
+    return {"status": "deleted", "removed": removed}
 
 @app.post(
     "/submit_photo",
     tags=["Photo"],
     summary="Upload photo and GPS for hazard detection",
-    description="Upload a photo and GPS metadata for hazard detection. Only JPEG and PNG files are accepted.",
+    description="Upload a photo and GPS metadata for hazard detection. Only JPEG and PNG files are accepted. "
+                "Photos are identified by their SHA-256: resubmitting one returns its photo_id with duplicate='exact', "
+                "and a similar photo taken at the same spot is marked duplicate='near' with duplicate_of set.",
     response_description="Status and metadata of the uploaded photo."
 )
 async def submit_photo(
@@ -219,20 +285,25 @@ async def submit_photo(
     device_heading: Optional[float] = Form(None),
     timestamp: Optional[str] = Form(None)
 ):
-    # Save photo
-    photo_id = str(uuid.uuid4())
-    file_path = os.path.join(UPLOAD_DIR, f"{photo_id}_{photo.filename}")
+    # Stream photo into the content-addressed store, off the event loop; a resubmitted
+    # photo returns the stored copy's photo_id without writing it again
     try:
-        with open(file_path, "wb") as f:
-            f.write(await photo.read())
-        logger.info(f"Photo saved: {file_path}")
+        photo_record = await photo_store.put(photo, gps_lat, gps_lng)
+    except UploadRejected as e:
+        logger.warning(f"Photo rejected: {e}")
+        return JSONResponse({"error": e.error, "details": e.details}, status_code=e.status_code)
     except Exception as e:
         logger.error(f"Error saving photo: {e}")
         return JSONResponse({"error": "Failed to save photo", "details": str(e)}, status_code=500)
     # Normalize metadata
     meta = {
-        "photo_id": photo_id,
+        "photo_id": photo_record.photo_id,
         "filename": photo.filename,
+        "content_type": photo_record.content_type,
+        "size": photo_record.size,
+        "duplicate": photo_record.duplicate,
+        "duplicate_of": photo_record.duplicate_of,
+        "hazard_id": photo_record.hazard_id,
         "gps_lat": gps_lat,
         "gps_lng": gps_lng,
         "gps_accuracy": gps_accuracy,
@@ -246,31 +317,100 @@ async def submit_photo(
 @app.get(
     "/hazards",
     tags=["Hazard"],
-    summary="Get all hazard points",
-    description="Retrieve all hazard points as GeoJSON features.",
-    response_description="GeoJSON containing all hazard features."
+    summary="Get hazard points",
+    description="Retrieve hazard points as GeoJSON features. Without filters, returns every hazard. "
+                "Use bbox/since/type to fetch only what a map viewport needs, and limit/cursor to page through large results.",
+    response_description="GeoJSON containing the matching hazard features, plus next_cursor when more pages exist."
 )
-async def get_hazards():
+async def get_hazards(
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat", examples=["103.85,1.29,103.86,1.30"]),
+    since: Optional[str] = Query(None, description="Only hazards last seen at or after this ISO timestamp"),
+    type: Optional[str] = Query(None, description="Only hazards of this type, e.g. curb_drop"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
     logger.info("Received get_hazards request")
-    # Return sample GeoJSON hazard points from file
+    box = None
+    if bbox:
+        try:
+            box = tuple(float(v) for v in bbox.split(","))
+            if len(box) != 4:
+                raise ValueError("expected 4 numbers")
+        except ValueError as e:
+            return JSONResponse({"error": "Invalid bbox", "details": str(e)}, status_code=400)
+    for name, value, parse in (("since", since, parse_since), ("cursor", cursor, parse_cursor)):
+        if value:
+            try:
+                parse(value)
+            except ValueError as e:
+                return JSONResponse({"error": f"Invalid {name}", "details": str(e)}, status_code=400)
     try:
-        async with aiofiles.open("sample_hazards.geojson", "r") as f:
-                geojson = json.loads(await f.read())
+        # Picks up hazards written by other worker processes
+        hazard_store.refresh()
+        features, next_cursor = hazard_store.query(bbox=box, since=since, hazard_type=type, limit=limit, cursor=cursor)
     except Exception as e:
-        logger.error(f"Error reading hazards file: {e}")
+        logger.error(f"Error reading hazards: {e}")
         return JSONResponse({"error": "Failed to read hazards file", "details": str(e)}, status_code=500)
+    geojson = {"type": "FeatureCollection", "features": features}
+    if next_cursor is not None:
+        geojson["next_cursor"] = next_cursor
     return JSONResponse(geojson)
 
 @app.post(
     "/ingest_iot",
     tags=["IoT"],
     summary="Ingest IoT/IMU data",
-    description="Ingest IoT or IMU sensor data for trace analysis.",
-    response_description="Status of IoT data ingestion."
+    description="Ingest batches of accelerometer/gyroscope samples. The body is one columnar JSON batch "
+                "({\"device_id\", \"t\": [...], \"ax\": [...], \"ay\", \"az\", optional \"gx\"/\"gy\"/\"gz\", \"lat\", \"lng\"}), "
+                "NDJSON with one such batch per line (application/x-ndjson), or packed binary records "
+                "(application/octet-stream, see imu.py). Rough surfaces and sustained slopes found in each "
+                "device's recent samples become hazard candidates.",
+    response_description="Devices and samples ingested, and the hazard candidates emitted."
 )
-def ingest_iot(data: dict):
-    # TODO: Process IMU/IoT data, attach to trace
-    return JSONResponse({"status": "iot data received"})
+async def ingest_iot(request: Request):
+    too_large = JSONResponse({"error": "Body too large", "details": f"At most {IMU_MAX_BODY_BYTES} bytes per request"}, status_code=413)
+    # Refuse from the declared length when there is one, and stop reading once a chunked body passes the limit
+    length = request.headers.get("content-length")
+    if length is not None and (not length.isdigit() or int(length) > IMU_MAX_BODY_BYTES):
+        return too_large
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > IMU_MAX_BODY_BYTES:
+            return too_large
+        chunks.append(chunk)
+    body = b"".join(chunks)
+    try:
+        return await run_in_threadpool(imu_pipeline.ingest, body, request.headers.get("content-type", ""))
+    except ImuFormatError as e:
+        return JSONResponse({"error": "Invalid IoT data", "details": str(e)}, status_code=400)
+
+@app.get(
+    "/traces/{device_id}",
+    tags=["IoT"],
+    summary="Raw or rolled-up IMU trace of a device",
+    description="Samples a device sent to /ingest_iot between start and end (Unix seconds), as columns. "
+                "level=1s or 1min returns per-bucket min/max/mean of each sensor instead of raw samples.",
+    response_description="Device id, level, and one array per column."
+)
+async def get_trace(
+    device_id: str,
+    start: Optional[float] = Query(None, description="Earliest timestamp (Unix seconds)"),
+    end: Optional[float] = Query(None, description="Latest timestamp (Unix seconds)"),
+    level: str = Query("raw", description="raw, 1s or 1min")
+):
+    try:
+        columns = await run_in_threadpool(
+            trace_store.read, device_id, float("-inf") if start is None else start, float("inf") if end is None else end, level
+        )
+    except ValueError as e:
+        return JSONResponse({"error": "Invalid level", "details": str(e)}, status_code=400)
+    if len(columns["t"]) > TRACE_MAX_POINTS:
+        return JSONResponse({
+            "error": "Too many points",
+            "details": f"{len(columns['t'])} points in range; narrow it or use a coarser level (at most {TRACE_MAX_POINTS})"
+        }, status_code=413)
+    return {"device_id": device_id, "level": level, "columns": {name: values.tolist() for name, values in columns.items()}}
 
 @app.get(
     "/health",
@@ -280,7 +420,12 @@ def ingest_iot(data: dict):
     response_description="Status of the API."
 )
 def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok", "route_cache": features.route_cache.stats(), "route_executor": route_executor.stats(),
+        "onemap": onemap_client.stats(), "navigation": navigation_sessions.stats(),
+        "heatmap": accessibility_heatmap.cache.stats(), "photos": photo_store.stats(),
+        "imu": imu_pipeline.stats(), "traces": trace_store.stats()
+    }
 
 
 # /route endpoint: computes optimal route and hazard alerts, now supports external data sources
@@ -293,6 +438,7 @@ class RouteRequest(BaseModel):
     to_lng: Optional[float] = Field(None, json_schema_extra={"example": 103.852300})
     profile: str = Field("safest", json_schema_extra={"example": "safest"})
     external_data: Optional[Dict[str, Any]] = Field(None, json_schema_extra={"example": {"crowd_density": {"B": 2}, "weather": {"rain": True}}})
+    alternatives: int = Field(0, ge=0, le=ROUTE_ALTERNATIVES_MAX, json_schema_extra={"example": 2})
 
 class RoutePoint(BaseModel):
     node: str
@@ -304,10 +450,16 @@ class RouteGeoJSON(BaseModel):
     type: str
     coordinates: List[List[float]]
 
+class AlternativeRoute(BaseModel):
+    route: List[RoutePoint]
+    route_geojson: RouteGeoJSON
+    hazard_alerts: List[Dict[str, Any]]
+
 class RouteResponse(BaseModel):
     route: List[RoutePoint]
     route_geojson: RouteGeoJSON
     hazard_alerts: List[Dict[str, Any]]
+    alternatives: List[AlternativeRoute] = []
 
 @app.post(
     "/route",
@@ -317,7 +469,7 @@ class RouteResponse(BaseModel):
     description="Compute the optimal accessible route, integrating hazards and optional external data (crowd, weather, etc.).",
     response_description="Route details, geojson, and hazard alerts."
 )
-def route(req: RouteRequest):
+async def route(req: RouteRequest):
     logger.info(f"Received route request: {req}")
     """
     Computes optimal accessible route, integrating hazards and optional external data (crowd, weather, etc.).
@@ -330,53 +482,216 @@ def route(req: RouteRequest):
     }
     """
     try:
-        G, nodes = engine.load_graph()
-    except Exception as e:
-        logger.error(f"Error loading graph: {e}")
-        return JSONResponse({"error": "Failed to load graph", "details": str(e)}, status_code=500)
+        return await route_executor.run(req.model_dump())
+    except RouteExecutorSaturated as e:
+        logger.warning(f"Route pool saturated: {e}")
+        return JSONResponse({"error": "Routing is at capacity, retry shortly", "details": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    except RouteError as e:
+        return JSONResponse({"error": e.error, "details": e.details}, status_code=e.status_code)
+
+@app.post(
+    "/route/batch",
+    tags=["Routing"],
+    summary="Compute many routes in one request",
+    description="Compute routes for a list of /route requests on one graph snapshot. Requests sharing an origin "
+                "(and profile and external data) are answered from a single shortest-path tree. Results stream back "
+                "as NDJSON, one line per route in completion order, each tagged with its position in the request list.",
+    response_description="NDJSON lines: /route fields plus 'index', or 'index', 'error' and 'details'."
+)
+async def route_batch(reqs: List[RouteRequest] = Body(...)):
+    logger.info(f"Received route batch of {len(reqs)} requests")
+    if len(reqs) > ROUTE_BATCH_MAX:
+        return JSONResponse({"error": "Batch too large", "details": f"At most {ROUTE_BATCH_MAX} routes per batch"}, status_code=413)
     try:
-           with open(HAZARD_FILE, "r") as f:
-            hazards = json.load(f)
-    except Exception as e:
-        logger.error(f"Error reading hazards file: {e}")
-        return JSONResponse({"error": "Failed to read hazards file", "details": str(e)}, status_code=500)
+        results = route_executor.run_batch([r.model_dump() for r in reqs])
+    except RouteExecutorSaturated as e:
+        logger.warning(f"Route pool saturated: {e}")
+        return JSONResponse({"error": "Routing is at capacity, retry shortly", "details": str(e)}, status_code=503, headers={"Retry-After": "1"})
+
+    async def ndjson():
+        try:
+            async for result in results:
+                yield json.dumps(result) + "\n"
+        finally:
+            await results.aclose()
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+class MatrixPoint(BaseModel):
+    node: Optional[str] = Field(None, json_schema_extra={"example": "A"})
+    lat: Optional[float] = Field(None, json_schema_extra={"example": 1.290270})
+    lng: Optional[float] = Field(None, json_schema_extra={"example": 103.851959})
+
+class MatrixRequest(BaseModel):
+    sources: List[MatrixPoint]
+    targets: List[MatrixPoint]
+    profile: str = Field("safest", json_schema_extra={"example": "safest"})
+    mode: Optional[str] = Field(None, json_schema_extra={"example": "wheelchair"})
+
+class MatrixResponse(BaseModel):
+    sources: List[str]
+    targets: List[str]
+    costs: List[List[Optional[float]]]
+
+@app.post(
+    "/route/matrix",
+    tags=["Routing"],
+    summary="Travel cost matrix between point sets",
+    response_model=MatrixResponse,
+    description="Accessible travel cost from every source to every target (points given as nodes or lat/lng), "
+                "using the same costs as /route for the profile, or the multi-modal costs when a mode is given. "
+                "Unreachable pairs are null.",
+    response_description="Snapped source and target nodes and the dense cost matrix."
+)
+async def route_matrix(req: MatrixRequest):
+    logger.info(f"Received matrix request: {len(req.sources)}x{len(req.targets)}")
+    if not req.sources or not req.targets:
+        return JSONResponse({"error": "Empty matrix", "details": "sources and targets must not be empty"}, status_code=400)
+    if len(req.sources) * len(req.targets) > ROUTE_MATRIX_MAX:
+        return JSONResponse({"error": "Matrix too large", "details": f"At most {ROUTE_MATRIX_MAX} source-target pairs"}, status_code=413)
     try:
-        G = engine.apply_hazards(G, nodes, hazards)
-    except Exception as e:
-        logger.error(f"Error applying hazards: {e}")
-        return JSONResponse({"error": "Failed to apply hazards", "details": str(e)}, status_code=500)
-    def find_nearest_node(lat, lng):
-        return min(nodes, key=lambda k: (nodes[k][0] - lat)**2 + (nodes[k][1] - lng)**2)
-    start = req.from_node or (find_nearest_node(req.from_lat, req.from_lng) if req.from_lat and req.from_lng else "A")
-    end = req.to_node or (find_nearest_node(req.to_lat, req.to_lng) if req.to_lat and req.to_lng else "H")
+        result = await route_executor.run_matrix(
+            [p.model_dump() for p in req.sources], [p.model_dump() for p in req.targets], req.profile, req.mode
+        )
+    except RouteExecutorSaturated as e:
+        logger.warning(f"Route pool saturated: {e}")
+        return JSONResponse({"error": "Routing is at capacity, retry shortly", "details": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    except RouteError as e:
+        return JSONResponse({"error": e.error, "details": e.details}, status_code=e.status_code)
+    costs = [[c if c != float("inf") else None for c in row] for row in result["costs"].tolist()]
+    return {"sources": result["sources"], "targets": result["targets"], "costs": costs}
+
+
+# Live navigation: a session keeps its route up to date as the traveller moves and hazards change
+class NavigationRequest(BaseModel):
+    from_node: Optional[str] = Field(None, json_schema_extra={"example": "A"})
+    to_node: Optional[str] = Field(None, json_schema_extra={"example": "H"})
+    from_lat: Optional[float] = Field(None, json_schema_extra={"example": 1.290270})
+    from_lng: Optional[float] = Field(None, json_schema_extra={"example": 103.851959})
+    to_lat: Optional[float] = Field(None, json_schema_extra={"example": 1.290600})
+    to_lng: Optional[float] = Field(None, json_schema_extra={"example": 103.852300})
+    profile: str = Field("safest", json_schema_extra={"example": "safest"})
+
+class NavigationResponse(RouteResponse):
+    session_id: str
+    reroutes: int
+
+@app.post(
+    "/navigate",
+    tags=["Routing"],
+    summary="Start a live navigation session",
+    response_model=NavigationResponse,
+    description="Plan a route and keep it as a session. Hazards reported later repair the session's route "
+                "incrementally instead of recomputing it; poll or report positions to get the current route.",
+    response_description="Session id, route details, geojson, and hazard alerts."
+)
+async def start_navigation_session(req: NavigationRequest):
+    logger.info(f"Received navigation request: {req}")
     try:
-        path = features.get_route_with_external_data(G, nodes, start, end, profile=req.profile, external_data=req.external_data)
-    except Exception as e:
-        logger.error(f"No route found: {e}")
-        return JSONResponse({"error": "No route found", "details": str(e)}, status_code=400)
-    route_points = []
-    for n in path:
-        point = {"node": n, "lat": nodes[n][0], "lng": nodes[n][1]}
-        nearby = []
-        for feature in hazards.get('features', []):
-            coords = feature['geometry']['coordinates']
-            if abs(nodes[n][0] - coords[1]) < PROXIMITY_THRESHOLD and abs(nodes[n][1] - coords[0]) < PROXIMITY_THRESHOLD:
-                meta = feature['properties'].copy()
-                meta['recommended_action'] = "avoid" if meta['severity'] > 0.7 else "caution"
-                nearby.append(meta)
-        point["hazards"] = nearby
-        route_points.append(point)
-    linestring = {
-        "type": "LineString",
-        "coordinates": [[p["lng"], p["lat"]] for p in route_points]
-    }
+        return await run_in_threadpool(start_navigation, graph_store, navigation_sessions, req.model_dump(), PROXIMITY_THRESHOLD)
+    except RouteError as e:
+        return JSONResponse({"error": e.error, "details": e.details}, status_code=e.status_code)
+
+@app.get(
+    "/navigate/{session_id}",
+    tags=["Routing"],
+    summary="Current route of a navigation session",
+    response_model=NavigationResponse,
+    description="The session's route from the traveller's last position, rerouted if hazards changed along it.",
+    response_description="Session id, reroute count, route details, geojson, and hazard alerts."
+)
+async def get_navigation_session(session_id: str):
     try:
-        route_hazards = engine.get_route_hazards(path, nodes, hazards)
-    except Exception as e:
-        logger.error(f"Error getting route hazards: {e}")
-        return JSONResponse({"error": "Failed to get route hazards", "details": str(e)}, status_code=500)
-    return {
-        "route": route_points,
-        "route_geojson": linestring,
-        "hazard_alerts": route_hazards
-    }
+        return await run_in_threadpool(update_navigation, graph_store, navigation_sessions, session_id, None, PROXIMITY_THRESHOLD)
+    except RouteError as e:
+        return JSONResponse({"error": e.error, "details": e.details}, status_code=e.status_code)
+
+@app.post(
+    "/navigate/{session_id}/position",
+    tags=["Routing"],
+    summary="Report the traveller's position",
+    response_model=NavigationResponse,
+    description="Move the session's start to the given node (or the node nearest lat/lng) and return the route from there.",
+    response_description="Session id, reroute count, route details, geojson, and hazard alerts."
+)
+async def update_navigation_position(session_id: str, position: MatrixPoint):
+    try:
+        return await run_in_threadpool(update_navigation, graph_store, navigation_sessions, session_id, position.model_dump(), PROXIMITY_THRESHOLD)
+    except RouteError as e:
+        return JSONResponse({"error": e.error, "details": e.details}, status_code=e.status_code)
+
+@app.delete(
+    "/navigate/{session_id}",
+    tags=["Routing"],
+    summary="End a navigation session",
+    description="Stop tracking the session.",
+    response_description="Status."
+)
+async def end_navigation_session(session_id: str):
+    if not navigation_sessions.close(session_id):
+        return JSONResponse({"error": "Unknown navigation session", "details": f"No active session {session_id}"}, status_code=404)
+    return {"status": "closed", "session_id": session_id}
+
+def _heatmap_tile(z: int, x: int, y: int, fmt: str):
+    G, _, _ = graph_store.snapshot()
+    return accessibility_heatmap.tile(G, z, x, y, fmt)
+
+@app.get(
+    "/heatmap/{z}/{x}/{y}.png",
+    tags=["Routing"],
+    summary="Accessibility heatmap tile",
+    description="256px web mercator tile of node accessibility scores (red = hazardous, green = clear), "
+                "averaged over 8px cells and transparent where there are no nodes. Use as a map tile overlay.",
+    response_class=Response,
+    response_description="PNG image."
+)
+async def heatmap_tile_png(z: int, x: int, y: int):
+    try:
+        png = await run_in_threadpool(_heatmap_tile, z, x, y, "png")
+    except ValueError as e:
+        return JSONResponse({"error": "Invalid tile", "details": str(e)}, status_code=400)
+    return Response(png, media_type="image/png", headers={"Cache-Control": "public, max-age=60"})
+
+@app.get(
+    "/heatmap/{z}/{x}/{y}.json",
+    tags=["Routing"],
+    summary="Accessibility heatmap tile as scores",
+    description="The same cells as the PNG tile, as a grid (row 0 at the top) of mean scores, null where there are no nodes.",
+    response_description="Tile coordinates, node count, and the score grid."
+)
+async def heatmap_tile_json(z: int, x: int, y: int):
+    try:
+        return await run_in_threadpool(_heatmap_tile, z, x, y, "json")
+    except ValueError as e:
+        return JSONResponse({"error": "Invalid tile", "details": str(e)}, status_code=400)
+
+@app.get(
+    "/isochrone",
+    tags=["Routing"],
+    summary="Where can I get to in N minutes",
+    description="Areas reachable from a node or lat/lng within each travel time, as hexagon cells, using the same "
+                "mode constraints as multi-modal routing (a wheelchair isochrone never crosses stairs). "
+                "All times come from one search; results are cached per origin node until hazards change.",
+    response_description="GeoJSON FeatureCollection with one MultiPolygon per time, smallest first."
+)
+async def get_isochrone(
+    node: Optional[str] = Query(None, description="Origin node"),
+    lat: Optional[float] = Query(None, description="Origin latitude (snapped to the nearest node)"),
+    lng: Optional[float] = Query(None, description="Origin longitude"),
+    minutes: str = Query("5,10,15", description="Comma-separated travel times in minutes"),
+    mode: str = Query("walking", description="wheelchair, walking or public_transit"),
+    profile: str = Query("fastest", description="Routing profile"),
+    hex_size: float = Query(60.0, gt=10, le=1000, description="Hexagon radius in metres")
+):
+    try:
+        times = [float(m) for m in minutes.split(",") if m.strip()]
+    except ValueError as e:
+        return JSONResponse({"error": "Invalid minutes", "details": str(e)}, status_code=400)
+    if not times or len(times) > ISOCHRONE_MAX_THRESHOLDS or not all(0 < t <= ISOCHRONE_MAX_MINUTES for t in times):
+        return JSONResponse({
+            "error": "Invalid minutes",
+            "details": f"Give 1 to {ISOCHRONE_MAX_THRESHOLDS} positive times of at most {ISOCHRONE_MAX_MINUTES:g} minutes"
+        }, status_code=400)
+    try:
+        return await run_in_threadpool(compute_isochrones, graph_store, {"node": node, "lat": lat, "lng": lng}, times, mode, profile, hex_size)
+    except RouteError as e:
+        return JSONResponse({"error": e.error, "details": e.details}, status_code=e.status_code)
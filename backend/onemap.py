@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from routing.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+ONEMAP_ROUTE_URL = "https://www.onemap.gov.sg/api/public/routingsvc/route"
+
+
+class OneMapError(Exception):
+    """OneMap answered with an error status (e.g. 401 without a valid API key)."""
+
+    def __init__(self, status_code: int, details: str):
+        super().__init__(details)
+        self.status_code = status_code
+        self.details = details
+
+
+class OneMapUnavailable(Exception):
+    """OneMap is down, too slow, or the circuit breaker is open; callers should fall back."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    After `failure_threshold` failures in a row the breaker opens and calls fail
+    fast for `reset_after` seconds; then a single trial call is let through
+    (half-open), which closes the breaker on success or reopens it on failure.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_after: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            failure_threshold: consecutive failures that open the breaker
+            reset_after: seconds to fail fast before trying upstream again
+            clock: time source, injectable for tests
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at < self.reset_after:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"OneMap circuit breaker opened after {self.failures} failures")
+            self.opened_at = self.clock()
+
+
+class OneMapClient:
+    """
+    Long-lived OneMap routing client.
+    One pooled httpx.AsyncClient is reused for all calls (opened in the app
+    lifespan, or lazily on first use). Responses are cached by rounded
+    coordinates and route type, concurrent identical misses share a single
+    upstream call, and a circuit breaker turns a slow or failing OneMap into
+    an immediate OneMapUnavailable so callers can use the local engine.
+    """
+
+    def __init__(
+        self,
+        url: str = ONEMAP_ROUTE_URL,
+        api_key: Optional[str] = None,
+        timeout: float = 5.0,
+        max_connections: int = 20,
+        cache_size: int = 1024,
+        cache_ttl: Optional[float] = 300.0,
+        coord_decimals: int = 5,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Args:
+            url: OneMap routing endpoint (point it at a stub server in tests)
+            api_key: sent as the token parameter and auth headers (optional)
+            timeout: seconds before an upstream call counts as failed
+            max_connections: connection pool size
+            cache_size, cache_ttl: response cache bounds (entries, seconds)
+            coord_decimals: coordinates are rounded to this many decimals (5 ~ 1m) for caching
+            breaker: circuit breaker (default: 3 failures, 30s)
+        """
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self.coord_decimals = coord_decimals
+        self.breaker = breaker or CircuitBreaker()
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+
+    async def start(self) -> None:
+        """Open the pooled HTTP client (idempotent)."""
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._loop is loop:
+            return
+        # A client is bound to the event loop it was opened on
+        self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        self._loop = loop
+        self._inflight = {}
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    def key(self, start: Sequence[float], end: Sequence[float], route_type: str) -> Tuple:
+        """Cache key: rounded start and end coordinates plus route type."""
+        d = self.coord_decimals
+        return (round(start[0], d), round(start[1], d), round(end[0], d), round(end[1], d), route_type)
+
+    async def route(self, start: Sequence[float], end: Sequence[float], route_type: str = "walk") -> Dict[str, Any]:
+        """
+        Route from OneMap, served from cache when possible.
+        Args:
+            start, end: (lat, lng)
+            route_type: OneMap routeType (walk, drive, cycle, pt)
+        Returns:
+            OneMap response JSON
+        Raises:
+            OneMapError: OneMap answered with a 4xx status
+            OneMapUnavailable: OneMap is unreachable, slow, failing, or the breaker is open
+        """
+        key = self.key(start, end, route_type)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        if not self.breaker.allow():
+            raise OneMapUnavailable("OneMap circuit breaker is open")
+        await self.start()
+        task = asyncio.ensure_future(self._fetch(key))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cache": self.cache.stats(),
+            "breaker": self.breaker.state,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight)
+        }
+
+    async def _fetch(self, key: Tuple) -> Dict[str, Any]:
+        start_lat, start_lng, end_lat, end_lng, route_type = key
+        params = {"start": f"{start_lat},{start_lng}", "end": f"{end_lat},{end_lng}", "routeType": route_type}
+        headers = {}
+        if self.api_key:
+            # OneMap has accepted the token both as a query parameter and as headers
+            params["token"] = self.api_key
+            headers["Authorization"] = f"Bearer {self.api_key}"
+            headers["X-API-Key"] = self.api_key
+        self.upstream_calls += 1
+        try:
+            response = await self._client.get(self.url, params=params, headers=headers)
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            raise OneMapUnavailable(f"OneMap request failed: {e!r}") from e
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise OneMapUnavailable(f"OneMap returned {response.status_code}")
+        # 4xx is our request's fault, not OneMap's health
+        self.breaker.record_success()
+        if response.status_code >= 400:
+            raise OneMapError(response.status_code, response.text)
+        data = response.json()
+        self.cache.put(key, data)
+        return data
+
+
+def parse_latlng(value: str) -> Tuple[float, float]:
+    """'lat,lng' as used by OneMap into a (lat, lng) tuple."""
+    lat, lng = (float(part) for part in value.split(","))
+    return lat, lng
+
+
+def encode_polyline(points: List[Tuple[float, float]], precision: int = 5) -> str:
+    """Encode (lat, lng) points as a Google encoded polyline, OneMap's route_geometry format."""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        ilat, ilng = int(round(lat * factor)), int(round(lng * factor))
+        for delta in (ilat - prev_lat, ilng - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                out.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            out.append(chr(value + 63))
+        prev_lat, prev_lng = ilat, ilng
+    return "".join(out)
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from io_utils import SavedUpload, stream_upload
+from config import UPLOAD_DIR, UPLOAD_MAX_BYTES, PHOTO_NEAR_DUP_METERS, PHOTO_NEAR_DUP_BITS
+
+try:
+    from PIL import Image
+except ImportError:  # optional: without Pillow only byte-identical duplicates are detected
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png"}
+METERS_PER_DEGREE = 111320.0
+HASH_MASK = (1 << 64) - 1
+
+
+@dataclass
+class StoredPhoto:
+    """
+    A photo in the PhotoStore.
+    photo_id is the SHA-256 of the content. duplicate is None for a new photo,
+    "exact" when the same bytes were stored before, and "near" when a
+    perceptually similar photo was taken at the same spot; duplicate_of then
+    names that earlier photo, and hazard_id is the hazard it was classified as.
+    """
+    photo_id: str
+    path: str
+    size: int
+    content_type: str
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    phash: Optional[int] = None
+    duplicate_of: Optional[str] = None
+    hazard_id: Optional[str] = None
+    duplicate: Optional[str] = None
+
+
+def perceptual_hash(path: str) -> Optional[int]:
+    """
+    64-bit difference hash (dHash) of an image: the sign of each horizontal
+    brightness step on a 9x8 grayscale thumbnail. Re-encoding, rescaling and
+    small exposure changes flip few bits. Returned as a signed 64-bit int so it
+    fits an SQLite INTEGER; None without Pillow or for an undecodable image.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as img:
+            img.draft("L", (64, 64))  # JPEG: decode at reduced scale
+            pixels = img.convert("L").resize((9, 8), Image.BILINEAR).tobytes()
+    except Exception as e:
+        logger.warning(f"Cannot hash image {path}: {e}")
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits - (1 << 64) if bits >= 1 << 63 else bits
+
+
+class PhotoStore:
+    """
+    Content-addressed photo storage with duplicate detection.
+
+    Photos live at {root}/{sha[:2]}/{sha[2:4]}/{sha}.jpg|png, so a retried
+    upload lands on the same file and is never stored twice. A SQLite index
+    (WAL, shared by all workers) maps each hash to its record, and a lat/lng
+    index finds earlier photos near a new one so perceptual-hash neighbours
+    taken at the same spot are collapsed into the first.
+    """
+
+    def __init__(
+        self,
+        root: str = UPLOAD_DIR,
+        max_bytes: int = UPLOAD_MAX_BYTES,
+        near_meters: float = PHOTO_NEAR_DUP_METERS,
+        near_bits: int = PHOTO_NEAR_DUP_BITS
+    ):
+        """
+        Args:
+            root: directory holding the shards, the index and in-flight uploads
+            max_bytes: largest accepted upload
+            near_meters: how far apart two photos may be taken and still be near duplicates
+            near_bits: most differing dHash bits between near duplicates (0 disables)
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.near_meters = near_meters
+        self.near_bits = near_bits
+        self.incoming_dir = os.path.join(root, "incoming")
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(root, "photos.db"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS photos (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            lat REAL,
+            lng REAL,
+            phash INTEGER,
+            duplicate_of TEXT,
+            hazard_id TEXT,
+            created REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS photos_location ON photos(lat, lng)")
+        self.stats_counts = {"stored": 0, "exact_duplicates": 0, "near_duplicates": 0}
+
+    def path_for(self, sha256: str, content_type: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256 + EXTENSIONS.get(content_type, ""))
+
+    def get(self, photo_id: str) -> Optional[StoredPhoto]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, path, size, content_type, lat, lng, phash, duplicate_of, hazard_id FROM photos WHERE sha256 = ?",
+                (photo_id,)
+            ).fetchone()
+        return StoredPhoto(*row) if row else None
+
+    async def put(self, file, lat: Optional[float] = None, lng: Optional[float] = None) -> StoredPhoto:
+        """
+        Stream an UploadFile into the store.
+        The upload is streamed and hashed into incoming/; if the hash is already
+        stored the temporary copy is dropped and the existing record returned.
+        Raises:
+            io_utils.UploadRejected: not a JPEG/PNG, or larger than max_bytes
+        """
+        saved = await stream_upload(file, self.incoming_dir, max_bytes=self.max_bytes)
+        return await asyncio.to_thread(self.add_file, saved, lat, lng)
+
+    def add_file(self, saved: SavedUpload, lat: Optional[float] = None, lng: Optional[float] = None) -> StoredPhoto:
+        """Move a streamed upload into its shard, or drop it if its content is already stored."""
+        existing = self.get(saved.sha256)
+        if existing is not None:
+            os.remove(saved.path)
+            self.stats_counts["exact_duplicates"] += 1
+            return replace(existing, duplicate="exact", duplicate_of=existing.duplicate_of or existing.photo_id)
+        phash = perceptual_hash(saved.path)
+        near = self.find_near_duplicate(phash, lat, lng)
+        path = self.path_for(saved.sha256, saved.content_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(saved.path, path)
+        photo = StoredPhoto(
+            saved.sha256, path, saved.size, saved.content_type, lat, lng, phash,
+            duplicate_of=near.duplicate_of or near.photo_id if near else None,
+            hazard_id=near.hazard_id if near else None
+        )
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO photos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (photo.photo_id, photo.path, photo.size, photo.content_type, lat, lng, phash,
+                 photo.duplicate_of, photo.hazard_id, time.time())
+            ).rowcount
+        if not inserted:
+            # Another worker stored the same bytes first; the file is identical
+            existing = self.get(saved.sha256)
+            self.stats_counts["exact_duplicates"] += 1
+            return replace(existing, duplicate="exact", duplicate_of=existing.duplicate_of or existing.photo_id)
+        if near is not None:
+            self.stats_counts["near_duplicates"] += 1
+            photo.duplicate = "near"
+            logger.info(f"Photo {photo.photo_id} is a near duplicate of {photo.duplicate_of}")
+        else:
+            self.stats_counts["stored"] += 1
+        return photo
+
+    def find_near_duplicate(self, phash: Optional[int], lat: Optional[float], lng: Optional[float]) -> Optional[StoredPhoto]:
+        """The closest-looking earlier photo within near_meters of lat/lng and near_bits of phash."""
+        if phash is None or lat is None or lng is None or self.near_bits <= 0:
+            return None
+        dlat = self.near_meters / METERS_PER_DEGREE
+        dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sha256, path, size, content_type, lat, lng, phash, duplicate_of, hazard_id FROM photos "
+                "WHERE lat BETWEEN ? AND ? AND lng BETWEEN ? AND ? AND phash IS NOT NULL",
+                (lat - dlat, lat + dlat, lng - dlng, lng + dlng)
+            ).fetchall()
+        best, best_bits = None, self.near_bits + 1
+        for row in rows:
+            bits = bin((row[6] ^ phash) & HASH_MASK).count("1")
+            if bits < best_bits:
+                best, best_bits = StoredPhoto(*row), bits
+        return best
+
+    def link_hazard(self, photo_id: str, hazard_id: str) -> None:
+        """Record the hazard a photo was classified as, for it and any duplicates stored since."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE photos SET hazard_id = ? WHERE (sha256 = ? OR duplicate_of = ?) AND hazard_id IS NULL",
+                (hazard_id, photo_id, photo_id)
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM photos").fetchone()[0]
+        return {"photos": count, **self.stats_counts}
+
+
+_photo_store = None
+
+
+def get_photo_store() -> PhotoStore:
+    """Process-wide PhotoStore rooted at UPLOAD_DIR."""
+    global _photo_store
+    if _photo_store is None:
+        _photo_store = PhotoStore()
+    return _photo_store
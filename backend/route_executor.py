@@ -0,0 +1,533 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+import networkx as nx
+import numpy as np
+
+from routing import engine, features
+from routing.annotate import RouteAnnotator
+from routing.cache import external_data_hash
+from routing.costs import EdgeOverlay, profile_cost, profile_preferences
+from routing.graph_store import GraphStore
+from routing.isochrone import isochrones
+from routing.matrix import distance_matrix
+from routing.replan import NavigationSession, NavigationSessions
+from routing.snap import node_snapper
+from routing.spatial import HazardIndex
+from hazard_store import open_hazard_store
+
+logger = logging.getLogger(__name__)
+
+
+class RouteError(Exception):
+    """A route request failed; carries the API error body and status code."""
+
+    def __init__(self, error: str, details: str, status_code: int):
+        super().__init__(f"{error}: {details}")
+        self.error = error
+        self.details = details
+        self.status_code = status_code
+
+
+class RouteExecutorSaturated(Exception):
+    """Too many route requests are queued or running; the caller should answer 503."""
+
+
+def compute_route_response(store: GraphStore, request: Dict[str, Any], route_engine: str, proximity_threshold: float) -> Dict[str, Any]:
+    """
+    Compute a /route response on a GraphStore's resident graph.
+    Args:
+        store: GraphStore holding the graph and hazards
+        request: RouteRequest fields as a dict
+        route_engine: "networkx", "csr" or "cch"
+        proximity_threshold: hazard proximity in degrees
+    Returns:
+        dict with route, route_geojson and hazard_alerts
+    Raises:
+        RouteError: graph loading, hazard application or routing failed
+    """
+    try:
+        store.load()
+    except Exception as e:
+        logger.error(f"Error loading graph: {e}")
+        raise RouteError("Failed to load graph", str(e), 500)
+    try:
+        # Shared resident graph: per-request costs live in EdgeOverlays, never on G
+        G, nodes, hazards = store.snapshot()
+    except Exception as e:
+        logger.error(f"Error applying hazards: {e}")
+        raise RouteError("Failed to apply hazards", str(e), 500)
+    start, end = _endpoints(node_snapper(G, nodes), request)
+    profile = request.get("profile", "safest")
+    try:
+        routed = G
+        if request.get("external_data"):
+            routed = features.merge_external_data(G, nodes, request["external_data"])
+        path = features.get_route_with_profile(routed, start, end, profile, engine=route_engine)
+    except Exception as e:
+        logger.error(f"No route found: {e}")
+        raise RouteError("No route found", str(e), 400)
+    annotator = _annotator(G, nodes, hazards, proximity_threshold)
+    body = _route_body(path, nodes, annotator)
+    k = request.get("alternatives") or 0
+    if k:
+        # Bounded search: at most k dissimilar routes within the alternatives time budget
+        found = features.get_alternative_routes(routed, start, end, k, profile=profile)
+        others = [p for p in found if p != path and all(n in nodes for n in p)][:k]
+        body["alternatives"] = [_route_body(p, nodes, annotator) for p in others]
+    return body
+
+
+def resolve_endpoints(store: GraphStore, requests: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """(start, end) node of each route request, snapping coordinates to nodes."""
+    store.load()
+    G, nodes, _ = store.snapshot()
+    snapper = node_snapper(G, nodes)
+    return [_endpoints(snapper, request) for request in requests]
+
+
+def compute_route_group(
+    store: GraphStore,
+    start: str,
+    items: List[Tuple[int, str]],
+    request: Dict[str, Any],
+    route_engine: str,
+    proximity_threshold: float
+) -> List[Dict[str, Any]]:
+    """
+    Route responses for batch items sharing a start, profile and external data,
+    all answered from one shortest-path tree.
+    Args:
+        store: GraphStore holding the graph and hazards
+        start: common start node
+        items: (batch index, end node) pairs
+        request: one of the group's requests (for profile and external_data)
+        route_engine: "networkx", "csr" or "cch"
+        proximity_threshold: hazard proximity in degrees
+    Returns:
+        One dict per item with its batch 'index' and either the /route fields or 'error' and 'details'
+    """
+    G, nodes, hazards = store.snapshot()
+    routed = G
+    if request.get("external_data"):
+        routed = features.merge_external_data(G, nodes, request["external_data"])
+    paths = features.get_routes_from(routed, start, [end for _, end in items], request.get("profile", "safest"), engine=route_engine)
+    # Streets shared by several routes of the group are looked up once
+    annotator = _annotator(G, nodes, hazards, proximity_threshold)
+    results = []
+    for index, end in items:
+        path = paths.get(end)
+        if path is None:
+            results.append({"index": index, "error": "No route found", "details": f"No path between {start} and {end}."})
+            continue
+        try:
+            body = _route_body(path, nodes, annotator)
+        except Exception as e:
+            logger.error(f"Error getting route hazards: {e}")
+            results.append({"index": index, "error": "Failed to get route hazards", "details": str(e)})
+            continue
+        results.append({"index": index, **body})
+    return results
+
+
+def compute_matrix_rows(
+    store: GraphStore,
+    sources: List[Dict[str, Any]],
+    targets: List[Dict[str, Any]],
+    profile: str,
+    mode: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Cost matrix rows for some sources against all targets.
+    Args:
+        store: GraphStore holding the graph and hazards
+        sources, targets: points, each {"node": name} or {"lat": .., "lng": ..}
+        profile, mode: as routing.matrix.distance_matrix
+    Returns:
+        dict with the snapped 'sources' and 'targets' node names and 'costs' (float array)
+    Raises:
+        RouteError: a point has neither a node nor coordinates
+    """
+    store.load()
+    G, nodes, _ = store.snapshot()
+    snapper = node_snapper(G, nodes)
+    source_nodes = [_point_node(snapper, p) for p in sources]
+    target_nodes = [_point_node(snapper, p) for p in targets]
+    costs = distance_matrix(G, source_nodes, target_nodes, profile=profile, mode=mode)
+    return {"sources": source_nodes, "targets": target_nodes, "costs": costs}
+
+
+def compute_isochrones(
+    store: GraphStore,
+    origin: Dict[str, Any],
+    minutes: List[float],
+    mode: str,
+    profile: str,
+    hex_size: float
+) -> Dict[str, Any]:
+    """
+    Reachability areas around a point on the store's resident graph (see routing.isochrone).
+    Args:
+        store: GraphStore holding the graph and hazards
+        origin: {"node": name} or {"lat": .., "lng": ..}
+        minutes, mode, profile, hex_size: as routing.isochrone.isochrones
+    Returns:
+        GeoJSON FeatureCollection, one hexagon MultiPolygon per time
+    Raises:
+        RouteError: invalid origin or parameters (400)
+    """
+    store.load()
+    G, nodes, _ = store.snapshot()
+    node = _point_node(node_snapper(G, nodes), origin)
+    try:
+        return isochrones(G, node, minutes, mode=mode, profile=profile, hex_size=hex_size)
+    except (ValueError, nx.NodeNotFound) as e:
+        raise RouteError("Invalid isochrone request", str(e), 400)
+
+
+def start_navigation(store: GraphStore, sessions: NavigationSessions, request: Dict[str, Any], proximity_threshold: float) -> Dict[str, Any]:
+    """
+    Open a navigation session: an incrementally re-planned route on the store's
+    resident graph that follows hazard changes (see routing.replan).
+    Args:
+        store: GraphStore holding the graph and hazards
+        sessions: registry the session is kept in
+        request: from/to node or lat/lng and profile, as for /route
+        proximity_threshold: hazard proximity in degrees
+    Returns:
+        dict with session_id, reroutes and the /route fields
+    Raises:
+        RouteError: there is no route
+    """
+    store.load()
+    G, nodes, hazards = store.snapshot()
+    start, end = _endpoints(node_snapper(G, nodes), request)
+    profile = request.get("profile", "safest")
+    # The weight reads G on every call, so hazard updates applied to G are seen by the planner
+    weight = EdgeOverlay.of(G).weight(profile_cost(profile_preferences(profile)))
+    try:
+        session = sessions.start(G, start, end, weight, meta={"profile": profile})
+    except (nx.NodeNotFound, nx.NetworkXNoPath) as e:
+        raise RouteError("No route found", str(e), 400)
+    return _navigation_body(session, G, nodes, hazards, proximity_threshold)
+
+
+def update_navigation(
+    store: GraphStore,
+    sessions: NavigationSessions,
+    session_id: str,
+    position: Optional[Dict[str, Any]],
+    proximity_threshold: float
+) -> Dict[str, Any]:
+    """
+    Current route of a navigation session, after moving its traveller to position if given.
+    Pending hazard changes are applied first; sessions whose route they touch are repaired.
+    Args:
+        position: {"node": name} or {"lat": .., "lng": ..}, or None to just read the route
+    Raises:
+        RouteError: unknown session (404), invalid position or no route left (400)
+    """
+    store.load()
+    G, nodes, hazards = store.snapshot()
+    try:
+        if position is None:
+            session = sessions.get(session_id)
+        else:
+            session = sessions.advance(session_id, _point_node(node_snapper(G, nodes), position))
+    except KeyError:
+        raise RouteError("Unknown navigation session", f"No active session {session_id}", 404)
+    except (nx.NodeNotFound, nx.NetworkXNoPath) as e:
+        raise RouteError("No route found", str(e), 400)
+    return _navigation_body(session, G, nodes, hazards, proximity_threshold)
+
+
+def _navigation_body(session: NavigationSession, G: Any, nodes: Dict[str, Tuple[float, float]], hazards: Dict[str, Any], proximity_threshold: float) -> Dict[str, Any]:
+    body = _route_body(session.route, nodes, _annotator(G, nodes, hazards, proximity_threshold))
+    body.update({"session_id": session.session_id, "reroutes": session.reroutes})
+    return body
+
+
+def _point_node(snapper: Any, point: Dict[str, Any]) -> str:
+    if point.get("node") is not None:
+        return point["node"]
+    if point.get("lat") is None or point.get("lng") is None:
+        raise RouteError("Invalid point", "Each point needs a node or lat and lng", 400)
+    return snapper.nearest_node(point["lat"], point["lng"])
+
+
+def _endpoints(snapper: Any, request: Dict[str, Any]) -> Tuple[str, str]:
+    from_lat, from_lng = request.get("from_lat"), request.get("from_lng")
+    to_lat, to_lng = request.get("to_lat"), request.get("to_lng")
+    start = request.get("from_node") or (snapper.nearest_node(from_lat, from_lng) if from_lat and from_lng else "A")
+    end = request.get("to_node") or (snapper.nearest_node(to_lat, to_lng) if to_lat and to_lng else "H")
+    return start, end
+
+
+def _annotator(G: Any, nodes: Dict[str, Tuple[float, float]], hazards: Dict[str, Any], proximity_threshold: float) -> RouteAnnotator:
+    # The store publishes a new index on every change; only use it if it matches this snapshot
+    hazard_index = G.graph.get("hazard_index")
+    if hazard_index is None or hazard_index.hazards is not hazards:
+        hazard_index = HazardIndex(hazards, proximity_threshold)
+    return RouteAnnotator(nodes, hazard_index, proximity_threshold)
+
+
+def _route_body(
+    path: List[str],
+    nodes: Dict[str, Tuple[float, float]],
+    annotator: RouteAnnotator
+) -> Dict[str, Any]:
+    # Per-point hazards and the deduplicated alerts come from one corridor query along the route
+    try:
+        near, route_hazards = annotator.annotate(path)
+    except Exception as e:
+        logger.error(f"Error getting route hazards: {e}")
+        raise RouteError("Failed to get route hazards", str(e), 500)
+    route_points = [
+        {"node": n, "lat": nodes[n][0], "lng": nodes[n][1], "hazards": nearby}
+        for n, nearby in zip(path, near)
+    ]
+    linestring = {
+        "type": "LineString",
+        "coordinates": [[p["lng"], p["lat"]] for p in route_points]
+    }
+    return {
+        "route": route_points,
+        "route_geojson": linestring,
+        "hazard_alerts": route_hazards
+    }
+
+
+# Per-worker-process state, set up once by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(settings: Dict[str, Any]) -> None:
+    # Each worker process opens the hazard store read-side and keeps its own resident graph;
+    # snapshot() picks up hazards written by the API process through the store's change feed
+    hazard_store = open_hazard_store(settings["hazard_backend"], settings["hazard_file"], settings["hazard_db"])
+    store = GraphStore(
+        hazard_store,
+        loader=lambda: engine.load_graph(settings["graph_file"]),
+        proximity_threshold=settings["proximity_threshold"]
+    )
+    store.load()
+    _worker.update(settings, store=store)
+
+
+def _in_worker(fn: Callable[..., Any], *args: Any) -> Any:
+    return fn(_worker["store"], *args)
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+class RouteBatch:
+    """
+    Streamed results of RouteExecutor.run_batch.
+    Holds one max_pending slot from creation until it is exhausted, closed,
+    fails, or is garbage collected, so a response that is never iterated
+    (client gone before the first chunk) still gives its slot back.
+    """
+
+    def __init__(self, results: AsyncIterator[Dict[str, Any]], release: Callable[[], None]):
+        self._results = results
+        self._release = weakref.finalize(self, release)
+        self._release.atexit = False
+
+    def __aiter__(self) -> "RouteBatch":
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        try:
+            return await self._results.__anext__()
+        except BaseException:
+            # StopAsyncIteration included: the batch is over either way
+            self._release()
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            await self._results.aclose()
+        finally:
+            self._release()
+
+
+class RouteExecutor:
+    """
+    Runs route computations off the event loop.
+    With workers > 0, a ProcessPoolExecutor whose workers each load the graph
+    once at start-up, so routing scales with cores instead of sharing the GIL.
+    With workers = 0, a small thread pool in this process routing on `store`.
+    At most `max_pending` requests may be queued or running; beyond that
+    run() raises RouteExecutorSaturated straight away, so a burst of heavy
+    queries cannot back up the rest of the API.
+    """
+
+    def __init__(self, settings: Dict[str, Any], workers: int = 0, max_pending: int = 32, store: Optional[GraphStore] = None, threads: int = 4):
+        """
+        Args:
+            settings: hazard_backend, hazard_file, hazard_db, graph_file, route_engine, proximity_threshold
+            workers: worker processes (0 = thread pool in this process)
+            max_pending: queued plus running requests allowed before rejecting
+            store: GraphStore to route on in thread mode
+            threads: thread pool size in thread mode
+        """
+        if workers < 0 or max_pending < 1:
+            raise ValueError("workers must be >= 0 and max_pending >= 1")
+        if workers == 0 and store is None:
+            raise ValueError("thread mode needs a GraphStore")
+        self.settings = settings
+        self.workers = workers
+        self.max_pending = max_pending
+        self.store = store
+        self.threads = threads
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> Executor:
+        """Create the pool (idempotent)."""
+        with self._lock:
+            if self._pool is None:
+                if self.workers:
+                    # spawn, not fork: the API process has threads and open database handles
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.settings,)
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="route")
+            return self._pool
+
+    async def warm_up(self) -> None:
+        """Start every worker process now, so the first requests don't pay for graph loading."""
+        if self.workers:
+            pool = self.start()
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[loop.run_in_executor(pool, _warm_up) for _ in range(self.workers)])
+
+    async def run(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Compute a route response in the pool.
+        Raises:
+            RouteExecutorSaturated: max_pending requests are already queued or running
+            RouteError: as compute_route_response
+        """
+        self._acquire()
+        try:
+            result = await self._submit(compute_route_response, request, self.settings["route_engine"], self.settings["proximity_threshold"])
+            self.completed += 1
+            return result
+        finally:
+            self._release()
+
+    def run_batch(self, requests: List[Dict[str, Any]]) -> RouteBatch:
+        """
+        Route many requests, yielding each result (tagged with its batch 'index') as
+        soon as its group is done. Requests are grouped by start node, profile and
+        external data, and each group is answered from one shortest-path tree.
+        A batch takes one slot of max_pending and runs at most one group per worker
+        at a time, so single /route calls keep getting through.
+        Raises:
+            RouteExecutorSaturated: at call time, if max_pending requests are already in progress
+        """
+        self._acquire()
+        return RouteBatch(self._batch(requests), self._release)
+
+    async def _batch(self, requests: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        pending: Set[asyncio.Future] = set()
+        try:
+            endpoints = await self._submit(resolve_endpoints, requests)
+            groups: Dict[Tuple, List[Tuple[int, str]]] = {}
+            for index, (request, (start, end)) in enumerate(zip(requests, endpoints)):
+                key = (start, request.get("profile", "safest"), external_data_hash(request.get("external_data")))
+                groups.setdefault(key, []).append((index, end))
+            queue = iter(groups.items())
+            while True:
+                for (start, _, _), items in itertools.islice(queue, (self.workers or self.threads) - len(pending)):
+                    pending.add(asyncio.ensure_future(self._submit(
+                        compute_route_group, start, items, requests[items[0][0]],
+                        self.settings["route_engine"], self.settings["proximity_threshold"]
+                    )))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for result in task.result():
+                        yield result
+            self.completed += 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def run_matrix(self, sources: List[Dict[str, Any]], targets: List[Dict[str, Any]], profile: str = "safest", mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Cost matrix between point sets (see compute_matrix_rows); with worker
+        processes the sources are split evenly across them.
+        Raises:
+            RouteExecutorSaturated: max_pending requests are already in progress
+            RouteError: as compute_matrix_rows
+        """
+        self._acquire()
+        try:
+            chunks = max(1, min(self.workers, len(sources)))
+            bounds = [len(sources) * k // chunks for k in range(chunks + 1)]
+            parts = await asyncio.gather(*[
+                self._submit(compute_matrix_rows, sources[a:b], targets, profile, mode)
+                for a, b in zip(bounds, bounds[1:])
+            ])
+            self.completed += 1
+            return {
+                "sources": [node for part in parts for node in part["sources"]],
+                "targets": parts[0]["targets"],
+                "costs": np.vstack([part["costs"] for part in parts])
+            }
+        finally:
+            self._release()
+
+    async def _submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        # fn(store, *args) runs on the worker process's own store, or on self.store in thread mode
+        pool = self.start()
+        loop = asyncio.get_running_loop()
+        if self.workers:
+            return await loop.run_in_executor(pool, _in_worker, fn, *args)
+        return await loop.run_in_executor(pool, fn, self.store, *args)
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self.in_flight >= self.max_pending:
+                self.rejected += 1
+                raise RouteExecutorSaturated(f"{self.in_flight} route requests already in progress")
+            self.in_flight += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "process" if self.workers else "thread",
+            "workers": self.workers or self.threads,
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,125 @@
+import time
+from itertools import islice
+from typing import Callable, Dict, Hashable, List, Optional, Set
+
+import networkx as nx
+
+try:
+    from .costs import EdgeCost, EdgeOverlay
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from costs import EdgeCost, EdgeOverlay
+
+METHODS = ("penalty", "yen")
+# Alternatives sharing more than this fraction of their length (base_cost) with a kept route are dropped
+DEFAULT_MAX_OVERLAP = 0.8
+# Alternatives costing more than this multiple of the best route are dropped
+DEFAULT_MAX_STRETCH = 1.5
+# Seconds to spend looking for alternatives; the best route is always returned
+DEFAULT_TIME_BUDGET = 0.5
+# Penalty method: cost multiplier for edges of routes already found
+PENALTY_FACTOR = 1.4
+# Upper bound on searches (penalty) or candidate paths (Yen) per alternative asked for
+ATTEMPTS_PER_ALTERNATIVE = 5
+
+
+def alternative_routes(
+    G: nx.Graph,
+    start: Hashable,
+    end: Hashable,
+    k: int = 2,
+    cost: Optional[EdgeCost] = None,
+    method: str = "penalty",
+    max_overlap: float = DEFAULT_MAX_OVERLAP,
+    max_stretch: float = DEFAULT_MAX_STRETCH,
+    time_budget: Optional[float] = DEFAULT_TIME_BUDGET,
+    clock: Callable[[], float] = time.monotonic
+) -> List[List[Hashable]]:
+    """
+    The best route plus up to k dissimilar alternatives, without enumerating all simple paths.
+    'penalty' re-runs Dijkstra with the edges of routes found so far made more
+    expensive, which finds genuinely different routes quickly; 'yen' walks
+    networkx's lazy Yen iterator in cost order and stops as soon as it has k
+    alternatives, the stretch limit is passed, or the budget runs out.
+    Args:
+        G: networkx.Graph or EdgeOverlay (not modified)
+        start, end: node names
+        k: number of alternatives wanted
+        cost: edge cost function (defaults to the 'weight' attribute)
+        method: 'penalty' or 'yen'
+        max_overlap: largest fraction of an alternative's length (base_cost, so hazard
+            penalties on a shared first or last edge don't dominate) it may share with any kept route
+        max_stretch: largest cost of an alternative relative to the best route
+        time_budget: seconds to spend on alternatives (None = no limit)
+        clock: time source, injectable for tests
+    Returns:
+        List of paths, best first
+    Raises:
+        nx.NodeNotFound, nx.NetworkXNoPath: if there is no route at all
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown alternatives method '{method}', expected one of {METHODS}")
+    costs = EdgeOverlay.of(G)
+    weight = costs.weight(cost)
+    deadline = None if time_budget is None else clock() + time_budget
+    best = nx.dijkstra_path(costs.G, start, end, weight=weight)
+    kept = [best]
+    if k <= 0:
+        return kept
+    best_cost = path_cost(costs.G, best, weight)
+    kept_edges = [_edge_keys(costs.G, best)]
+
+    def consider(path: List[Hashable]) -> bool:
+        # Keep path if it is cheap enough and different enough; True when done
+        path_edges = _edge_keys(costs.G, path)
+        if path_edges not in kept_edges and path_cost(costs.G, path, weight) <= max_stretch * best_cost:
+            shares = [shared_fraction(costs.G, path, edges) for edges in kept_edges]
+            if max(shares) <= max_overlap:
+                kept.append(path)
+                kept_edges.append(path_edges)
+        return len(kept) > k or (deadline is not None and clock() >= deadline)
+
+    attempts = k * ATTEMPTS_PER_ALTERNATIVE
+    if method == "yen":
+        for path in islice(nx.shortest_simple_paths(costs.G, start, end, weight=weight), 1, attempts + 1):
+            # Yen yields paths cheapest first, so nothing later fits the stretch limit either
+            if path_cost(costs.G, path, weight) > max_stretch * best_cost or consider(path):
+                break
+        return kept
+
+    penalties: Dict[Hashable, float] = {}
+    directed = costs.G.is_directed()
+    last = best
+    for _ in range(attempts):
+        for key in _edge_keys(costs.G, last):
+            penalties[key] = penalties.get(key, 1.0) * PENALTY_FACTOR
+
+        def penalised(u, v, d):
+            w = weight(u, v, d)
+            return None if w is None else w * penalties.get((u, v) if directed else frozenset((u, v)), 1.0)
+        last = nx.dijkstra_path(costs.G, start, end, weight=penalised)
+        if consider(last):
+            break
+    return kept
+
+
+def path_cost(G: nx.Graph, path: List[Hashable], weight: Callable) -> float:
+    """Sum of weight(u, v, data) along path."""
+    return sum(weight(u, v, G[u][v]) for u, v in zip(path, path[1:]))
+
+
+def _edge_keys(G: nx.Graph, path: List[Hashable]) -> Set[Hashable]:
+    if G.is_directed():
+        return set(zip(path, path[1:]))
+    return {frozenset(e) for e in zip(path, path[1:])}
+
+
+def shared_fraction(G: nx.Graph, path: List[Hashable], other: Set[Hashable]) -> float:
+    """Fraction of path's length (base_cost, or edge count when it has none) on the edges in other."""
+    directed = G.is_directed()
+    total = shared = 0.0
+    for u, v in zip(path, path[1:]):
+        length = G[u][v].get('base_cost', 1)
+        total += length
+        if ((u, v) if directed else frozenset((u, v))) in other:
+            shared += length
+    return shared / total if total > 0 else 1.0
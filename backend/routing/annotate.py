@@ -0,0 +1,106 @@
+import math
+from typing import Any, Dict, Hashable, List, Tuple
+
+try:
+    from .csr import haversine
+    from .spatial import DEFAULT_THRESHOLD, HazardIndex
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from csr import haversine
+    from spatial import DEFAULT_THRESHOLD, HazardIndex
+
+# Hazards at least this severe are flagged 'avoid' on route points, others 'caution'
+AVOID_SEVERITY = 0.7
+
+
+class RouteAnnotator:
+    """
+    Hazards along routes, from one corridor query per route segment.
+    Both the per-point hazards (within the proximity box of a route node, as
+    before) and the route's hazard alerts (within the box of any point of the
+    polyline, once per hazard id) come from the same query, so the cost grows
+    with the hazards near the route rather than with all hazards. Segment
+    results are kept, so routes sharing streets (batches, alternatives)
+    look each one up once; use one annotator per graph snapshot.
+    """
+
+    def __init__(self, nodes: Dict[Hashable, Tuple[float, float]], index: HazardIndex, threshold: float = DEFAULT_THRESHOLD):
+        """
+        Args:
+            nodes: dict mapping node names to (lat, lng)
+            index: HazardIndex over the current hazards
+            threshold: proximity box half-size in degrees
+        """
+        self.nodes = nodes
+        self.index = index
+        self.threshold = threshold
+        self._segments: Dict[Tuple[Hashable, Hashable], List[Tuple[int, float, float]]] = {}
+
+    def annotate(self, path: List[Hashable]) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """
+        Args:
+            path: list of node names
+        Returns:
+            near: for each route point, the properties of hazards within the box around it,
+                in insertion order, with 'recommended_action' ('avoid' or 'caution')
+            alerts: properties of hazards near the route polyline, one per hazard id, in
+                route order, each with 'distance_along_route' in metres (where it is passed)
+        """
+        segments = list(zip(path, path[1:]))
+        if len(path) == 1:
+            # A one-node route is a single point
+            segments = [(path[0], path[0])]
+        near_keys: List[set] = [set() for _ in path]
+        passed: Dict[Any, Tuple[float, int]] = {}
+        along = 0.0
+        for i, (u, v) in enumerate(segments):
+            (lat1, lng1), (lat2, lng2) = self.nodes[u], self.nodes[v]
+            length = float(haversine(lat1, lng1, lat2, lng2))
+            for key, lo, hi in self._hits(u, v):
+                if key not in self.index.features:
+                    # Removed since the segment was looked up
+                    continue
+                lat, lng = self.index.grid.position(key)
+                for end, (elat, elng) in ((i, (lat1, lng1)), (i + 1, (lat2, lng2))):
+                    if end < len(path) and abs(lat - elat) < self.threshold and abs(lng - elng) < self.threshold:
+                        near_keys[end].add(key)
+                distance = along + _fraction(lat, lng, lat1, lng1, lat2, lng2, lo, hi) * length
+                hazard_id = self.index.features[key].get('properties', {}).get('id')
+                ident = ('key', key) if hazard_id is None else hazard_id
+                if ident not in passed or (distance, key) < passed[ident]:
+                    passed[ident] = (distance, key)
+            along += length
+        near = []
+        for keys in near_keys:
+            point_hazards = []
+            for key in sorted(keys):
+                meta = self.index.features[key]['properties'].copy()
+                meta['recommended_action'] = "avoid" if meta['severity'] > AVOID_SEVERITY else "caution"
+                point_hazards.append(meta)
+            near.append(point_hazards)
+        alerts = []
+        for distance, key in sorted(passed.values()):
+            alert = dict(self.index.features[key]['properties'])
+            alert['distance_along_route'] = round(distance, 1)
+            alerts.append(alert)
+        return near, alerts
+
+    def _hits(self, u: Hashable, v: Hashable) -> List[Tuple[int, float, float]]:
+        hits = self._segments.get((u, v))
+        if hits is None:
+            reverse = self._segments.get((v, u))
+            if reverse is not None:
+                hits = [(key, 1.0 - hi, 1.0 - lo) for key, lo, hi in reverse]
+            else:
+                (lat1, lng1), (lat2, lng2) = self.nodes[u], self.nodes[v]
+                hits = self.index.grid.query_segment(lat1, lng1, lat2, lng2, self.threshold)
+            self._segments[(u, v)] = hits
+        return hits
+
+
+def _fraction(lat: float, lng: float, lat1: float, lng1: float, lat2: float, lng2: float, lo: float, hi: float) -> float:
+    # Closest point of the segment to (lat, lng), kept within the part of the segment it is near
+    scale = math.cos(math.radians((lat1 + lat2) / 2))
+    dx, dy = (lng2 - lng1) * scale, lat2 - lat1
+    length2 = dx * dx + dy * dy
+    s = 0.0 if length2 == 0 else ((lng - lng1) * scale * dx + (lat - lat1) * dy) / length2
+    return min(max(s, lo), hi)
@@ -0,0 +1,263 @@
+"""
+Offline builder for routing graph artifacts.
+
+Turns an OSM extract (XML, or PBF with the optional `osmium` package) or a
+GeoJSON LineString network into a directory of flat arrays that the server
+memory-maps at startup (see csr.load_csr and config.GRAPH_FILE).
+
+Usage (from backend/):
+    python -m routing.build_graph singapore.osm graphs/singapore
+    python -m routing.build_graph network.geojson graphs/demo --bbox 103.8,1.27,103.87,1.31
+    python -m routing.build_graph singapore.osm graphs/singapore --cch   # also preprocess for ROUTE_ENGINE=cch
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .cch import CCH, CCH_DIR
+    from .csr import EDGE_ATTRIBUTES, CSRGraph, haversine
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from cch import CCH, CCH_DIR
+    from csr import EDGE_ATTRIBUTES, CSRGraph, haversine
+
+# A way is a list of (node key, lat, lng) points plus its tags/properties
+Way = Tuple[List[Tuple[Hashable, float, float]], Dict[str, Any]]
+
+# OSM highway values a pedestrian (or wheelchair user) may use
+WALKABLE_HIGHWAYS = {
+    'footway', 'pedestrian', 'path', 'steps', 'living_street', 'residential', 'service',
+    'unclassified', 'tertiary', 'tertiary_link', 'secondary', 'secondary_link', 'track',
+    'crossing', 'corridor', 'platform', 'cycleway', 'road',
+}
+NOT_WALKABLE = {'no', 'private'}
+# GeoJSON coordinates are snapped to this many decimals (~1cm) to join lines at shared vertices
+COORD_DECIMALS = 7
+
+
+def walkable(tags: Dict[str, Any]) -> bool:
+    """Whether an OSM way can be walked on."""
+    if tags.get('foot') in NOT_WALKABLE:
+        return False
+    if tags.get('access') in NOT_WALKABLE and tags.get('foot') not in ('yes', 'designated'):
+        return False
+    return tags.get('highway') in WALKABLE_HIGHWAYS or tags.get('public_transport') == 'platform'
+
+
+def edge_attributes(tags: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Accessibility attributes of a way, from OSM tags or GeoJSON properties.
+    Properties already named like graph attributes (slope, stairs, covered, park,
+    transit, base_cost) are taken as they are.
+    """
+    return {
+        'slope': _slope(tags),
+        'stairs': _flag(tags.get('stairs')) or tags.get('highway') == 'steps',
+        'covered': _flag(tags.get('covered')) or tags.get('covered') == 'arcade' or tags.get('tunnel') in ('yes', 'building_passage'),
+        'park': _flag(tags.get('park')) or tags.get('leisure') == 'park',
+        'transit': _flag(tags.get('transit')) or tags.get('public_transport') == 'platform'
+                   or tags.get('railway') == 'platform' or tags.get('highway') in ('bus_stop', 'platform'),
+        'base_cost': _number(tags.get('base_cost')),
+    }
+
+
+def read_osm_xml(path: str) -> Iterator[Way]:
+    """Walkable ways from an .osm XML file, streamed with iterparse."""
+    coords: Dict[int, Tuple[float, float]] = {}
+    for _, elem in ET.iterparse(path, events=('end',)):
+        if elem.tag == 'node':
+            coords[int(elem.get('id'))] = (float(elem.get('lat')), float(elem.get('lon')))
+            elem.clear()
+        elif elem.tag == 'way':
+            tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+            if walkable(tags):
+                refs = [int(nd.get('ref')) for nd in elem.iter('nd')]
+                points = [(ref, *coords[ref]) for ref in refs if ref in coords]
+                if len(points) >= 2:
+                    yield points, tags
+            elem.clear()
+        elif elem.tag == 'relation':
+            elem.clear()
+
+
+def read_osm_pbf(path: str) -> Iterator[Way]:
+    """Walkable ways from an .osm.pbf file; needs the optional `osmium` package."""
+    try:
+        import osmium
+    except ImportError:
+        raise SystemExit("Reading .pbf needs the 'osmium' package (pip install osmium), "
+                         "or convert first: osmium cat region.osm.pbf -o region.osm")
+    ways: List[Way] = []
+
+    class Handler(osmium.SimpleHandler):
+        def way(self, w):
+            tags = {t.k: t.v for t in w.tags}
+            if not walkable(tags):
+                return
+            points = [(n.ref, n.lat, n.lon) for n in w.nodes if n.location.valid()]
+            if len(points) >= 2:
+                ways.append((points, tags))
+
+    Handler().apply_file(path, locations=True)
+    return iter(ways)
+
+
+def read_geojson(path: str) -> Iterator[Way]:
+    """LineString / MultiLineString features of a GeoJSON network; lines join at shared vertices."""
+    with open(path) as f:
+        data = json.load(f)
+    for feature in data.get('features', []):
+        geometry = feature.get('geometry') or {}
+        props = feature.get('properties') or {}
+        if geometry.get('type') == 'LineString':
+            lines = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiLineString':
+            lines = geometry['coordinates']
+        else:
+            continue
+        for line in lines:
+            points = []
+            for lng, lat, *_ in line:
+                key = (round(lng, COORD_DECIMALS), round(lat, COORD_DECIMALS))
+                points.append((key, key[1], key[0]))
+            if len(points) >= 2:
+                yield points, props
+
+
+def read_network(path: str, fmt: Optional[str] = None) -> Iterator[Way]:
+    """Pick a reader by explicit format or file extension."""
+    fmt = fmt or ('pbf' if path.endswith('.pbf') else 'geojson' if path.endswith(('.geojson', '.json')) else 'osm')
+    readers = {'osm': read_osm_xml, 'pbf': read_osm_pbf, 'geojson': read_geojson}
+    if fmt not in readers:
+        raise ValueError(f"Unknown network format '{fmt}', expected one of {sorted(readers)}")
+    return readers[fmt](path)
+
+
+def build_csr(ways: Iterable[Way], bbox: Optional[Tuple[float, float, float, float]] = None) -> Tuple[CSRGraph, Dict[str, Any]]:
+    """
+    Turn ways into a CSRGraph, one edge per consecutive pair of way points.
+    Parallel edges keep the cheapest; base_cost defaults to the length in metres.
+    Args:
+        ways: iterable of (points, tags)
+        bbox: (min_lng, min_lat, max_lng, max_lat); segments with an endpoint outside are dropped
+    Returns:
+        (graph, stats) where stats counts ways, nodes and edges
+    """
+    node_ids: Dict[Hashable, int] = {}
+    lat: List[float] = []
+    lng: List[float] = []
+    columns: Dict[str, List[Any]] = {name: [] for name in ('u', 'v', 'slope', 'stairs', 'covered', 'park', 'transit', 'base_cost')}
+    way_count = 0
+
+    def node(key, plat, plng):
+        i = node_ids.get(key)
+        if i is None:
+            i = node_ids[key] = len(lat)
+            lat.append(plat)
+            lng.append(plng)
+        return i
+
+    def inside(plat, plng):
+        return bbox is None or (bbox[0] <= plng <= bbox[2] and bbox[1] <= plat <= bbox[3])
+
+    for points, tags in ways:
+        way_count += 1
+        attrs = edge_attributes(tags)
+        for (ka, lat_a, lng_a), (kb, lat_b, lng_b) in zip(points, points[1:]):
+            if ka == kb or not (inside(lat_a, lng_a) and inside(lat_b, lng_b)):
+                continue
+            columns['u'].append(node(ka, lat_a, lng_a))
+            columns['v'].append(node(kb, lat_b, lng_b))
+            for name in ('slope', 'stairs', 'covered', 'park', 'transit', 'base_cost'):
+                columns[name].append(attrs[name])
+
+    lat_arr = np.array(lat, dtype=np.float64)
+    lng_arr = np.array(lng, dtype=np.float64)
+    u = np.array(columns['u'], dtype=np.int32)
+    v = np.array(columns['v'], dtype=np.int32)
+    length = haversine(lat_arr[u], lng_arr[u], lat_arr[v], lng_arr[v]) if len(u) else np.zeros(0)
+    given = np.array([np.nan if c is None else c for c in columns['base_cost']], dtype=np.float64)
+    cost = np.where(np.isnan(given), length, given)
+    # One edge per node pair, keeping the cheapest
+    lo, hi = np.minimum(u, v), np.maximum(u, v)
+    order = np.lexsort((cost, hi, lo))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (lo[order][1:] != lo[order][:-1]) | (hi[order][1:] != hi[order][:-1])
+    keep = np.sort(order[first])
+    attributes = {'base_cost': cost[keep].astype(EDGE_ATTRIBUTES['base_cost'][0])}
+    for name in ('slope', 'stairs', 'covered', 'park', 'transit'):
+        attributes[name] = np.array(columns[name], dtype=EDGE_ATTRIBUTES[name][0])[keep]
+    csr = CSRGraph.from_edges(lat_arr, lng_arr, u[keep], v[keep], attributes)
+    stats = {'ways': way_count, 'nodes': csr.num_nodes, 'edges': csr.num_edges}
+    return csr, stats
+
+
+def build(source: str, output: str, fmt: Optional[str] = None, bbox: Optional[Tuple[float, float, float, float]] = None, cch: bool = False) -> Dict[str, Any]:
+    """
+    Build a graph artifact from a network file.
+    With cch=True the contraction hierarchy is preprocessed too and saved in
+    the artifact's cch/ directory (see engine.load_graph_artifact).
+    Returns:
+        stats dict (ways, nodes, edges, plus cch_arcs with cch=True)
+    """
+    csr, stats = build_csr(read_network(source, fmt), bbox)
+    csr.save(output, meta={'source': os.path.basename(source), 'bbox': list(bbox) if bbox else None, **stats})
+    if cch:
+        hierarchy = CCH.from_csr(csr)
+        hierarchy.save(os.path.join(output, CCH_DIR))
+        stats['cch_arcs'] = hierarchy.num_arcs
+    return stats
+
+
+def _slope(tags: Dict[str, Any]) -> float:
+    value = tags.get('slope', tags.get('incline'))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return abs(float(value))
+    match = re.fullmatch(r'\s*(-?\d+(?:\.\d+)?)\s*(%|°)?\s*', str(value or ''))
+    if not match:
+        return 0.0  # 'up', 'down', missing
+    number = abs(float(match.group(1)))
+    if match.group(2) == '%':
+        return number / 100
+    if match.group(2) == '°':
+        return float(np.tan(np.radians(number)))
+    return number
+
+
+def _flag(value: Any) -> bool:
+    return value is True or value in ('yes', 'true', '1')
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return None if value is None or isinstance(value, bool) else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build a memory-mappable routing graph from OSM or GeoJSON.")
+    parser.add_argument("source", help="OSM XML (.osm), OSM PBF (.osm.pbf) or GeoJSON LineString network")
+    parser.add_argument("output", help="artifact directory to write")
+    parser.add_argument("--format", choices=["osm", "pbf", "geojson"], help="input format (default: from extension)")
+    parser.add_argument("--bbox", help="min_lng,min_lat,max_lng,max_lat to clip the network to")
+    parser.add_argument("--cch", action="store_true", help="also preprocess a contraction hierarchy (ROUTE_ENGINE=cch)")
+    args = parser.parse_args(argv)
+    bbox = tuple(float(x) for x in args.bbox.split(",")) if args.bbox else None
+    if bbox is not None and len(bbox) != 4:
+        parser.error("--bbox needs four comma-separated numbers")
+    logging.basicConfig(level=logging.INFO)
+    stats = build(args.source, args.output, args.format, bbox, args.cch)
+    logging.info(f"Wrote {args.output}: {stats['nodes']} nodes, {stats['edges']} edges from {stats['ways']} ways")
+    if args.cch:
+        logging.info(f"Contraction hierarchy: {stats['cch_arcs']} arcs")
+
+
+if __name__ == "__main__":
+    main()
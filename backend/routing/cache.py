@@ -0,0 +1,119 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU cache with an optional time-to-live.
+    Keeps hit/miss/eviction counters so the hit rate can be monitored.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            maxsize: maximum number of entries; the least recently used is evicted beyond it
+            ttl: seconds an entry stays valid (None = no expiry)
+            clock: time source, injectable for tests
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._live(key) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value (marking it recently used) or default."""
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entry if full."""
+        with self._lock:
+            expires = self.clock() + self.ttl if self.ttl is not None else float('inf')
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            dict with hits, misses, evictions, expirations, size, maxsize and hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def _live(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self.clock():
+            del self._data[key]
+            self.expirations += 1
+            return None
+        return entry
+
+
+def external_data_hash(external_data: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Stable digest of an external_data dict (None when there is none)."""
+    if not external_data:
+        return None
+    payload = json.dumps(external_data, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def route_cache_key(G: Any, start: str, end: str, profile: str, mode: Optional[str] = None) -> Optional[Tuple]:
+    """
+    Cache key for a route on G, or None if G's state cannot be identified.
+    Only graphs carrying a 'version' (e.g. from GraphStore) are cacheable. Whoever
+    changes such a graph's edge costs must change 'version', 'hazard_epoch' or
+    'external_data_hash' in G.graph, otherwise cached routes go stale.
+    EdgeOverlays with changes not described that way are never cached.
+    """
+    if G.graph.get('version') is None or getattr(G, 'untracked_changes', False):
+        return None
+    return (
+        start, end, profile, mode,
+        G.graph['version'],
+        G.graph.get('hazard_epoch'),
+        G.graph.get('external_data_hash')
+    )
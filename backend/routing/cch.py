@@ -0,0 +1,468 @@
+import json
+import os
+import shutil
+import weakref
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+
+try:
+    from .csr import CSRGraph, csr_graph
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from csr import CSRGraph, csr_graph
+
+# On-disk hierarchy (see CCH.save / load_cch), kept next to the graph artifact
+CCH_VERSION = 1
+CCH_META = "meta.json"
+# Subdirectory of a graph artifact holding its hierarchy
+CCH_DIR = "cch"
+# Nested dissection stops splitting cells this small
+LEAF_SIZE = 8
+# Nested dissection tries cuts at these fractions along each of four directions
+SPLIT_FRACTIONS = (0.35, 0.5, 0.65)
+# Re-customizing more than this fraction of edges falls back to a full customization
+PARTIAL_LIMIT = 0.05
+
+
+class CCH:
+    """
+    Customizable contraction hierarchy over an undirected CSRGraph.
+    Preprocessing depends on topology only: nodes are ranked by nested
+    dissection and contracted, adding shortcut arcs from each node to its
+    higher-ranked neighbours. A metric (one cost per edge, e.g. a routing
+    profile) is then customized onto the arcs in one pass over the lower
+    triangles, and re-customized incrementally when a few edge costs change.
+    Queries walk the elimination tree up from both ends, touching only the
+    ancestors of source and target.
+    Nodes are identified by rank internally; order[rank] is the CSR node id.
+    """
+
+    def __init__(
+        self,
+        order: np.ndarray,
+        parent: np.ndarray,
+        up_offsets: np.ndarray,
+        up_heads: np.ndarray,
+        edge_arc: np.ndarray,
+        tri_low: np.ndarray,
+        tri_high: np.ndarray,
+        tri_top: np.ndarray,
+        level_offsets: np.ndarray
+    ):
+        """
+        Args:
+            order: CSR node id of each rank
+            parent: elimination tree parent of each rank (-1 for roots)
+            up_offsets, up_heads: upward arcs of rank r are up_heads[up_offsets[r]:up_offsets[r + 1]], heads ascending
+            edge_arc: arc of each CSR edge (-1 for self-loops); parallel edges share an arc
+            tri_low, tri_high, tri_top: lower triangles (arc v-u, arc v-w, arc u-w with v < u < w),
+                grouped by elimination tree height of v
+            level_offsets: triangles of height h are [level_offsets[h]:level_offsets[h + 1]]
+        """
+        self.order = order
+        self.parent = parent
+        self.up_offsets = up_offsets
+        self.up_heads = up_heads
+        self.tri_low = tri_low
+        self.tri_high = tri_high
+        self.tri_top = tri_top
+        self.level_offsets = level_offsets
+        self.edge_arc = edge_arc
+        self.num_edges = len(edge_arc)
+        self.rank = np.empty(len(order), dtype=np.int64)
+        self.rank[order] = np.arange(len(order))
+        self.arc_tail = np.repeat(np.arange(len(order)), np.diff(up_offsets))
+        self.metrics: Dict[Hashable, Dict[str, Any]] = {}
+        self._parent = parent.tolist()
+        self._by_top: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._matched: Optional[weakref.ref] = None
+        self._topology: Optional[Tuple[List[int], List[int], List[int]]] = None
+
+    @classmethod
+    def from_csr(cls, csr: CSRGraph, leaf_size: int = LEAF_SIZE) -> "CCH":
+        """
+        Preprocess the topology of an undirected CSRGraph.
+        Raises:
+            ValueError: if the graph is directed
+        """
+        if csr.directed:
+            raise ValueError("CCH needs an undirected graph")
+        n = csr.num_nodes
+        edge_u = np.asarray(csr.edge_u, dtype=np.int64)
+        edge_v = np.asarray(csr.edge_v, dtype=np.int64)
+        order = _dissection_order(csr, leaf_size)
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n)
+
+        # Contract in rank order; a node's remaining neighbours become a clique
+        up: List[set] = [set() for _ in range(n)]
+        ru, rv = rank[edge_u], rank[edge_v]
+        for a, b in zip(np.minimum(ru, rv).tolist(), np.maximum(ru, rv).tolist()):
+            if a != b:
+                up[a].add(b)
+        parent = [-1] * n
+        height = [0] * n
+        for v in range(n):
+            if up[v]:
+                p = min(up[v])
+                parent[v] = p
+                up[p].update(up[v])
+                up[p].discard(p)
+                height[p] = max(height[p], height[v] + 1)
+        height = np.array(height, dtype=np.int64)
+
+        counts = np.fromiter((len(s) for s in up), dtype=np.int64, count=n)
+        up_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=up_offsets[1:])
+        up_heads = np.fromiter((h for s in up for h in sorted(s)), dtype=np.int64, count=int(up_offsets[-1]))
+        del up
+        arc_tail = np.repeat(np.arange(n), counts)
+        keys = arc_tail * n + up_heads  # sorted: tails ascending, heads ascending per tail
+
+        edge_arc = np.full(len(edge_u), -1, dtype=np.int64)
+        simple = ru != rv
+        edge_arc[simple] = np.searchsorted(keys, np.minimum(ru, rv)[simple] * n + np.maximum(ru, rv)[simple])
+
+        # Lower triangles: every pair u < w of v's upward neighbours closes v-u-w
+        low, high, top = [], [], []
+        for v in np.flatnonzero(counts >= 2).tolist():
+            start, end = up_offsets[v], up_offsets[v + 1]
+            i, j = np.triu_indices(end - start, 1)
+            heads = up_heads[start:end]
+            low.append(start + i)
+            high.append(start + j)
+            top.append(np.searchsorted(keys, heads[i] * n + heads[j]))
+        tri_low = np.concatenate(low) if low else np.zeros(0, dtype=np.int64)
+        tri_high = np.concatenate(high) if high else np.zeros(0, dtype=np.int64)
+        tri_top = np.concatenate(top) if top else np.zeros(0, dtype=np.int64)
+        # A triangle's target arc starts above v, so it is final once lower levels are done
+        levels = height[arc_tail[tri_low]]
+        by_level = np.argsort(levels, kind='stable')
+        level_offsets = np.searchsorted(levels[by_level], np.arange(int(height.max(initial=0)) + 2))
+        return cls(order, np.array(parent, dtype=np.int64), up_offsets, up_heads, edge_arc,
+                   tri_low[by_level], tri_high[by_level], tri_top[by_level], level_offsets)
+
+    @property
+    def num_arcs(self) -> int:
+        return len(self.up_heads)
+
+    def matches(self, csr: CSRGraph) -> bool:
+        """Whether this hierarchy was built for csr's topology."""
+        if self._matched is not None and self._matched() is csr:
+            return True
+        if csr.num_nodes != len(self.order) or csr.num_edges != self.num_edges:
+            return False
+        ru, rv = self.rank[np.asarray(csr.edge_u)], self.rank[np.asarray(csr.edge_v)]
+        simple = ru != rv
+        arcs = self.edge_arc[simple]
+        ok = (np.array_equal(simple, self.edge_arc >= 0)
+              and np.array_equal(np.minimum(ru, rv)[simple], self.arc_tail[arcs])
+              and np.array_equal(np.maximum(ru, rv)[simple], self.up_heads[arcs]))
+        if ok:
+            self._matched = weakref.ref(csr)
+        return ok
+
+    def customize(self, metric: Hashable, edge_cost: np.ndarray, stamp: Optional[Tuple] = None) -> None:
+        """
+        Make metric answer queries for the given edge costs.
+        An existing metric is re-customized only where edge costs changed:
+        arcs above the changed edges in the elimination tree are reset and
+        their triangles re-run. Unchanged stamps (not None) skip the work entirely.
+        Args:
+            metric: name of the metric, e.g. a profile
+            edge_cost: one cost per CSR edge (inf allowed, NaN/negative not)
+            stamp: version of the costs, e.g. csr.stamp
+        """
+        state = self.metrics.get(metric)
+        if state is not None and stamp is not None and state['stamp'] == stamp:
+            return
+        edge_cost = np.array(edge_cost, dtype=np.float64)
+        base = self._base_weights(edge_cost)
+        weight = None
+        if state is not None:
+            changed = np.flatnonzero(edge_cost != state['edge_cost'])
+            if len(changed) <= PARTIAL_LIMIT * max(self.num_edges, 1):
+                weight = self._recustomize(state['weight'], base, changed)
+        if weight is None:
+            weight = base.copy()
+            for h in range(len(self.level_offsets) - 1):
+                part = slice(self.level_offsets[h], self.level_offsets[h + 1])
+                np.minimum.at(weight, self.tri_top[part], weight[self.tri_low[part]] + weight[self.tri_high[part]])
+        # Replaced, never modified, so a query in another thread keeps a consistent metric;
+        # weights holds the same values as a list for the query loops
+        self.metrics[metric] = {'edge_cost': edge_cost, 'base': base, 'weight': weight,
+                                'weights': weight.tolist(), 'stamp': stamp}
+
+    def path(self, metric: Hashable, source: int, target: int) -> Optional[List[int]]:
+        """
+        Shortest path between CSR node ids under a customized metric.
+        Returns:
+            List of CSR node ids from source to target, or None if every route has infinite cost
+        """
+        state = self.metrics[metric]
+        if source == target:
+            return [source]
+        s, t = int(self.rank[source]), int(self.rank[target])
+        chain_s, dist_s, pred_s = self._upward(state['weights'], s)
+        chain_t, dist_t, pred_t = self._upward(state['weights'], t)
+        # Both chains end in the common ancestors of s and t, where the searches meet
+        from_t = dict(zip(chain_t, dist_t))
+        best, meet = np.inf, -1
+        for x, d in zip(chain_s, dist_s):
+            total = d + from_t.get(x, np.inf)
+            if total < best:
+                best, meet = total, x
+        if meet < 0:
+            return None
+        ranks = self._chain(state, chain_s, pred_s, meet)[::-1] + self._chain(state, chain_t, pred_t, meet)[1:]
+        return self.order[ranks].tolist()
+
+    def save(self, path: str) -> None:
+        """Write the hierarchy as a directory of .npy arrays plus meta.json (metrics are not stored)."""
+        tmp = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        arrays = {
+            'order': self.order, 'parent': self.parent, 'up_offsets': self.up_offsets, 'up_heads': self.up_heads,
+            'edge_arc': self.edge_arc, 'tri_low': self.tri_low, 'tri_high': self.tri_high, 'tri_top': self.tri_top,
+            'level_offsets': self.level_offsets,
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(values))
+        with open(os.path.join(tmp, CCH_META), 'w') as f:
+            json.dump({'format_version': CCH_VERSION, 'num_nodes': len(self.order), 'num_edges': self.num_edges,
+                       'num_arcs': self.num_arcs, 'num_triangles': len(self.tri_top)}, f, indent=2)
+        old = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old)
+        os.rename(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def _base_weights(self, edge_cost: np.ndarray) -> np.ndarray:
+        # Arcs of original edges start at the cheapest edge they stand for; shortcuts at inf
+        weight = np.full(self.num_arcs, np.inf)
+        edges = np.flatnonzero(self.edge_arc >= 0)
+        np.minimum.at(weight, self.edge_arc[edges], edge_cost[edges])
+        return weight
+
+    def _recustomize(self, previous: np.ndarray, base: np.ndarray, changed: np.ndarray) -> np.ndarray:
+        weight = previous.copy()
+        if not len(changed):
+            return weight
+        # Arcs whose weight may change: those leaving an ancestor of a changed arc's tail
+        arcs = self.edge_arc[changed]
+        affected_nodes = np.zeros(len(self.order), dtype=bool)
+        parent = self._parent
+        for x in set(self.arc_tail[arcs[arcs >= 0]].tolist()):
+            while x != -1 and not affected_nodes[x]:
+                affected_nodes[x] = True
+                x = parent[x]
+        affected = affected_nodes[self.arc_tail]
+        weight[affected] = base[affected]
+        todo = np.flatnonzero(affected[self.tri_top])
+        bounds = np.searchsorted(todo, self.level_offsets)
+        for h in range(len(self.level_offsets) - 1):
+            part = todo[bounds[h]:bounds[h + 1]]
+            if len(part):
+                np.minimum.at(weight, self.tri_top[part], weight[self.tri_low[part]] + weight[self.tri_high[part]])
+        return weight
+
+    def _upward(self, weights: List[float], s: int) -> Tuple[List[int], List[float], List[int]]:
+        # Distances from s to each of its ancestors, relaxing every ancestor's upward arcs in turn
+        offsets, heads, parent = self._lists()
+        chain = [s]
+        while parent[chain[-1]] != -1:
+            chain.append(parent[chain[-1]])
+        at = {x: i for i, x in enumerate(chain)}
+        dist = [np.inf] * len(chain)
+        dist[0] = 0.0
+        pred = [-1] * len(chain)
+        for i, x in enumerate(chain):
+            d = dist[i]
+            if d == np.inf:
+                continue
+            for a in range(offsets[x], offsets[x + 1]):
+                j = at[heads[a]]
+                reached = d + weights[a]
+                if reached < dist[j]:
+                    dist[j] = reached
+                    pred[j] = a
+        return chain, dist, pred
+
+    def _chain(self, state: Dict[str, Any], chain: List[int], pred: List[int], x: int) -> List[int]:
+        # Ranks from x down the predecessor arcs to the search's origin, shortcuts unpacked
+        out = [x]
+        a = pred[chain.index(x)]
+        while a != -1:
+            out.extend(self._unpack(state, a)[::-1][1:])
+            x = int(self.arc_tail[a])
+            a = pred[chain.index(x)]
+        return out
+
+    def _lists(self) -> Tuple[List[int], List[int], List[int]]:
+        # Topology as Python lists: the query loops index them one element at a time
+        if self._topology is None:
+            self._topology = (self.up_offsets.tolist(), self.up_heads.tolist(), self._parent)
+        return self._topology
+
+    def _unpack(self, state: Dict[str, Any], arc: int) -> List[int]:
+        # Ranks along arc from its tail to its head, replacing shortcuts by the triangles they came from
+        weight, base = state['weight'], state['base']
+        if self._by_top is None:
+            by_top = np.argsort(self.tri_top, kind='stable')
+            self._by_top = (by_top, np.searchsorted(self.tri_top[by_top], np.arange(self.num_arcs + 1)))
+        by_top, top_offsets = self._by_top
+        out = [int(self.arc_tail[arc])]
+        stack = [(arc, False)]
+        while stack:
+            a, reverse = stack.pop()
+            if base[a] == weight[a]:
+                out.append(int(self.arc_tail[a]) if reverse else int(self.up_heads[a]))
+                continue
+            for tri in by_top[top_offsets[a]:top_offsets[a + 1]].tolist():
+                low, high = self.tri_low[tri], self.tri_high[tri]
+                if weight[low] + weight[high] == weight[a]:
+                    break
+            else:
+                raise RuntimeError(f"CCH arc {a} has no supporting triangle")
+            # tail(a) -> v via low reversed, then v -> head(a) via high; pushed in reverse order
+            if reverse:
+                stack.append((int(low), False))
+                stack.append((int(high), True))
+            else:
+                stack.append((int(high), False))
+                stack.append((int(low), True))
+        return out
+
+
+def _dissection_order(csr: CSRGraph, leaf_size: int) -> np.ndarray:
+    # Geometric nested dissection: the separator of each cut is ranked above both halves
+    n = csr.num_nodes
+    lat = np.asarray(csr.lat, dtype=np.float64)
+    lng = np.asarray(csr.lng, dtype=np.float64)
+    # Nodes without a position are put in the middle
+    known = np.isfinite(lat) & np.isfinite(lng)
+    lat = np.where(known, lat, lat[known].mean() if known.any() else 0.0)
+    lng = np.where(known, lng, lng[known].mean() if known.any() else 0.0)
+    x = lng * np.cos(np.radians(lat.mean() if n else 0.0))
+    directions = (x, lat, x + lat, x - lat)
+    offsets = np.asarray(csr.offsets, dtype=np.int64)
+    targets = np.asarray(csr.targets, dtype=np.int64)
+    degree = np.diff(offsets)
+    side = np.zeros(n, dtype=bool)
+    order: List[np.ndarray] = []
+
+    def arcs_of(cell: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        counts = degree[cell]
+        owner = np.repeat(cell, counts)
+        starts = np.repeat(offsets[cell] - np.cumsum(counts) + counts, counts)
+        return owner, targets[starts + np.arange(len(owner))]
+
+    def separate(ranked: np.ndarray, split: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Cut ranked at split; the separator is whichever side's boundary is smaller
+        a, b = ranked[:split], ranked[split:]
+        side[b] = True
+        owner, heads = arcs_of(a)
+        cut_a = np.unique(owner[side[heads]])
+        side[b] = False
+        side[a] = True
+        owner, heads = arcs_of(b)
+        cut_b = np.unique(owner[side[heads]])
+        side[a] = False
+        if len(cut_b) < len(cut_a):
+            return np.setdiff1d(b, cut_b, assume_unique=True), a, cut_b
+        return np.setdiff1d(a, cut_a, assume_unique=True), b, cut_a
+
+    # Explicit stack: a popped cell pushes (separator, one half, other half minus separator),
+    # so each cell's order is emitted before its separator
+    stack: List[Tuple[str, np.ndarray]] = [('cell', np.arange(n))]
+    while stack:
+        kind, cell = stack.pop()
+        if kind == 'sep' or len(cell) <= leaf_size:
+            order.append(cell)
+            continue
+        best = None
+        for direction in directions:
+            ranked = cell[np.argsort(direction[cell], kind='stable')]
+            for fraction in SPLIT_FRACTIONS:
+                parts = separate(ranked, int(len(ranked) * fraction))
+                if best is None or len(parts[2]) < len(best[2]):
+                    best = parts
+        rest, other, cut = best
+        stack.append(('sep', cut))
+        stack.append(('cell', other))
+        stack.append(('cell', rest))
+    return np.concatenate(order) if order else np.zeros(0, dtype=np.int64)
+
+
+def load_cch(path: str, mmap: bool = True) -> CCH:
+    """
+    Open a hierarchy written by CCH.save; topology arrays are memory-mapped
+    read-only so workers share them. Metrics are customized per process.
+    Raises:
+        ValueError: if the format version is not supported
+    """
+    with open(os.path.join(path, CCH_META)) as f:
+        meta = json.load(f)
+    if meta.get('format_version') != CCH_VERSION:
+        raise ValueError(f"Unsupported CCH version {meta.get('format_version')} in {path}")
+
+    def array(name):
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r' if mmap else None)
+
+    return CCH(array('order'), array('parent'), array('up_offsets'), array('up_heads'), array('edge_arc'),
+               array('tri_low'), array('tri_high'), array('tri_top'), array('level_offsets'))
+
+
+def cch_graph(G: Any) -> Tuple[CCH, CSRGraph]:
+    """
+    The CCH for G's CSRGraph: the one on G.graph['cch'] (e.g. loaded with the
+    graph artifact) if it fits the topology, otherwise built now and cached
+    there. Preprocessing is topology-only, so hazard updates keep the
+    hierarchy and only re-customize metrics.
+    Args:
+        G: networkx.Graph or EdgeOverlay (its base graph is used)
+    """
+    csr = csr_graph(G)
+    G = getattr(G, 'G', G)
+    cch = G.graph.get('cch')
+    if cch is None or not cch.matches(csr):
+        cch = CCH.from_csr(csr)
+        cch._matched = weakref.ref(csr)
+        G.graph['cch'] = cch
+    return cch, csr
+
+
+def cch_route(G: Any, start: Hashable, end: Hashable, metric: Hashable, edge_costs: Callable[[Dict[str, np.ndarray]], np.ndarray]) -> List[Hashable]:
+    """
+    Route with the CCH engine.
+    Args:
+        G: networkx.Graph or EdgeOverlay (not modified)
+        start, end: node names
+        metric: key the customized metric is kept under, e.g. ('profile', 'safest')
+        edge_costs: maps CSR attribute arrays to per-edge costs (e.g. csr.profile_costs with preferences bound)
+    Returns:
+        List of node names from start to end
+    Raises:
+        nx.NodeNotFound, nx.NetworkXNoPath
+    """
+    if getattr(G, '_edges', None):
+        # Request-private changes would need a throwaway metric; A* on the CSR is cheaper
+        csr = csr_graph(G)
+        return csr.astar(start, end, edge_costs(csr.attributes_with(G)))
+    cch, csr = cch_graph(G)
+    for node in (start, end):
+        if node not in csr.node_index:
+            raise nx.NodeNotFound(f"Node {node} is not in G")
+    cost = None
+    state = cch.metrics.get(metric)
+    if state is None or csr.stamp is None or state['stamp'] != csr.stamp:
+        cost = edge_costs(csr.attributes)
+        cch.customize(metric, cost, csr.stamp)
+    path = cch.path(metric, csr.node_index[start], csr.node_index[end])
+    if path is None:
+        # Only routes over infinite-cost edges remain; let the exact search decide
+        return csr.astar(start, end, cost if cost is not None else edge_costs(csr.attributes))
+    names = csr.node_names
+    return [names[i] for i in path]
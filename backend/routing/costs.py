@@ -0,0 +1,221 @@
+from collections import ChainMap
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Union
+
+import networkx as nx
+
+EdgeCost = Callable[[Mapping], float]
+
+# Preferences behind each routing profile
+PROFILE_PREFERENCES: Dict[str, Dict[str, bool]] = {
+    "safest": {"avoid_slope": True, "prefer_covered": True},
+    "fastest": {"avoid_slope": False, "prefer_covered": False},
+    "scenic": {"prefer_parks": True},
+}
+
+# Constraints behind each multi-modal mode
+MODE_PREFERENCES: Dict[str, Dict[str, bool]] = {
+    "wheelchair": {"avoid_slope": True, "prefer_covered": True, "avoid_stairs": True},
+    "walking": {"avoid_slope": False, "prefer_covered": False, "avoid_stairs": False},
+    "public_transit": {"prefer_transit": True, "avoid_stairs": True},
+}
+
+# Profile tweaks applied on top of a mode
+MODE_PROFILE_PREFERENCES: Dict[str, Dict[str, bool]] = {
+    "safest": {"prefer_covered": True},
+    "fastest": {"prefer_covered": False},
+    "scenic": {"prefer_parks": True},
+}
+
+
+class EdgeOverlay:
+    """
+    Copy-on-write view of a graph's edge attributes, for one request.
+    Reads fall through to the base graph; writes land in a small per-edge dict,
+    so a shared (even frozen) graph is never modified and nothing is copied up front.
+    It reads like the graph it wraps: overlay[u][v]['hazard_penalty'].
+
+    Writes set `untracked_changes`; a helper whose changes are fully described
+    by a G.graph entry (e.g. 'external_data_hash') may clear it, which keeps
+    routes on the overlay cacheable.
+    """
+
+    def __init__(self, G: nx.Graph):
+        """
+        Args:
+            G: networkx.Graph to layer on; it is only ever read
+        """
+        self.G = G
+        self.graph = ChainMap({}, G.graph)
+        self._edges: Dict[Hashable, Dict[str, Any]] = {}
+        self.untracked_changes = False
+
+    @classmethod
+    def of(cls, G: Union[nx.Graph, "EdgeOverlay"]) -> "EdgeOverlay":
+        """Wrap a graph in an empty overlay; an overlay is returned unchanged."""
+        return G if isinstance(G, EdgeOverlay) else cls(G)
+
+    def fork(self) -> "EdgeOverlay":
+        """New overlay with this one's changes, so further writes stay private to it."""
+        child = EdgeOverlay(self.G)
+        child.graph.maps[0].update(self.graph.maps[0])
+        child._edges = {key: dict(attrs) for key, attrs in self._edges.items()}
+        child.untracked_changes = self.untracked_changes
+        return child
+
+    def __getitem__(self, u: Hashable) -> "_AdjacencyView":
+        if u not in self.G:
+            raise KeyError(u)
+        return _AdjacencyView(self, u)
+
+    def __contains__(self, n: Hashable) -> bool:
+        return n in self.G
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.G)
+
+    def __len__(self) -> int:
+        return len(self.G)
+
+    def neighbors(self, n: Hashable) -> Iterator[Hashable]:
+        return self.G.neighbors(n)
+
+    def edges(self, nbunch: Any = None):
+        return self.G.edges(nbunch)
+
+    def is_directed(self) -> bool:
+        return self.G.is_directed()
+
+    def changed_edges(self) -> int:
+        """Number of edges carrying private changes."""
+        return len(self._edges)
+
+    def attrs(self, u: Hashable, v: Hashable, data: Optional[Mapping] = None) -> Mapping:
+        """Read-only merged attributes of edge (u, v)."""
+        base = self.G[u][v] if data is None else data
+        local = self._edges.get(self._key(u, v))
+        return base if local is None else ChainMap(local, base)
+
+    def weight(self, cost: Optional[EdgeCost] = None) -> Callable[[Hashable, Hashable, Mapping], float]:
+        """
+        Weight function for networkx shortest-path calls on overlay.G.
+        Args:
+            cost: maps merged edge attributes to a cost (defaults to the 'weight' attribute)
+        Returns:
+            Callable (u, v, data) -> cost
+        """
+        if cost is None:
+            cost = _stored_weight
+        edges = self._edges
+        key = self._key
+
+        def weight(u, v, d):
+            local = edges.get(key(u, v))
+            return cost(d if local is None else ChainMap(local, d))
+        return weight
+
+    def _key(self, u: Hashable, v: Hashable) -> Hashable:
+        return (u, v) if self.G.is_directed() else frozenset((u, v))
+
+
+class _AdjacencyView(Mapping):
+    """overlay[u]: neighbours of u, each mapping to writable edge attributes."""
+
+    def __init__(self, overlay: EdgeOverlay, u: Hashable):
+        self._overlay = overlay
+        self._u = u
+
+    def __getitem__(self, v: Hashable) -> "_EdgeAttributes":
+        overlay = self._overlay
+        base = overlay.G[self._u][v]
+        return _EdgeAttributes(overlay, overlay._key(self._u, v), base)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._overlay.G[self._u])
+
+    def __len__(self) -> int:
+        return len(self._overlay.G[self._u])
+
+
+class _EdgeAttributes(ChainMap):
+    """Edge attributes whose writes go to the overlay, never to the base graph."""
+
+    def __init__(self, overlay: EdgeOverlay, key: Hashable, base: Mapping):
+        local = overlay._edges.get(key)
+        super().__init__(local if local is not None else {}, base)
+        self._overlay = overlay
+        self._key = key
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        self._overlay._edges.setdefault(self._key, self.maps[0])
+        self._overlay.untracked_changes = True
+        super().__setitem__(name, value)
+
+
+def _stored_weight(d: Mapping) -> float:
+    return d.get('weight', 1)
+
+
+def hazard_cost(d: Mapping) -> float:
+    """Base cost plus hazard penalty."""
+    return d.get('base_cost', 1) + d.get('hazard_penalty', 0)
+
+
+def profile_cost(preferences: Dict[str, Any]) -> EdgeCost:
+    """
+    Edge cost for user preferences (avoid_slope, prefer_covered) on top of
+    base cost plus hazard penalty.
+    """
+    avoid_slope = preferences.get('avoid_slope')
+    prefer_covered = preferences.get('prefer_covered')
+
+    def cost(d: Mapping) -> float:
+        w = d.get('base_cost', 1) + d.get('hazard_penalty', 0)
+        if avoid_slope and d.get('slope', 0) > 0.05:
+            w = float('inf')
+        if prefer_covered and not d.get('covered', False):
+            w *= 1.5
+        return w
+    return cost
+
+
+def multi_modal_cost(preferences: Dict[str, Any]) -> EdgeCost:
+    """
+    Edge cost for multi-modal constraints (avoid_slope, avoid_stairs,
+    prefer_transit, prefer_parks, prefer_covered) on top of the edge weight.
+    Always starts from the stored weight, so repeated calls never compound.
+    """
+    avoid_slope = preferences.get('avoid_slope')
+    avoid_stairs = preferences.get('avoid_stairs')
+    prefer_transit = preferences.get('prefer_transit')
+    prefer_parks = preferences.get('prefer_parks')
+    prefer_covered = preferences.get('prefer_covered')
+
+    def cost(d: Mapping) -> float:
+        w = d['weight'] if 'weight' in d else hazard_cost(d)
+        # Wheelchair: avoid steep slopes and stairs
+        if avoid_slope and d.get('slope', 0) > 0.05:
+            w = float('inf')
+        if avoid_stairs and d.get('stairs', False):
+            w = float('inf')
+        # Public transit: prefer transit edges
+        if prefer_transit and not d.get('transit', False):
+            w *= 2
+        # Scenic: prefer parks
+        if prefer_parks and d.get('park', False):
+            w *= 0.8
+        # Covered: prefer covered paths
+        if prefer_covered and not d.get('covered', False):
+            w *= 1.5
+        return w
+    return cost
+
+
+def profile_preferences(profile: str) -> Dict[str, bool]:
+    return dict(PROFILE_PREFERENCES.get(profile, {}))
+
+
+def multi_modal_preferences(mode: str, profile: str) -> Dict[str, bool]:
+    prefs = dict(MODE_PREFERENCES.get(mode, {}))
+    prefs.update(MODE_PROFILE_PREFERENCES.get(profile, {}))
+    return prefs
@@ -0,0 +1,576 @@
+import heapq
+import json
+import math
+import numbers
+import os
+import shutil
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+import networkx as nx
+import numpy as np
+
+# Mean Earth radius in metres, for the A* haversine heuristic
+EARTH_RADIUS_M = 6371008.8
+
+# Predecessor marker for nodes the search has not reached
+UNSEEN = -2
+
+# On-disk graph artifact (see save / load_csr)
+ARTIFACT_VERSION = 1
+ARTIFACT_META = "meta.json"
+# Arrays hazards update in place: mapped copy-on-write so writes stay private to the process
+WRITABLE_ATTRIBUTES = ('hazard_penalty', 'weight')
+
+# Per-edge attributes kept as arrays, with the value used when an edge lacks one
+EDGE_ATTRIBUTES: Dict[str, Tuple[Any, Any]] = {
+    'base_cost': (np.float32, 1.0),
+    'hazard_penalty': (np.float32, 0.0),
+    'weight': (np.float32, np.nan),
+    'slope': (np.float32, 0.0),
+    'stairs': (np.bool_, False),
+    'covered': (np.bool_, False),
+    'park': (np.bool_, False),
+    'transit': (np.bool_, False),
+}
+
+
+class CSRGraph:
+    """
+    Array-backed routing graph in compressed sparse row form.
+    Nodes get integer ids; arcs from node i are targets[offsets[i]:offsets[i + 1]],
+    and arc_edge maps each arc to its edge so both directions of an undirected
+    edge share one slot in the per-edge attribute arrays.
+    """
+
+    def __init__(
+        self,
+        node_names: Optional[List[Hashable]],
+        lat: np.ndarray,
+        lng: np.ndarray,
+        offsets: np.ndarray,
+        targets: np.ndarray,
+        arc_edge: np.ndarray,
+        edge_u: np.ndarray,
+        edge_v: np.ndarray,
+        attributes: Dict[str, np.ndarray],
+        directed: bool = False
+    ):
+        if node_names is None:
+            # Nodes are named by their integer id (e.g. graphs loaded from an artifact)
+            self.node_names = range(len(lat))
+            self.node_index = _RangeIndex(len(lat))
+        else:
+            self.node_names = node_names
+            self.node_index = {name: i for i, name in enumerate(node_names)}
+        self.lat = lat
+        self.lng = lng
+        self.offsets = offsets
+        self.targets = targets
+        self.arc_edge = arc_edge
+        self.edge_u = edge_u
+        self.edge_v = edge_v
+        self.attributes = attributes
+        self.directed = directed
+        self.stamp: Optional[Tuple] = None
+        self._edge_index: Optional[Dict[Tuple[int, int], int]] = None
+        self._adjacency: Optional[Tuple[List[int], List[int]]] = None
+        self._edge_length: Optional[np.ndarray] = None
+        self.meta: Dict[str, Any] = {}
+
+    @classmethod
+    def from_networkx(cls, G: nx.Graph, nodes: Optional[Dict[Hashable, Tuple[float, float]]] = None) -> "CSRGraph":
+        """
+        Build from a networkx graph, e.g. the output of engine.load_graph.
+        Args:
+            G: networkx.Graph or DiGraph
+            nodes: dict mapping node names to (lat, lng); falls back to the 'pos' node attribute
+        Returns:
+            CSRGraph with the same topology and edge attributes
+        """
+        node_names = list(G.nodes())
+        index = {name: i for i, name in enumerate(node_names)}
+        n = len(node_names)
+        lat = np.full(n, np.nan)
+        lng = np.full(n, np.nan)
+        for i, name in enumerate(node_names):
+            pos = (nodes or {}).get(name) or G.nodes[name].get('pos')
+            if pos is not None:
+                lat[i], lng[i] = pos
+        edge_list = list(G.edges(data=True))
+        m = len(edge_list)
+        edge_u = np.fromiter((index[u] for u, _, _ in edge_list), dtype=np.int32, count=m)
+        edge_v = np.fromiter((index[v] for _, v, _ in edge_list), dtype=np.int32, count=m)
+        attributes = {}
+        for name, (dtype, default) in EDGE_ATTRIBUTES.items():
+            attributes[name] = np.fromiter(
+                (_value(d.get(name), default) for _, _, d in edge_list), dtype=dtype, count=m
+            )
+        return cls.from_edges(lat, lng, edge_u, edge_v, attributes, node_names, G.is_directed())
+
+    @classmethod
+    def from_edges(
+        cls,
+        lat: np.ndarray,
+        lng: np.ndarray,
+        edge_u: np.ndarray,
+        edge_v: np.ndarray,
+        attributes: Dict[str, np.ndarray],
+        node_names: Optional[List[Hashable]] = None,
+        directed: bool = False
+    ) -> "CSRGraph":
+        """
+        Build from flat edge arrays.
+        Args:
+            lat, lng: node coordinates, indexed by node id
+            edge_u, edge_v: endpoint node ids of each edge
+            attributes: per-edge arrays; missing EDGE_ATTRIBUTES get their defaults
+            node_names: names for node ids (None = the ids themselves)
+            directed: whether edges are one-way
+        """
+        n, m = len(lat), len(edge_u)
+        attributes = dict(attributes)
+        for name, (dtype, default) in EDGE_ATTRIBUTES.items():
+            if name not in attributes:
+                attributes[name] = np.full(m, default, dtype=dtype)
+        if directed:
+            src, dst, eid = edge_u, edge_v, np.arange(m, dtype=np.int32)
+        else:
+            src = np.concatenate([edge_u, edge_v])
+            dst = np.concatenate([edge_v, edge_u])
+            eid = np.concatenate([np.arange(m, dtype=np.int32)] * 2)
+        order = np.argsort(src, kind='stable')
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=offsets[1:])
+        return cls(node_names, np.asarray(lat, dtype=np.float64), np.asarray(lng, dtype=np.float64), offsets,
+                   dst[order].astype(np.int32), eid[order].astype(np.int32),
+                   np.asarray(edge_u, dtype=np.int32), np.asarray(edge_v, dtype=np.int32), attributes, directed)
+
+    def save(self, path: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Write the graph as a directory of flat .npy arrays plus meta.json,
+        replacing any previous artifact at path once it is complete.
+        Node names are not stored: a saved graph names its nodes by id.
+        Args:
+            path: artifact directory
+            meta: extra metadata to record (e.g. source file, bbox)
+        """
+        tmp = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        arrays = {
+            'lat': self.lat, 'lng': self.lng,
+            'offsets': self.offsets, 'targets': self.targets, 'arc_edge': self.arc_edge,
+            'edge_u': self.edge_u, 'edge_v': self.edge_v,
+        }
+        arrays.update({f"edge_{name}": values for name, values in self.attributes.items()})
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(values))
+        info = dict(meta or {})
+        info.update({
+            'format_version': ARTIFACT_VERSION,
+            'num_nodes': self.num_nodes,
+            'num_edges': self.num_edges,
+            'directed': self.directed,
+            'edge_attributes': sorted(self.attributes),
+        })
+        with open(os.path.join(tmp, ARTIFACT_META), 'w') as f:
+            json.dump(info, f, indent=2)
+        old = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old)
+        os.rename(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def to_networkx(self) -> Tuple[nx.Graph, Dict[Hashable, Tuple[float, float]]]:
+        """
+        Materialise a networkx graph (and nodes dict) with the same edges and attributes.
+        Boolean flags and zero slopes are only set where they differ from the default.
+        """
+        G = nx.DiGraph() if self.directed else nx.Graph()
+        names = self.node_names
+        nodes = {names[i]: (lat, lng) for i, (lat, lng) in enumerate(zip(self.lat.tolist(), self.lng.tolist()))}
+        G.add_nodes_from(nodes)
+        columns = {name: self.attributes[name].tolist() for name in EDGE_ATTRIBUTES}
+        edges = []
+        for e, (u, v) in enumerate(zip(self.edge_u.tolist(), self.edge_v.tolist())):
+            data = {'base_cost': columns['base_cost'][e]}
+            for name in ('hazard_penalty', 'slope'):
+                if columns[name][e]:
+                    data[name] = columns[name][e]
+            if not math.isnan(columns['weight'][e]):
+                data['weight'] = columns['weight'][e]
+            for name in ('stairs', 'covered', 'park', 'transit'):
+                if columns[name][e]:
+                    data[name] = True
+            edges.append((names[u], names[v], data))
+        G.add_edges_from(edges)
+        return G, nodes
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_names)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.edge_u)
+
+    def edge_id(self, u: Hashable, v: Hashable) -> int:
+        """Edge slot of (u, v) in the attribute arrays; KeyError if there is no such edge."""
+        if self._edge_index is None:
+            pairs = zip(self.edge_u.tolist(), self.edge_v.tolist())
+            index = {}
+            for e, (a, b) in enumerate(pairs):
+                index[(a, b)] = e
+                if not self.directed:
+                    index[(b, a)] = e
+            self._edge_index = index
+        return self._edge_index[(self.node_index[u], self.node_index[v])]
+
+    def set_edge_attributes(self, G: nx.Graph, edges: Iterable[Tuple[Hashable, Hashable]], names: Iterable[str] = ('hazard_penalty', 'weight')) -> None:
+        """Copy attributes of the given edges from G, e.g. after a hazard overlay update."""
+        names = list(names)
+        for u, v in edges:
+            e = self.edge_id(u, v)
+            data = G[u][v]
+            for name in names:
+                self.attributes[name][e] = _value(data.get(name), EDGE_ATTRIBUTES[name][1])
+
+    def attributes_with(self, overlay: Any = None) -> Dict[str, np.ndarray]:
+        """
+        Edge attribute arrays with an EdgeOverlay's private changes applied.
+        Arrays the overlay does not touch are shared, never copied.
+        """
+        changes = getattr(overlay, '_edges', None)
+        if not changes:
+            return self.attributes
+        arrays = dict(self.attributes)
+        copied = set()
+        for key, attrs in changes.items():
+            pair = tuple(key)
+            u, v = pair if len(pair) == 2 else pair * 2  # a self-loop's frozenset has one node
+            e = self.edge_id(u, v)
+            for name, value in attrs.items():
+                if name not in arrays:
+                    continue
+                if name not in copied:
+                    arrays[name] = arrays[name].copy()
+                    copied.add(name)
+                arrays[name][e] = _value(value, EDGE_ATTRIBUTES[name][1])
+        return arrays
+
+    def edge_length(self) -> np.ndarray:
+        """Great-circle length of every edge in metres (NaN where positions are unknown)."""
+        if self._edge_length is None:
+            self._edge_length = haversine(self.lat[self.edge_u], self.lng[self.edge_u],
+                                          self.lat[self.edge_v], self.lng[self.edge_v])
+        return self._edge_length
+
+    def dijkstra(self, source: Hashable, target: Hashable, cost: np.ndarray) -> List[Hashable]:
+        """
+        Shortest path by edge cost using a binary heap.
+        Args:
+            source, target: node names
+            cost: float array with one cost per edge (inf allowed, NaN/negative not)
+        Returns:
+            List of node names from source to target
+        Raises:
+            nx.NodeNotFound, nx.NetworkXNoPath
+        """
+        return self._search(source, target, cost, 0.0)
+
+    def astar(self, source: Hashable, target: Hashable, cost: np.ndarray) -> List[Hashable]:
+        """
+        A* with a haversine heuristic scaled to stay admissible: the heuristic is
+        the straight-line distance times the lowest cost per metre of any edge.
+        Falls back to plain Dijkstra when positions are missing.
+        """
+        return self._search(source, target, cost, self.cost_per_metre(cost))
+
+    def shortest_paths(self, source: Hashable, targets: Iterable[Hashable], cost: np.ndarray) -> Dict[Hashable, List[Hashable]]:
+        """
+        Paths from one source to many targets out of a single Dijkstra tree,
+        grown only until every target is settled.
+        Returns:
+            Dict mapping each reachable target to its path (unknown or unreachable targets are left out)
+        Raises:
+            nx.NodeNotFound: if source is not in the graph
+        """
+        if source not in self.node_index:
+            raise nx.NodeNotFound(f"Source {source} is not in G")
+        wanted = {self.node_index[t] for t in targets if t in self.node_index}
+        arc_cost = np.asarray(cost, dtype=np.float64)[self.arc_edge].tolist()
+        prev, _ = self._grow(self.node_index[source], wanted, arc_cost, [0.0] * self.num_nodes)
+        return {self.node_names[t]: self._path(prev, t) for t in wanted if prev[t] != UNSEEN}
+
+    def cost_matrix(self, sources: Sequence[Hashable], targets: Sequence[Hashable], cost: np.ndarray) -> np.ndarray:
+        """
+        Path costs from every source to every target, one multi-target Dijkstra per source.
+        Returns:
+            float array of shape (len(sources), len(targets)); inf where unreachable or unknown
+        """
+        out = np.full((len(sources), len(targets)), np.inf)
+        columns: Dict[int, List[int]] = {}
+        for j, t in enumerate(targets):
+            if t in self.node_index:
+                columns.setdefault(self.node_index[t], []).append(j)
+        arc_cost = np.asarray(cost, dtype=np.float64)[self.arc_edge].tolist()
+        zero = [0.0] * self.num_nodes
+        for i, source in enumerate(sources):
+            if source not in self.node_index:
+                continue
+            prev, dist = self._grow(self.node_index[source], set(columns), arc_cost, zero)
+            for t, js in columns.items():
+                if prev[t] != UNSEEN:
+                    out[i, js] = dist[t]
+        return out
+
+    def costs_within(self, source: Hashable, cost: np.ndarray, limit: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Bounded single-source Dijkstra: every node whose path cost from source is at most limit.
+        Unlike the path searches, infinite-cost edges are never used.
+        Returns:
+            (node ids, path costs) arrays, in the order the nodes were settled
+        Raises:
+            nx.NodeNotFound: if source is not in the graph
+        """
+        if source not in self.node_index:
+            raise nx.NodeNotFound(f"Source {source} is not in G")
+        offsets, targets = self._adjacency_lists()
+        arc_cost = np.asarray(cost, dtype=np.float64)[self.arc_edge].tolist()
+        s = self.node_index[source]
+        dist = {s: 0.0}
+        settled: List[int] = []
+        costs: List[float] = []
+        heap = [(0.0, s)]
+        push, pop = heapq.heappush, heapq.heappop
+        while heap:
+            d, u = pop(heap)
+            if d > dist[u]:
+                continue
+            settled.append(u)
+            costs.append(d)
+            for i in range(offsets[u], offsets[u + 1]):
+                nd = d + arc_cost[i]
+                v = targets[i]
+                if nd <= limit and nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    push(heap, (nd, v))
+        return np.array(settled, dtype=np.int64), np.array(costs, dtype=np.float64)
+
+    def cost_per_metre(self, cost: np.ndarray) -> float:
+        """Largest factor that keeps distance * factor a lower bound on path cost."""
+        length = self.edge_length()
+        if len(length) == 0 or np.isnan(length).any():
+            return 0.0
+        positive = length > 0
+        if not positive.any():
+            return 0.0
+        ratio = np.min(np.asarray(cost, dtype=np.float64)[positive] / length[positive])
+        if not np.isfinite(ratio) or ratio <= 0:
+            return 0.0
+        # Edges of zero length cost at least 0, so they never break admissibility
+        return float(ratio) * (1 - 1e-9)
+
+    def _search(self, source: Hashable, target: Hashable, cost: np.ndarray, scale: float) -> List[Hashable]:
+        if source not in self.node_index:
+            raise nx.NodeNotFound(f"Source {source} is not in G")
+        if target not in self.node_index:
+            raise nx.NodeNotFound(f"Target {target} is not in G")
+        s, t = self.node_index[source], self.node_index[target]
+        arc_cost = np.asarray(cost, dtype=np.float64)[self.arc_edge].tolist()
+        if scale > 0:
+            # One vectorised pass beats a Python haversine per heap push
+            h = (scale * haversine(self.lat, self.lng, self.lat[t], self.lng[t])).tolist()
+        else:
+            h = [0.0] * self.num_nodes
+        prev, _ = self._grow(s, {t}, arc_cost, h)
+        if prev[t] == UNSEEN:
+            raise nx.NetworkXNoPath(f"No path between {source} and {target}.")
+        return self._path(prev, t)
+
+    def _grow(self, s: int, stop: Set[int], arc_cost: List[float], h: List[float]) -> Tuple[List[int], List[float]]:
+        # Heap search from s until every node in stop is settled; returns predecessors and distances
+        offsets, targets = self._adjacency_lists()
+        remaining = set(stop)
+        # Flat per-node state; prev is UNSEEN until a node is first reached
+        inf = math.inf
+        dist = [inf] * self.num_nodes
+        prev = [UNSEEN] * self.num_nodes
+        done = bytearray(self.num_nodes)
+        dist[s] = 0.0
+        prev[s] = -1
+        heap = [(h[s], 0.0, s)]
+        push, pop = heapq.heappush, heapq.heappop
+        while heap and remaining:
+            _, d, u = pop(heap)
+            if done[u]:
+                continue
+            remaining.discard(u)
+            if not remaining:
+                break
+            done[u] = 1
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                if done[v]:
+                    continue
+                nd = d + arc_cost[i]
+                # Infinite-cost edges are still usable as a last resort, as in networkx
+                if nd < dist[v] or prev[v] == UNSEEN:
+                    dist[v] = nd
+                    prev[v] = u
+                    push(heap, (nd + h[v], nd, v))
+        return prev, dist
+
+    def _path(self, prev: List[int], t: int) -> List[Hashable]:
+        path = []
+        node = t
+        while node != -1:
+            path.append(self.node_names[node])
+            node = prev[node]
+        path.reverse()
+        return path
+
+    def _adjacency_lists(self) -> Tuple[List[int], List[int]]:
+        # Plain lists index several times faster than NumPy scalars in the search loop
+        if self._adjacency is None:
+            self._adjacency = (self.offsets.tolist(), self.targets.tolist())
+        return self._adjacency
+
+
+class _RangeIndex:
+    """node_index for graphs whose node names are their integer ids (or those ids as decimal strings)."""
+
+    def __init__(self, n: int, strings: bool = False):
+        self.n = n
+        self.strings = strings
+
+    def __contains__(self, name: Any) -> bool:
+        if self.strings:
+            # Only the canonical spelling, so every node has exactly one name
+            return isinstance(name, str) and name.isascii() and name.isdigit() and name == str(int(name)) and int(name) < self.n
+        return isinstance(name, numbers.Integral) and 0 <= name < self.n
+
+    def __getitem__(self, name: Any) -> int:
+        if name not in self:
+            raise KeyError(name)
+        return int(name)
+
+    def __len__(self) -> int:
+        return self.n
+
+
+class _IdNames(Sequence):
+    """node_names for graphs whose node names are their integer ids as decimal strings."""
+
+    def __init__(self, n: int):
+        self.n = n
+
+    def __getitem__(self, i: Any) -> Any:
+        if isinstance(i, slice):
+            return [str(j) for j in range(self.n)[i]]
+        return str(range(self.n)[i])
+
+    def __len__(self) -> int:
+        return self.n
+
+
+def load_csr(path: str, mmap: bool = True, string_names: bool = False) -> CSRGraph:
+    """
+    Open a graph artifact written by CSRGraph.save (see build_graph.py).
+    With mmap=True the arrays are memory-mapped rather than read: startup does not
+    depend on graph size and workers share the page-cached file. Topology is mapped
+    read-only; hazard_penalty and weight are mapped copy-on-write so hazard updates
+    stay private to the process.
+    Args:
+        path: artifact directory
+        mmap: memory-map the arrays instead of loading them
+        string_names: name nodes '0', '1', ... instead of 0, 1, ...
+    Returns:
+        CSRGraph whose node names are integer ids (or their decimal strings)
+    Raises:
+        ValueError: if the artifact format version is not supported
+    """
+    with open(os.path.join(path, ARTIFACT_META)) as f:
+        meta = json.load(f)
+    if meta.get('format_version') != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported graph artifact version {meta.get('format_version')} in {path}")
+
+    def array(name, writable=False):
+        mode = ('c' if writable else 'r') if mmap else None
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+
+    attributes = {name: array(f"edge_{name}", name in WRITABLE_ATTRIBUTES) for name in meta['edge_attributes']}
+    csr = CSRGraph(
+        None, array('lat'), array('lng'), array('offsets'), array('targets'), array('arc_edge'),
+        array('edge_u'), array('edge_v'), attributes, meta.get('directed', False)
+    )
+    csr.meta = meta
+    if string_names:
+        csr.node_names, csr.node_index = _IdNames(csr.num_nodes), _RangeIndex(csr.num_nodes, strings=True)
+    return csr
+
+
+def haversine(lat1: Any, lng1: Any, lat2: Any, lng2: Any) -> Any:
+    """Great-circle distance in metres between (lat, lng) points in degrees; works on arrays."""
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _value(value: Any, default: Any) -> Any:
+    return default if value is None else value
+
+
+def profile_costs(attributes: Dict[str, np.ndarray], preferences: Dict[str, Any]) -> np.ndarray:
+    """Vectorised costs.profile_cost over all edges."""
+    w = attributes['base_cost'].astype(np.float64) + attributes['hazard_penalty']
+    if preferences.get('avoid_slope'):
+        w[attributes['slope'] > 0.05] = np.inf
+    if preferences.get('prefer_covered'):
+        w[~attributes['covered']] *= 1.5
+    return w
+
+
+def multi_modal_costs(attributes: Dict[str, np.ndarray], preferences: Dict[str, Any]) -> np.ndarray:
+    """Vectorised costs.multi_modal_cost over all edges."""
+    stored = attributes['weight'].astype(np.float64)
+    w = np.where(np.isnan(stored), attributes['base_cost'].astype(np.float64) + attributes['hazard_penalty'], stored)
+    if preferences.get('avoid_slope'):
+        w[attributes['slope'] > 0.05] = np.inf
+    if preferences.get('avoid_stairs'):
+        w[attributes['stairs']] = np.inf
+    if preferences.get('prefer_transit'):
+        w[~attributes['transit']] *= 2
+    if preferences.get('prefer_parks'):
+        w[attributes['park']] *= 0.8
+    if preferences.get('prefer_covered'):
+        w[~attributes['covered']] *= 1.5
+    return w
+
+
+def weighted_costs(attributes: Dict[str, np.ndarray], base_cost_weight: float = 1.0, hazard_penalty_weight: float = 1.0) -> np.ndarray:
+    """Vectorised engine.compute_route cost over all edges."""
+    return attributes['base_cost'].astype(np.float64) * base_cost_weight + attributes['hazard_penalty'].astype(np.float64) * hazard_penalty_weight
+
+
+def csr_graph(G: Any, nodes: Optional[Dict[Hashable, Tuple[float, float]]] = None) -> CSRGraph:
+    """
+    Get the CSRGraph cached on G.graph, building one if missing or stale.
+    A cached CSR is reused while G's (version, hazard_epoch) stamp matches; graphs
+    without a version are rebuilt on every call, since their edges may have changed.
+    Args:
+        G: networkx.Graph or EdgeOverlay (its base graph is used)
+        nodes: dict mapping node names to (lat, lng) (optional)
+    """
+    G = getattr(G, 'G', G)
+    stamp = None if G.graph.get('version') is None else (G.graph['version'], G.graph.get('hazard_epoch'))
+    csr = G.graph.get('csr')
+    if csr is not None and stamp is not None and csr.stamp == stamp:
+        return csr
+    if nodes is None and G.graph.get('spatial_index') is not None:
+        nodes = G.graph['spatial_index'].node_positions
+    csr = CSRGraph.from_networkx(G, nodes)
+    csr.stamp = stamp
+    if stamp is not None:
+        G.graph['csr'] = csr
+    return csr
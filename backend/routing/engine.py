@@ -1,14 +1,30 @@
 import networkx as nx
 import json
-from typing import Tuple, List, Dict, Any
+import os
+from typing import Tuple, List, Dict, Any, Optional
 
-def load_graph() -> Tuple[nx.Graph, Dict[str, Tuple[float, float]]]:
+try:
+    from .annotate import RouteAnnotator
+    from .cch import CCH_DIR, cch_route, load_cch
+    from .csr import csr_graph, load_csr, weighted_costs
+    from .spatial import DEFAULT_THRESHOLD, HazardIndex, graph_index
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from annotate import RouteAnnotator
+    from cch import CCH_DIR, cch_route, load_cch
+    from csr import csr_graph, load_csr, weighted_costs
+    from spatial import DEFAULT_THRESHOLD, HazardIndex, graph_index
+
+def load_graph(graph_file: Optional[str] = None) -> Tuple[nx.Graph, Dict[str, Tuple[float, float]]]:
     """
-    Load a sample accessibility graph with hardcoded nodes and edges.
+    Load the accessibility graph: a prebuilt artifact if given, else the hardcoded sample.
+    Args:
+        graph_file: artifact directory written by build_graph.py (optional)
     Returns:
         G: networkx.Graph object
         nodes: dict mapping node names to (lat, lng) tuples
     """
+    if graph_file:
+        return load_graph_artifact(graph_file)
     G = nx.Graph()
     nodes = {
         'A': (1.290270, 103.851959),
@@ -32,6 +48,25 @@ def load_graph() -> Tuple[nx.Graph, Dict[str, Tuple[float, float]]]:
         G.add_edge(u, v, base_cost=cost)
     return G, nodes
 
+def load_graph_artifact(graph_file: str) -> Tuple[nx.Graph, Dict[str, Tuple[float, float]]]:
+    """
+    Load a graph artifact built by build_graph.py. Its arrays are memory-mapped
+    and attached as G.graph['csr'], so the csr engine routes on the shared page
+    cache; the networkx view is materialised for the hazard overlay and features.
+    A contraction hierarchy saved with it (build_graph.py --cch) is attached as
+    G.graph['cch'] for the cch engine, unless it was built for other topology.
+    Nodes are named by their integer ids as strings ('0', '1', ...), so they
+    pass through the API's node fields like the sample graph's names.
+    """
+    csr = load_csr(graph_file, string_names=True)
+    G, nodes = csr.to_networkx()
+    G.graph['csr'] = csr
+    if os.path.isdir(os.path.join(graph_file, CCH_DIR)):
+        cch = load_cch(os.path.join(graph_file, CCH_DIR))
+        if cch.matches(csr):
+            G.graph['cch'] = cch
+    return G, nodes
+
 # Map hazards to edges (simple proximity for demo)
 def apply_hazards(
     G: nx.Graph,
@@ -56,9 +91,7 @@ def apply_hazards(
     Returns:
         G: updated graph with hazard_penalty on edges
     """
-    def is_near(p: Tuple[float, float], c: Tuple[float, float], threshold: float = proximity_threshold) -> bool:
-        """Check if point p is near coordinates c (approx. 5m)."""
-        return abs(p[0] - c[1]) < threshold and abs(p[1] - c[0]) < threshold
+    index = graph_index(G, nodes, proximity_threshold)
 
     # Reset all hazard penalties and ensure 'weight' is initialized
     for u, v in G.edges():
@@ -66,16 +99,13 @@ def apply_hazards(
         base_cost = G[u][v].get('base_cost', 1)
         G[u][v]['weight'] = base_cost
 
-    # Integrate all hazards from GeoJSON
+    # Integrate all hazards from GeoJSON, visiting only edges near each hazard
     for feature in hazards.get('features', []):
         coords = feature['geometry']['coordinates']
         confidence = feature['properties'].get('confidence', 1.0) * confidence_weight
         severity = feature['properties'].get('severity', 1.0) * severity_weight
-        for u, v in G.edges():
-            u_pos = nodes[u]
-            v_pos = nodes[v]
-            if is_near(u_pos, coords) or is_near(v_pos, coords):
-                G[u][v]['hazard_penalty'] += confidence * severity * hazard_weight
+        for u, v in index.edges_near(coords[1], coords[0], proximity_threshold):
+            G[u][v]['hazard_penalty'] += confidence * severity * hazard_weight
     # After applying hazards, update 'weight' to include hazard_penalty
     for u, v in G.edges():
         base_cost = G[u][v].get('base_cost', 1)
@@ -89,7 +119,8 @@ def compute_route(
     start: str,
     end: str,
     base_cost_weight: float = 1.0,
-    hazard_penalty_weight: float = 1.0
+    hazard_penalty_weight: float = 1.0,
+    engine: str = "networkx"
 ) -> List[str]:
     """
     Compute the optimal route using Dijkstra's algorithm, considering hazard penalties.
@@ -100,16 +131,26 @@ def compute_route(
         end: end node name
         base_cost_weight: multiplier for base cost
         hazard_penalty_weight: multiplier for hazard penalty
+        engine: 'networkx' (dict-of-dict Dijkstra), 'csr' (A* on the array-backed CSRGraph)
+            or 'cch' (contraction hierarchy queries, see cch.py)
     Returns:
         path: list of node names representing the route
     Raises:
         nx.NetworkXNoPath: if no path exists
     """
-    for u, v in G.edges():
-        cost = G[u][v].get('base_cost', 1) * base_cost_weight + G[u][v].get('hazard_penalty', 0) * hazard_penalty_weight
-        G[u][v]['weight'] = cost
+    if engine == "csr":
+        csr = csr_graph(G)
+        return csr.astar(start, end, weighted_costs(csr.attributes, base_cost_weight, hazard_penalty_weight))
+    if engine == "cch":
+        return cch_route(G, start, end, ('weighted', base_cost_weight, hazard_penalty_weight),
+                         lambda attributes: weighted_costs(attributes, base_cost_weight, hazard_penalty_weight))
+    if engine != "networkx":
+        raise ValueError(f"Unknown routing engine '{engine}'")
+    # Cost is computed per call, so G (possibly shared) is never written
+    def cost(u, v, d):
+        return d.get('base_cost', 1) * base_cost_weight + d.get('hazard_penalty', 0) * hazard_penalty_weight
     try:
-        path = nx.dijkstra_path(G, start, end, weight='weight')
+        path = nx.dijkstra_path(G, start, end, weight=cost)
     except nx.NetworkXNoPath as e:
         raise e
     return path
@@ -118,22 +159,23 @@ def compute_route(
 def get_route_hazards(
     path: List[str],
     nodes: Dict[str, Tuple[float, float]],
-    hazards: Dict[str, Any]
+    hazards: Dict[str, Any],
+    index: Optional[HazardIndex] = None,
+    proximity_threshold: float = DEFAULT_THRESHOLD
 ) -> List[Dict[str, Any]]:
     """
-    Get hazards near the computed route.
+    Get hazards near the computed route, from one corridor query along its polyline
+    (see annotate.RouteAnnotator, which also gives the per-node hazards).
     Args:
         path: list of node names in the route
         nodes: dict mapping node names to (lat, lng)
         hazards: GeoJSON dict with hazard features
+        index: prebuilt HazardIndex over `hazards` (optional)
+        proximity_threshold: how close a hazard must be to the route
     Returns:
-        List of hazard property dicts near the route
+        List of hazard property dicts near the route, one per hazard id in the order
+        they are passed, each with 'distance_along_route' in metres
     """
-    route_hazards = []
-    for feature in hazards.get('features', []):
-        coords = feature['geometry']['coordinates']
-        for node in path:
-            pos = nodes[node]
-            if abs(pos[0] - coords[1]) < 0.00005 and abs(pos[1] - coords[0]) < 0.00005:
-                route_hazards.append(feature['properties'])
-    return route_hazards
+    if index is None:
+        index = HazardIndex(hazards, proximity_threshold)
+    return RouteAnnotator(nodes, index, proximity_threshold).annotate(path)[1]
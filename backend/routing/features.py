@@ -2,10 +2,32 @@ import logging
 import networkx as nx
 from typing import Any, Dict, List, Tuple
 
-
-route_cache = {}
-
-def get_route_with_external_data(G: nx.Graph, nodes: dict, start: str, end: str, profile: str = "safest", external_data: dict = None) -> list:
+try:
+    from .alternatives import alternative_routes
+    from .cache import LRUCache, external_data_hash, route_cache_key
+    from .cch import cch_route
+    from .costs import EdgeOverlay, multi_modal_cost, multi_modal_preferences, profile_cost, profile_preferences
+    from .csr import csr_graph, multi_modal_costs, profile_costs
+    from .heatmap import RollingMean, node_scores
+    from .spatial import DEFAULT_THRESHOLD, HazardIndex, graph_index
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from alternatives import alternative_routes
+    from cache import LRUCache, external_data_hash, route_cache_key
+    from cch import cch_route
+    from costs import EdgeOverlay, multi_modal_cost, multi_modal_preferences, profile_cost, profile_preferences
+    from csr import csr_graph, multi_modal_costs, profile_costs
+    from heatmap import RollingMean, node_scores
+    from spatial import DEFAULT_THRESHOLD, HazardIndex, graph_index
+
+# Shared by get_route_with_profile and get_route_multi_modal. Keys include the
+# graph version, hazard epoch and external data hash, so changes never serve stale paths.
+route_cache = LRUCache(maxsize=4096, ttl=600)
+
+# Routing engines: networkx dict-of-dict Dijkstra, A* over the array-backed CSRGraph,
+# or queries on a contraction hierarchy customized per profile (see cch.py)
+ENGINES = ("networkx", "csr", "cch")
+
+def get_route_with_external_data(G: nx.Graph, nodes: dict, start: str, end: str, profile: str = "safest", external_data: dict = None, engine: str = "networkx") -> list:
     """
     Compute a route using all available data, including external APIs/sensors (e.g., crowd, weather).
     Args:
@@ -15,43 +37,51 @@ def get_route_with_external_data(G: nx.Graph, nodes: dict, start: str, end: str,
         end: end node name
         profile: routing profile (e.g., 'safest', 'fastest')
         external_data: dict of external data (optional)
+        engine: 'networkx', 'csr' or 'cch'
     Returns:
         path: list of node names representing the route
     """
     if external_data:
         G = merge_external_data(G, nodes, external_data)
-    return get_route_with_profile(G, start, end, profile)
+    return get_route_with_profile(G, start, end, profile, engine=engine)
 
-def merge_external_data(G: nx.Graph, nodes: dict, external_data: dict) -> nx.Graph:
+def merge_external_data(G: nx.Graph, nodes: dict, external_data: dict) -> EdgeOverlay:
     """
     Merge external API/sensor data into the graph for routing/hazard enrichment.
     Args:
-        G: networkx.Graph object
+        G: networkx.Graph object or EdgeOverlay (left unchanged)
         nodes: dict mapping node names to (lat, lng)
         external_data: dict with external info (e.g., {'crowd_density': {...}, 'weather': {...}})
     Returns:
-        Updated graph with external data applied
+        EdgeOverlay over G with external data applied
     """
+    G = EdgeOverlay.of(G).fork()
+    untracked = G.untracked_changes
+    changed = set()
     # Example: crowd density increases hazard penalty
     crowd_density = external_data.get('crowd_density', {})
     for node, density in crowd_density.items():
-        for u, v in G.edges():
-            if u == node or v == node:
-                if 'hazard_penalty' not in G[u][v]:
-                    G[u][v]['hazard_penalty'] = 0
-                G[u][v]['hazard_penalty'] += density * 10
+        if node not in G:
+            continue
+        for u, v in G.edges(node):
+            G[u][v]['hazard_penalty'] = G[u][v].get('hazard_penalty', 0) + density * 10
+            changed.add((u, v))
     # Example: weather alerts (rain) increase hazard penalty
     weather = external_data.get('weather', {})
     if weather.get('rain', False):
         for u, v in G.edges():
-            if 'hazard_penalty' not in G[u][v]:
-                G[u][v]['hazard_penalty'] = 0
-            G[u][v]['hazard_penalty'] += 25
+            G[u][v]['hazard_penalty'] = G[u][v].get('hazard_penalty', 0) + 25
+            changed.add((u, v))
     # After merging external data, update 'weight' to include hazard_penalty
-    for u, v in G.edges():
-        base_cost = G[u][v].get('base_cost', 1)
-        hazard_penalty = G[u][v].get('hazard_penalty', 0)
-        G[u][v]['weight'] = base_cost + hazard_penalty
+    for u, v in changed:
+        G[u][v]['weight'] = G[u][v].get('base_cost', 1) + G[u][v]['hazard_penalty']
+    # Record what was merged so cached routes for the unmerged graph are not reused
+    digest = external_data_hash(external_data)
+    if digest is not None:
+        previous = G.graph.get('external_data_hash')
+        G.graph['external_data_hash'] = digest if previous is None else external_data_hash({'base': previous, 'merged': digest})
+        # The hash fully describes these changes, so routes stay cacheable
+        G.untracked_changes = untracked
     return G
 
 def route_usage_stats(route_history: list) -> dict:
@@ -92,25 +122,22 @@ def accessibility_trend_stats(heatmap_history: list) -> dict:
     Returns:
         Dict with average accessibility per node
     """
-    if not heatmap_history:
-        return {}
-    node_scores = {}
+    trend = RollingMean()
     for heatmap in heatmap_history:
-        for node, score in heatmap.items():
-            node_scores.setdefault(node, []).append(score)
-    avg_scores = {node: sum(scores)/len(scores) for node, scores in node_scores.items()}
-    return avg_scores
+        trend.add(heatmap)
+    return trend.means()
 
-def process_realtime_feedback(G: nx.Graph, path: list, feedback: list) -> nx.Graph:
+def process_realtime_feedback(G: nx.Graph, path: list, feedback: list) -> EdgeOverlay:
     """
     Integrate real-time user feedback into route scoring and hazard penalties.
     Args:
-        G: networkx.Graph object
+        G: networkx.Graph object or EdgeOverlay (left unchanged)
         path: list of node names in the route
         feedback: list of dicts, e.g. [{'node': 'B', 'hazard_id': 'h1', 'resolved': True, 'severity': 0.5}]
     Returns:
-        Updated graph with feedback applied to hazard penalties
+        EdgeOverlay over G with feedback applied to hazard penalties
     """
+    G = EdgeOverlay.of(G).fork()
     for entry in feedback:
         node = entry.get('node')
         resolved = entry.get('resolved', False)
@@ -183,50 +210,49 @@ def instant_feedback_loop(path: list, hazards: dict, nodes: dict) -> list:
     Returns a list of feedback prompts for each hazard encountered on the path.
     """
     feedback = []
+    index = HazardIndex(hazards)
     for n in path:
-        for feature in hazards.get('features', []):
-            coords = feature['geometry']['coordinates']
-            if abs(nodes[n][0] - coords[1]) < 0.00005 and abs(nodes[n][1] - coords[0]) < 0.00005:
-                feedback.append({
-                    'node': n,
-                    'hazard_id': feature['properties']['id'],
-                    'prompt': f"Did you encounter hazard '{feature['properties']['type']}' at {n}? Confirm, update, or mark as resolved."
-                })
+        for feature in index.near_node(nodes[n]):
+            feedback.append({
+                'node': n,
+                'hazard_id': feature['properties']['id'],
+                'prompt': f"Did you encounter hazard '{feature['properties']['type']}' at {n}? Confirm, update, or mark as resolved."
+            })
     return feedback
 
-def integrate_crowdsourced_hazards(G: nx.Graph, nodes: dict, hazards: dict, user_reports: list) -> nx.Graph:
+def integrate_crowdsourced_hazards(G: nx.Graph, nodes: dict, hazards: dict, user_reports: list) -> EdgeOverlay:
     """
     Integrate crowdsourced hazard and feedback reports into the graph.
     Args:
-        G: networkx.Graph object
+        G: networkx.Graph object or EdgeOverlay (left unchanged)
         nodes: dict mapping node names to (lat, lng)
         hazards: GeoJSON dict with hazard features
         user_reports: list of dicts with user hazard reports (e.g., [{'node': 'B', 'type': 'curb', 'severity': 2}])
     Returns:
-        Updated graph with user-reported hazard penalties
+        EdgeOverlay over G with user-reported hazard penalties
     """
+    G = EdgeOverlay.of(G).fork()
+    index = graph_index(G.G, nodes)
     # Apply existing hazards first
     for feature in hazards.get('features', []):
         coords = feature['geometry']['coordinates']
         severity = feature['properties'].get('severity', 1.0)
-        for u, v in G.edges():
-            u_pos = nodes[u]
-            v_pos = nodes[v]
-            if abs(u_pos[0] - coords[1]) < 0.00005 or abs(v_pos[0] - coords[1]) < 0.00005:
-                if 'hazard_penalty' not in G[u][v]:
-                    G[u][v]['hazard_penalty'] = 0
-                G[u][v]['hazard_penalty'] += severity * 100
+        for u, v in index.edges_near(coords[1], coords[0], DEFAULT_THRESHOLD):
+            if 'hazard_penalty' not in G[u][v]:
+                G[u][v]['hazard_penalty'] = 0
+            G[u][v]['hazard_penalty'] += severity * 100
     # Integrate user reports
     for report in user_reports:
         node = report.get('node')
         hazard_type = report.get('type', 'generic')
         severity = report.get('severity', 1.0)
-        for u, v in G.edges():
-            if u == node or v == node:
-                if 'hazard_penalty' not in G[u][v]:
-                    G[u][v]['hazard_penalty'] = 0
-                G[u][v]['hazard_penalty'] += severity * 50  # User reports weighted less than official hazards
-                G[u][v]['crowdsourced'] = True
+        if node not in G:
+            continue
+        for u, v in G.edges(node):
+            if 'hazard_penalty' not in G[u][v]:
+                G[u][v]['hazard_penalty'] = 0
+            G[u][v]['hazard_penalty'] += severity * 50  # User reports weighted less than official hazards
+            G[u][v]['crowdsourced'] = True
     return G
 
 def get_collaborative_route(G: nx.Graph, nodes: dict, start: str, end: str, hazards: dict, user_reports: list, profile: str = "safest") -> list:
@@ -246,53 +272,98 @@ def get_collaborative_route(G: nx.Graph, nodes: dict, start: str, end: str, haza
     G = integrate_crowdsourced_hazards(G, nodes, hazards, user_reports)
     return get_route_with_profile(G, start, end, profile)
 
-def get_route_with_profile(G: nx.Graph, start: str, end: str, profile: str = "safest") -> list:
+def get_route_with_profile(G: nx.Graph, start: str, end: str, profile: str = "safest", engine: str = "networkx") -> list:
     """
     Get route based on selected profile: 'fastest', 'safest', 'scenic', etc.
-    Adjusts weights and preferences accordingly.
-    Caches result for repeated queries.
-    """
-    cache_key = f"{start}-{end}-{profile}"
-    if cache_key in route_cache:
-        logging.info(f"Cache hit for {cache_key}")
-        return route_cache[cache_key]
-    prefs = {}
-    if profile == "safest":
-        prefs = {"avoid_slope": True, "prefer_covered": True}
-    elif profile == "fastest":
-        prefs = {"avoid_slope": False, "prefer_covered": False}
-    elif profile == "scenic":
-        prefs = {"prefer_parks": True}
-    G = apply_user_preferences(G, prefs)
-    # Ensure 'weight' is set on all edges before running Dijkstra
-    for u, v in G.edges():
-        base_cost = G[u][v].get('base_cost', 1)
-        hazard_penalty = G[u][v].get('hazard_penalty', 0)
-        G[u][v]['weight'] = base_cost + hazard_penalty
+    Costs follow the profile's preferences; G (a graph or EdgeOverlay) is not modified.
+    engine='csr' runs A* on the array-backed CSRGraph instead of networkx;
+    engine='cch' queries a contraction hierarchy customized for the profile.
+    Caches result for repeated queries on versioned graphs (see cache.route_cache_key).
+    """
+    _check_engine(engine)
+    cache_key = route_cache_key(G, start, end, profile)
+    if cache_key is not None:
+        cached = route_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Cache hit for {cache_key}")
+            return list(cached)
+    # Costs come from a per-request weight function; G itself is never written
+    costs = EdgeOverlay.of(G)
+    prefs = profile_preferences(profile)
     try:
-        path = list(nx.dijkstra_path(G, start, end, weight='weight'))
-        route_cache[cache_key] = path
-        logging.info(f"Route computed for {cache_key}")
+        if engine == "csr":
+            csr = csr_graph(costs)
+            path = csr.astar(start, end, profile_costs(csr.attributes_with(costs), prefs))
+        elif engine == "cch":
+            path = cch_route(costs, start, end, ('profile', profile), lambda attributes: profile_costs(attributes, prefs))
+        else:
+            path = list(nx.dijkstra_path(costs.G, start, end, weight=costs.weight(profile_cost(prefs))))
+        if cache_key is not None:
+            route_cache.put(cache_key, tuple(path))
+        logging.info(f"Route computed for {start}-{end}-{profile}")
         return path
     except Exception as e:
-        logging.error(f"Routing error for {cache_key}: {e}")
+        logging.error(f"Routing error for {start}-{end}-{profile}: {e}")
         return [f"No route found: {e}"]
 
-def predict_hazard_penalties(G: nx.Graph, nodes: dict, hazards: dict, time_of_day: str = None) -> nx.Graph:
+def get_routes_from(G: nx.Graph, start: str, ends: list, profile: str = "safest", engine: str = "networkx") -> dict:
+    """
+    Routes from one start to many ends out of a single shortest-path tree,
+    with the same costs and caching as get_route_with_profile.
+    Args:
+        G: networkx.Graph or EdgeOverlay (not modified)
+        start: start node name
+        ends: end node names
+        profile: routing profile
+        engine: 'networkx', or 'csr' / 'cch' (both grow one CSR search tree)
+    Returns:
+        Dict mapping each reachable end to its path; unreachable or unknown ends are left out
+    """
+    _check_engine(engine)
+    paths = {}
+    missing = []
+    for end in dict.fromkeys(ends):
+        cache_key = route_cache_key(G, start, end, profile)
+        cached = route_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            paths[end] = list(cached)
+        else:
+            missing.append(end)
+    if not missing or start not in G:
+        return paths
+    costs = EdgeOverlay.of(G)
+    prefs = profile_preferences(profile)
+    if engine in ("csr", "cch"):
+        csr = csr_graph(costs)
+        tree = csr.shortest_paths(start, missing, profile_costs(csr.attributes_with(costs), prefs))
+    else:
+        _, tree = nx.single_source_dijkstra(costs.G, start, weight=costs.weight(profile_cost(prefs)))
+    for end in missing:
+        if end in tree:
+            paths[end] = list(tree[end])
+            cache_key = route_cache_key(G, start, end, profile)
+            if cache_key is not None:
+                route_cache.put(cache_key, tuple(paths[end]))
+    logging.info(f"Routes computed from {start} to {len(missing)} ends ({profile})")
+    return paths
+
+def predict_hazard_penalties(G: nx.Graph, nodes: dict, hazards: dict, time_of_day: str = None) -> EdgeOverlay:
     """
     Adjust hazard penalties on the graph based on predicted hazards and time-based adaptation.
     Uses historical and real-time data (stub/demo logic for now).
     Args:
-        G: networkx.Graph object
+        G: networkx.Graph object or EdgeOverlay (left unchanged)
         nodes: dict mapping node names to (lat, lng)
         hazards: GeoJSON dict with hazard features
         time_of_day: Optional string (e.g., 'morning', 'evening')
     Returns:
-        Updated graph with predicted hazard penalties
+        EdgeOverlay over G with predicted hazard penalties
     """
+    G = EdgeOverlay.of(G).fork()
     # Reset all hazard penalties
     for u, v in G.edges():
         G[u][v]['hazard_penalty'] = 0
+    index = graph_index(G.G, nodes)
     # Demo: Increase penalties for certain times or hazard types
     for feature in hazards.get('features', []):
         coords = feature['geometry']['coordinates']
@@ -304,12 +375,8 @@ def predict_hazard_penalties(G: nx.Graph, nodes: dict, hazards: dict, time_of_da
             penalty *= 1.5
         if time_of_day == 'evening' and hazard_type == 'crowd':
             penalty *= 2
-        for u, v in G.edges():
-            u_pos = nodes[u]
-            v_pos = nodes[v]
-            # Simple proximity check
-            if abs(u_pos[0] - coords[1]) < 0.00005 or abs(v_pos[0] - coords[1]) < 0.00005:
-                G[u][v]['hazard_penalty'] += penalty
+        for u, v in index.edges_near(coords[1], coords[0], DEFAULT_THRESHOLD):
+            G[u][v]['hazard_penalty'] += penalty
     return G
 
 def get_predictive_route(G: nx.Graph, nodes: dict, start: str, end: str, hazards: dict, time_of_day: str = None, profile: str = "safest") -> list:
@@ -339,57 +406,53 @@ def ingest_additional_data(data_type: str, data: dict) -> dict:
     return data
 
 
-def get_route_multi_modal(G: nx.Graph, start: str, end: str, mode: str = "wheelchair", profile: str = "safest") -> list:
+def get_route_multi_modal(G: nx.Graph, start: str, end: str, mode: str = "wheelchair", profile: str = "safest", engine: str = "networkx") -> list:
     """
     Multi-modal routing: supports 'wheelchair', 'walking', 'public_transit', etc.
-    Applies mode-specific constraints and preferences.
-    Caches result for repeated queries.
-    """
-    cache_key = f"{start}-{end}-{mode}-{profile}"
-    if cache_key in route_cache:
-        logging.info(f"Cache hit for {cache_key}")
-        return route_cache[cache_key]
-    prefs = {}
-    # Mode-specific constraints
-    if mode == "wheelchair":
-        prefs.update({"avoid_slope": True, "prefer_covered": True, "avoid_stairs": True})
-    elif mode == "walking":
-        prefs.update({"avoid_slope": False, "prefer_covered": False, "avoid_stairs": False})
-    elif mode == "public_transit":
-        prefs.update({"prefer_transit": True, "avoid_stairs": True})
-    # Profile-specific preferences
-    if profile == "safest":
-        prefs.update({"prefer_covered": True})
-    elif profile == "fastest":
-        prefs.update({"prefer_covered": False})
-    elif profile == "scenic":
-        prefs.update({"prefer_parks": True})
-    G = apply_user_preferences_multi_modal(G, prefs)
+    Applies mode-specific constraints and preferences through a per-request
+    cost function; G (a graph or EdgeOverlay) is not modified.
+    engine='csr' runs A* on the array-backed CSRGraph instead of networkx;
+    engine='cch' queries a contraction hierarchy customized for the mode and profile.
+    Caches result for repeated queries on versioned graphs (see cache.route_cache_key).
+    """
+    _check_engine(engine)
+    cache_key = route_cache_key(G, start, end, profile, mode)
+    if cache_key is not None:
+        cached = route_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Cache hit for {cache_key}")
+            return list(cached)
+    costs = EdgeOverlay.of(G)
+    prefs = multi_modal_preferences(mode, profile)
     try:
-        path = list(nx.dijkstra_path(G, start, end, weight='weight'))
-        route_cache[cache_key] = path
-        logging.info(f"Multi-modal route computed for {cache_key}")
+        if engine == "csr":
+            csr = csr_graph(costs)
+            path = csr.astar(start, end, multi_modal_costs(csr.attributes_with(costs), prefs))
+        elif engine == "cch":
+            path = cch_route(costs, start, end, ('mode', mode, profile), lambda attributes: multi_modal_costs(attributes, prefs))
+        else:
+            path = list(nx.dijkstra_path(costs.G, start, end, weight=costs.weight(multi_modal_cost(prefs))))
+        if cache_key is not None:
+            route_cache.put(cache_key, tuple(path))
+        logging.info(f"Multi-modal route computed for {start}-{end}-{mode}-{profile}")
         return path
     except Exception as e:
-        logging.error(f"Multi-modal routing error for {cache_key}: {e}")
+        logging.error(f"Multi-modal routing error for {start}-{end}-{mode}-{profile}: {e}")
         return [f"No route found: {e}"]
 
-def apply_user_preferences_multi_modal(G: nx.Graph, preferences: dict) -> nx.Graph:
+def _check_engine(engine: str) -> None:
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown routing engine '{engine}', expected one of {ENGINES}")
+
+def apply_user_preferences_multi_modal(G: nx.Graph, preferences: dict) -> EdgeOverlay:
+    """
+    Multi-modal preference weights as an EdgeOverlay; G is left unchanged and
+    weights are derived from the stored weight each time, so they never compound.
+    """
+    G = EdgeOverlay.of(G).fork()
+    cost = multi_modal_cost(preferences)
     for u, v in G.edges():
-        # Wheelchair: avoid steep slopes and stairs
-        if preferences.get('avoid_slope') and G[u][v].get('slope', 0) > 0.05:
-            G[u][v]['weight'] = float('inf')
-        if preferences.get('avoid_stairs') and G[u][v].get('stairs', False):
-            G[u][v]['weight'] = float('inf')
-        # Public transit: prefer transit edges
-        if preferences.get('prefer_transit') and not G[u][v].get('transit', False):
-            G[u][v]['weight'] *= 2
-        # Scenic: prefer parks
-        if preferences.get('prefer_parks') and G[u][v].get('park', False):
-            G[u][v]['weight'] *= 0.8
-        # Covered: prefer covered paths
-        if preferences.get('prefer_covered') and not G[u][v].get('covered', False):
-            G[u][v]['weight'] *= 1.5
+        G[u][v]['weight'] = cost(G[u][v])
     return G
 def simulate_realtime_hazard(G: nx.Graph, nodes: dict, path: list, hazard_type: str = "lift_breakdown") -> list:
     """
@@ -400,10 +463,12 @@ def simulate_realtime_hazard(G: nx.Graph, nodes: dict, path: list, hazard_type:
     if len(path) < 2:
         return path, f"No reroute needed."
     u, v = path[1], path[2] if len(path) > 2 else path[1]
-    G[u][v]['hazard_penalty'] = 999
-    G[u][v]['blocked'] = hazard_type
+    costs = EdgeOverlay.of(G).fork()
+    costs[u][v]['hazard_penalty'] = 999
+    costs[u][v]['blocked'] = hazard_type
+    costs[u][v]['weight'] = costs[u][v].get('weight', 1) + 999
     try:
-        new_path = [path[0]] + list(nx.dijkstra_path(G, u, path[-1], weight='weight'))
+        new_path = [path[0]] + list(nx.dijkstra_path(costs.G, u, path[-1], weight=costs.weight()))
         msg = f"Hazard '{hazard_type}' detected at edge {u}-{v}. Rerouting..."
         return new_path, msg
     except Exception:
@@ -421,16 +486,13 @@ def voice_activated_routing_stub(command: str) -> str:
 
 def accessibility_heatmap(G: nx.Graph, nodes: dict) -> dict:
     """
-    Generate a mock accessibility heatmap based on edge penalties.
+    Generate an accessibility heatmap based on edge penalties.
+    Scores for the whole graph come from the CSR penalty arrays (see heatmap.node_scores).
     Returns a dict of node:score for visualization.
     """
-    heatmap = {}
-    for n in nodes:
-        score = 100
-        for nbr in G.neighbors(n):
-            score -= G[n][nbr].get('hazard_penalty', 0) / 10
-        heatmap[n] = max(0, round(score, 1))
-    return heatmap
+    csr = csr_graph(G)
+    scores = node_scores(csr, csr.attributes_with(G)['hazard_penalty'])
+    return {n: float(scores[csr.node_index[n]]) for n in nodes if n in csr.node_index}
     if preferences.get("prefer_parks"):
         recs.append("Based on your outings, you may like these accessible parks.")
     if user_history:
@@ -460,10 +522,15 @@ def explain_route(G: nx.Graph, path: list) -> list:
         })
     return explanation
 
-def get_alternative_routes(G: nx.Graph, start: str, end: str, k: int = 2) -> list:
+def get_alternative_routes(G: nx.Graph, start: str, end: str, k: int = 2, profile: str = None, **options) -> list:
+    """
+    The best route plus up to k dissimilar alternatives (see alternatives.alternative_routes
+    for the options: method, max_overlap, max_stretch, time_budget).
+    Costs follow the profile when given, otherwise the stored edge weight.
+    """
     try:
-        paths = list(nx.shortest_simple_paths(G, start, end, weight='weight'))
-        return paths[:k+1]
+        cost = profile_cost(profile_preferences(profile)) if profile else None
+        return alternative_routes(G, start, end, k, cost=cost, **options)
     except Exception as e:
         logging.error(f"Alternative routing error: {e}")
         return [f"No alternative route found: {e}"]
@@ -484,15 +551,11 @@ def annotate_edges(G: nx.Graph, annotations: dict) -> nx.Graph:
             G[u][v][k] = v2
     return G
 
-def apply_user_preferences(G: nx.Graph, preferences: dict) -> nx.Graph:
+def apply_user_preferences(G: nx.Graph, preferences: dict) -> EdgeOverlay:
+    G = EdgeOverlay.of(G).fork()
+    cost = profile_cost(preferences)
     for u, v in G.edges():
-        base_cost = G[u][v].get('base_cost', 1)
-        hazard_penalty = G[u][v].get('hazard_penalty', 0)
-        G[u][v]['weight'] = base_cost + hazard_penalty
-        if preferences.get('avoid_slope') and G[u][v].get('slope', 0) > 0.05:
-            G[u][v]['weight'] = float('inf')
-        if preferences.get('prefer_covered') and not G[u][v].get('covered', False):
-            G[u][v]['weight'] *= 1.5
+        G[u][v]['weight'] = cost(G[u][v])
     return G
 
 def export_route_geojson(nodes: dict, path: list) -> dict:
@@ -505,22 +568,23 @@ def simulate_live_reroute(G: nx.Graph, nodes: dict, path: list, new_hazard: tupl
     if len(path) < 2:
         return path
     u, v = path[1], path[2] if len(path) > 2 else path[1]
-    G[u][v]['hazard_penalty'] = 999
+    costs = EdgeOverlay.of(G).fork()
+    costs[u][v]['hazard_penalty'] = 999
+    costs[u][v]['weight'] = costs[u][v].get('weight', 1) + 999
     try:
-        new_path = nx.dijkstra_path(G, u, path[-1], weight='weight')
+        new_path = nx.dijkstra_path(costs.G, u, path[-1], weight=costs.weight())
         return [path[0]] + new_path
     except Exception:
         return path
 
 def hazard_feedback_suggestion(path: list, hazards: dict, nodes: dict) -> list:
     suggestions = []
+    index = HazardIndex(hazards)
     for n in path:
-        for feature in hazards.get('features', []):
-            coords = feature['geometry']['coordinates']
-            if abs(nodes[n][0] - coords[1]) < 0.00005 and abs(nodes[n][1] - coords[0]) < 0.00005:
-                suggestions.append({
-                    'node': n,
-                    'hazard_id': feature['properties']['id'],
-                    'message': f"You passed hazard {feature['properties']['type']} at {n}. Confirm or update?"
-                })
+        for feature in index.near_node(nodes[n]):
+            suggestions.append({
+                'node': n,
+                'hazard_id': feature['properties']['id'],
+                'message': f"You passed hazard {feature['properties']['type']} at {n}. Confirm or update?"
+            })
     return suggestions
@@ -0,0 +1,219 @@
+import itertools
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import networkx as nx
+
+try:
+    from . import engine
+    from .overlay import HazardOverlay
+    from .snap import node_snapper
+    from .spatial import DEFAULT_THRESHOLD, HazardIndex, graph_index
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    import engine
+    from overlay import HazardOverlay
+    from snap import node_snapper
+    from spatial import DEFAULT_THRESHOLD, HazardIndex, graph_index
+
+# Graph versions are unique within the process, so caches keyed on them never
+# confuse graphs from two different stores
+_versions = itertools.count(1)
+
+
+class GraphStore:
+    """
+    Process-wide home for the routing graph.
+    The base graph is built once with `engine.load_graph` and stays resident.
+    Hazards are kept on it through a HazardOverlay, so adding or removing a
+    hazard only rewrites the edges near it and is visible to routing at once.
+
+    When given a hazard source (a HazardStore), the store's change feed drives
+    the overlay; changes are applied at the start of the next snapshot().
+    """
+
+    def __init__(
+        self,
+        hazard_source: Optional[Any] = None,
+        loader: Callable[[], Tuple[nx.Graph, Dict[str, Tuple[float, float]]]] = engine.load_graph,
+        **hazard_params: Any
+    ):
+        """
+        Args:
+            hazard_source: object with feature_collection(), subscribe(callback) and
+                refresh(), e.g. hazard_store.HazardStore (optional)
+            loader: function returning (G, nodes), defaults to engine.load_graph
+            hazard_params: weights for the overlay, as accepted by engine.apply_hazards
+        """
+        self.hazard_source = hazard_source
+        self.loader = loader
+        self.hazard_params = hazard_params
+        self.proximity_threshold = hazard_params.get('proximity_threshold', DEFAULT_THRESHOLD)
+        self.version = 0
+        self.hazard_epoch = 0
+        self._lock = threading.RLock()
+        self._graph: Optional[nx.Graph] = None
+        self._nodes: Dict[str, Tuple[float, float]] = {}
+        self._overlay: Optional[HazardOverlay] = None
+        self._hazards: Dict[str, Any] = {"type": "FeatureCollection", "features": []}
+        self._hazard_index = HazardIndex(self._hazards, self.proximity_threshold)
+        self._pending: deque = deque()
+        self._listeners: List[Callable[[Set[Tuple[str, str]]], Any]] = []
+        if hazard_source is not None:
+            hazard_source.subscribe(self._on_hazard_change)
+
+    def load(self) -> None:
+        """Build the base graph if it has not been built yet."""
+        if self._graph is not None:
+            return
+        with self._lock:
+            if self._graph is not None:
+                return
+            G, nodes = self.loader()
+            self._nodes = nodes
+            if self.hazard_source is not None:
+                self._pending.clear()
+                self._publish(self.hazard_source.feature_collection())
+            self._overlay = HazardOverlay(G, nodes, index=graph_index(G, nodes, self.proximity_threshold), **self.hazard_params)
+            affected = self._overlay.sync(self._hazards)
+            self.version = next(_versions)
+            G.graph["version"] = self.version
+            G.graph["hazard_epoch"] = self.hazard_epoch
+            csr = G.graph.get("csr")
+            if csr is not None:
+                # The loader supplied an array graph (e.g. a memory-mapped artifact): adopt it
+                csr.set_edge_attributes(G, affected)
+                csr.stamp = (self.version, self.hazard_epoch)
+            G.graph["hazard_index"] = self._hazard_index
+            # Coordinate lookups use a persistent grid index built once per load
+            node_snapper(G, nodes)
+            # Topology is fixed from here on; only edge attributes change
+            self._graph = nx.freeze(G)
+            logging.info(f"Routing graph loaded: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
+
+    def subscribe(self, callback: Callable[[Set[Tuple[str, str]]], Any]) -> None:
+        """
+        Call callback(edges) after every hazard change with the edges whose
+        penalty changed (e.g. NavigationSessions.edges_changed). It runs inside
+        the store's lock, with the graph already updated.
+        """
+        self._listeners.append(callback)
+
+    def refresh_hazards(self) -> int:
+        """
+        Pull changes from the hazard source (including other processes' writes)
+        and apply them to the overlay.
+        Returns:
+            Number of changes applied
+        """
+        if self.hazard_source is None:
+            return 0
+        self.hazard_source.refresh()
+        applied = 0
+        with self._lock:
+            while self._pending:
+                op, hazard_id, feature = self._pending.popleft()
+                if op == "reload":
+                    self.set_hazards(self.hazard_source.feature_collection())
+                elif op == "delete":
+                    self.remove_hazard(hazard_id)
+                else:
+                    self.add_hazard(feature)
+                applied += 1
+        return applied
+
+    def set_hazards(self, hazards: Dict[str, Any]) -> Set[Tuple[str, str]]:
+        """
+        Replace the whole hazard set. Only hazards that actually changed touch the graph.
+        Args:
+            hazards: GeoJSON dict with hazard features
+        Returns:
+            Edges whose penalty changed
+        """
+        self.load()
+        with self._lock:
+            affected = self._overlay.sync(hazards)
+            self._publish(hazards)
+            self._bump(affected)
+            return affected
+
+    def add_hazard(self, feature: Dict[str, Any]) -> Set[Tuple[str, str]]:
+        """
+        Add (or replace, by id) one hazard feature.
+        Returns:
+            Edges whose penalty changed
+        """
+        self.load()
+        with self._lock:
+            hazard_id = feature.get('properties', {}).get('id')
+            affected = self._overlay.add(feature)
+            index = self._hazard_index.copy()
+            index.remove(hazard_id)
+            index.add(feature)
+            self._publish(self._without(hazard_id) + [feature], index)
+            self._bump(affected)
+            return affected
+
+    def remove_hazard(self, hazard_id: Any) -> Set[Tuple[str, str]]:
+        """
+        Remove a hazard by id, subtracting exactly its contribution.
+        Returns:
+            Edges whose penalty changed
+        """
+        self.load()
+        with self._lock:
+            affected = self._overlay.remove(hazard_id)
+            index = self._hazard_index.copy()
+            index.remove(hazard_id)
+            self._publish(self._without(hazard_id), index)
+            self._bump(affected)
+            return affected
+
+    def snapshot(self) -> Tuple[nx.Graph, Dict[str, Tuple[float, float]], Dict[str, Any]]:
+        """
+        Get the resident graph for routing.
+        Returns:
+            G: structurally frozen networkx.Graph with hazard penalties applied;
+               G.graph carries 'spatial_index' (GraphIndex) and 'hazard_index' (HazardIndex)
+            nodes: dict mapping node names to (lat, lng) tuples
+            hazards: GeoJSON dict of the current hazard set (do not mutate); G.graph's
+               'hazard_index' may already be newer, so check its `hazards` is this dict
+        """
+        self.load()
+        self.refresh_hazards()
+        with self._lock:
+            return self._graph, self._nodes, self._hazards
+
+    def _publish(self, hazards: Any, index: Optional[HazardIndex] = None) -> None:
+        # Readers hold on to the old index, so changes go to a copy that is swapped in whole
+        if not isinstance(hazards, dict):
+            hazards = {"type": "FeatureCollection", "features": hazards}
+        if index is None:
+            index = HazardIndex(hazards, self.proximity_threshold)
+        index.hazards = hazards
+        self._hazard_index = index
+        self._hazards = hazards
+
+    def _without(self, hazard_id: Any) -> List[Dict[str, Any]]:
+        # The current features minus hazard_id's; a plain copy when the id is not present
+        features = self._hazards.get('features', [])
+        if hazard_id not in self._hazard_index:
+            return list(features)
+        return [f for f in features if f.get('properties', {}).get('id') != hazard_id]
+
+    def _on_hazard_change(self, op: str, hazard_id: Optional[str], feature: Optional[Dict[str, Any]]) -> None:
+        # Runs inside the hazard source's lock: just queue it
+        self._pending.append((op, hazard_id, feature))
+
+    def _bump(self, affected: Set[Tuple[str, str]]) -> None:
+        self.hazard_epoch += 1
+        self._graph.graph["hazard_epoch"] = self.hazard_epoch
+        self._graph.graph["hazard_index"] = self._hazard_index
+        csr = self._graph.graph.get("csr")
+        if csr is not None:
+            # Keep the array graph in step with the overlay instead of rebuilding it
+            csr.set_edge_attributes(self._graph, affected)
+            csr.stamp = (self.version, self.hazard_epoch)
+        for callback in self._listeners:
+            callback(affected)
@@ -0,0 +1,223 @@
+import math
+import struct
+import threading
+import zlib
+from collections import deque
+from typing import Any, Dict, Hashable, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+try:
+    from .cache import LRUCache
+    from .csr import CSRGraph, csr_graph
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from cache import LRUCache
+    from csr import CSRGraph, csr_graph
+
+# Score of a node with no hazard penalty on any of its edges
+MAX_SCORE = 100.0
+# Each unit of incident hazard penalty costs this much score
+PENALTY_SCALE = 0.1
+TILE_SIZE = 256
+# Tiles are drawn as square cells of this many pixels, each the mean score of its nodes
+CELL_PX = 8
+# Colour ramp (score, RGB), matching the app's safe / mild / high hazard colours
+RAMP = ((0.0, (231, 76, 60)), (50.0, (241, 196, 15)), (100.0, (24, 178, 107)))
+CELL_ALPHA = 160
+
+
+def node_scores(csr: CSRGraph, penalty: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Accessibility score of every node: MAX_SCORE less PENALTY_SCALE times the
+    hazard penalty summed over its edges (out-edges when directed), floored at 0
+    and rounded to one decimal.
+    Args:
+        csr: CSRGraph
+        penalty: per-edge hazard penalty (defaults to csr.attributes['hazard_penalty'])
+    Returns:
+        float array indexed by node id
+    """
+    if penalty is None:
+        penalty = csr.attributes['hazard_penalty']
+    penalty = np.asarray(penalty, dtype=np.float64)
+    n = csr.num_nodes
+    edge_u = np.asarray(csr.edge_u)
+    edge_v = np.asarray(csr.edge_v)
+    total = np.bincount(edge_u, weights=penalty, minlength=n)
+    if not csr.directed:
+        # A self-loop is one neighbour, so it is only counted from its u side
+        other = edge_u != edge_v
+        total += np.bincount(edge_v[other], weights=penalty[other], minlength=n)
+    return np.round(np.maximum(MAX_SCORE - total * PENALTY_SCALE, 0.0), 1)
+
+
+class RollingMean:
+    """
+    Incremental per-node mean of score snapshots.
+    Running sums and counts are kept as arrays, so adding a snapshot costs
+    one vectorised update instead of re-reading the whole history; with a
+    window, the oldest snapshot is subtracted once it falls out.
+    """
+
+    def __init__(self, window: Optional[int] = None):
+        """
+        Args:
+            window: number of most recent snapshots to average (None = all)
+        """
+        self.window = window
+        self.index: Dict[Hashable, int] = {}
+        self._sum = np.zeros(0)
+        self._count = np.zeros(0, dtype=np.int64)
+        self._history: deque = deque()
+
+    def __len__(self) -> int:
+        return len(self._history) if self.window else int(self._count.max(initial=0))
+
+    def add(self, snapshot: Union[Mapping[Hashable, float], np.ndarray]) -> None:
+        """
+        Add a snapshot: a dict of node -> score, or an array of scores indexed by node id.
+        """
+        if isinstance(snapshot, np.ndarray):
+            ids = np.arange(len(snapshot))
+            values = snapshot.astype(np.float64)
+            for i in range(len(self.index), len(snapshot)):
+                self.index[i] = i
+        else:
+            index = self.index
+            ids = np.fromiter((index.setdefault(node, len(index)) for node in snapshot), dtype=np.int64, count=len(snapshot))
+            values = np.fromiter(snapshot.values(), dtype=np.float64, count=len(snapshot))
+        if len(self.index) > len(self._sum):
+            grow = len(self.index) - len(self._sum)
+            self._sum = np.concatenate([self._sum, np.zeros(grow)])
+            self._count = np.concatenate([self._count, np.zeros(grow, dtype=np.int64)])
+        self._sum[ids] += values
+        self._count[ids] += 1
+        if self.window:
+            self._history.append((ids, values))
+            if len(self._history) > self.window:
+                old_ids, old_values = self._history.popleft()
+                self._sum[old_ids] -= old_values
+                self._count[old_ids] -= 1
+
+    def means(self) -> Dict[Hashable, float]:
+        """Mean score of every node seen in the (windowed) history."""
+        seen = self._count > 0
+        mean = np.zeros(len(self._sum))
+        mean[seen] = self._sum[seen] / self._count[seen]
+        return {node: float(mean[i]) for node, i in self.index.items() if seen[i]}
+
+
+class AccessibilityHeatmap:
+    """
+    Heatmap tiles (z/x/y, web mercator) of node accessibility scores.
+    Scores for the whole graph are computed once per hazard epoch from the CSR
+    edge arrays; each tile takes the nodes inside it by bisecting a sorted
+    x coordinate, and averages their scores into cells. Rendered tiles are
+    cached by graph stamp, so hazard updates invalidate them automatically.
+    """
+
+    def __init__(self, cache_size: int = 2048, cell_px: int = CELL_PX, tile_size: int = TILE_SIZE):
+        """
+        Args:
+            cache_size: rendered tiles kept
+            cell_px: cell size in pixels (must divide tile_size)
+            tile_size: tile edge in pixels
+        """
+        if tile_size % cell_px:
+            raise ValueError("cell_px must divide tile_size")
+        self.cell_px = cell_px
+        self.tile_size = tile_size
+        self.cache = LRUCache(maxsize=cache_size)
+        self._state: Optional[Tuple[Any, ...]] = None
+        self._lock = threading.Lock()
+
+    def scores(self, G: Any) -> Tuple[CSRGraph, np.ndarray]:
+        """CSR graph of G and the current score of each of its nodes."""
+        return self._prepare(G)[:2]
+
+    def tile(self, G: Any, z: int, x: int, y: int, fmt: str = "png") -> Union[bytes, Dict[str, Any]]:
+        """
+        Render one tile.
+        Args:
+            G: networkx.Graph (or EdgeOverlay) with node positions
+            z, x, y: tile coordinates
+            fmt: 'png' (RGBA image, transparent where there are no nodes) or 'json' (grid of mean scores)
+        Returns:
+            PNG bytes, or dict with the cell grid ('scores', None where empty)
+        Raises:
+            ValueError: tile coordinates out of range or unknown format
+        """
+        if fmt not in ("png", "json"):
+            raise ValueError(f"Unknown tile format '{fmt}'")
+        if not (0 <= z <= 24 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise ValueError(f"Tile {z}/{x}/{y} is out of range")
+        csr, scores, mx, my, order, sorted_x = self._prepare(G)
+        # Overlays with private changes share the base graph's stamp, so they are never cached
+        key = None if csr.stamp is None or getattr(G, '_edges', None) else (csr.stamp, z, x, y, fmt)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        cells = self.tile_size // self.cell_px
+        scale = 2 ** z
+        lo, hi = np.searchsorted(sorted_x, [x / scale, (x + 1) / scale])
+        inside = order[lo:hi]
+        py = my[inside] * scale - y
+        keep = (py >= 0) & (py < 1)
+        inside, py = inside[keep], py[keep]
+        cx = np.minimum((mx[inside] * scale - x) * cells, cells - 1).astype(np.int64)
+        cy = np.minimum(py * cells, cells - 1).astype(np.int64)
+        cell = cy * cells + cx
+        count = np.bincount(cell, minlength=cells * cells).reshape(cells, cells)
+        total = np.bincount(cell, weights=scores[inside], minlength=cells * cells).reshape(cells, cells)
+        mean = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+        if fmt == "json":
+            grid = np.round(mean, 1)
+            result: Union[bytes, Dict[str, Any]] = {
+                "z": z, "x": x, "y": y, "cells": cells, "nodes": int(len(inside)),
+                "scores": [[None if math.isnan(v) else v for v in row] for row in grid.tolist()],
+            }
+        else:
+            result = _png(np.repeat(np.repeat(_colour(mean), self.cell_px, axis=0), self.cell_px, axis=1))
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    def _prepare(self, G: Any) -> Tuple[CSRGraph, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        csr = csr_graph(G)
+        with self._lock:
+            state = self._state
+            if state is not None and state[0] is csr and csr.stamp is not None and state[1] == csr.stamp:
+                return state[2]
+            scores = node_scores(csr, csr.attributes_with(G)['hazard_penalty'])
+            lat = np.clip(np.asarray(csr.lat, dtype=np.float64), -85.05112878, 85.05112878)
+            mx = (np.asarray(csr.lng, dtype=np.float64) + 180.0) / 360.0
+            my = (1.0 - np.log(np.tan(np.radians(lat)) + 1.0 / np.cos(np.radians(lat))) / math.pi) / 2.0
+            located = np.flatnonzero(np.isfinite(mx) & np.isfinite(my))
+            order = located[np.argsort(mx[located], kind='stable')]
+            prepared = (csr, scores, mx, my, order, mx[order])
+            if not getattr(G, '_edges', None):
+                self._state = (csr, csr.stamp, prepared)
+            return prepared
+
+
+def _colour(mean: np.ndarray) -> np.ndarray:
+    # RGBA per cell along RAMP; empty (NaN) cells are transparent
+    stops = np.array([s for s, _ in RAMP])
+    rgba = np.zeros(mean.shape + (4,), dtype=np.uint8)
+    filled = ~np.isnan(mean)
+    for channel in range(3):
+        rgba[..., channel][filled] = np.interp(mean[filled], stops, [c[channel] for _, c in RAMP]).round()
+    rgba[..., 3][filled] = CELL_ALPHA
+    return rgba
+
+
+def _png(rgba: np.ndarray) -> bytes:
+    # Minimal RGBA PNG encoder (filter type 0 on every row), so tiles need no imaging library
+    height, width, _ = rgba.shape
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)], axis=1)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) + chunk(b"IEND", b""))
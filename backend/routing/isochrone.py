@@ -0,0 +1,155 @@
+import math
+from typing import Any, Dict, Hashable, List, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .cache import LRUCache, route_cache_key
+    from .costs import EdgeOverlay, multi_modal_preferences
+    from .csr import EARTH_RADIUS_M, CSRGraph, csr_graph, multi_modal_costs
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from cache import LRUCache, route_cache_key
+    from costs import EdgeOverlay, multi_modal_preferences
+    from csr import EARTH_RADIUS_M, CSRGraph, csr_graph, multi_modal_costs
+
+# Travel speed per mode, in metres of edge cost per minute
+MODE_SPEEDS: Dict[str, float] = {"wheelchair": 60.0, "walking": 80.0, "public_transit": 80.0}
+# Hexagon circumradius in metres
+DEFAULT_HEX_SIZE = 60.0
+# Points sampled along one edge at most, so long edges still fill the cells they cross
+MAX_EDGE_SAMPLES = 64
+METRES_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+SQRT3 = math.sqrt(3)
+
+isochrone_cache = LRUCache(maxsize=256, ttl=600)
+
+
+def isochrones(
+    G: Any,
+    origin: Hashable,
+    minutes: Sequence[float],
+    mode: str = "walking",
+    profile: str = "fastest",
+    hex_size: float = DEFAULT_HEX_SIZE
+) -> Dict[str, Any]:
+    """
+    Areas reachable from origin within each of several travel times, from one search.
+    Edge costs are get_route_multi_modal's (as apply_user_preferences_multi_modal),
+    so a wheelchair isochrone never crosses stairs or steep slopes and hazards
+    slow it down; a minute buys MODE_SPEEDS[mode] metres of cost. One Dijkstra,
+    bounded by the largest time, settles the nodes; points sampled along the
+    edges it reaches are binned into hexagons, and each threshold takes the cells
+    reachable in time. Results are cached per origin node, hazard epoch and
+    request on versioned graphs (see cache.route_cache_key).
+    Args:
+        G: networkx.Graph or EdgeOverlay (not modified) with node positions
+        origin: node name
+        minutes: travel times, e.g. [5, 10, 15]
+        mode: 'wheelchair', 'walking' or 'public_transit'
+        profile: routing profile; 'fastest' keeps costs closest to plain travel time
+        hex_size: hexagon circumradius in metres
+    Returns:
+        GeoJSON FeatureCollection with one MultiPolygon feature per time (smallest first),
+        each with 'minutes', 'cells' and 'nodes' properties; 'origin' names the origin node
+    Raises:
+        ValueError: unknown mode, non-positive times or hex size, or an origin without a position
+        nx.NodeNotFound: if origin is not in G
+    """
+    if mode not in MODE_SPEEDS:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {tuple(MODE_SPEEDS)}")
+    minutes = sorted(set(float(m) for m in minutes))
+    if not minutes or minutes[0] <= 0 or hex_size <= 0:
+        raise ValueError("Times and hex size must be positive")
+    key = route_cache_key(G, origin, None, profile, mode)
+    if key is not None:
+        key = ('isochrone', tuple(minutes), float(hex_size)) + key
+        cached = isochrone_cache.get(key)
+        if cached is not None:
+            return cached
+    costs = EdgeOverlay.of(G)
+    csr = csr_graph(costs)
+    cost = multi_modal_costs(csr.attributes_with(costs), multi_modal_preferences(mode, profile))
+    budgets = [m * MODE_SPEEDS[mode] for m in minutes]
+    ids, dist = csr.costs_within(origin, cost, budgets[-1])
+    o = csr.node_index[origin]
+    lat0, lng0 = float(csr.lat[o]), float(csr.lng[o])
+    if not (math.isfinite(lat0) and math.isfinite(lng0)):
+        raise ValueError(f"Origin {origin} has no position")
+    lat, lng, point_cost = _reached_points(csr, ids, dist, cost, budgets[-1], hex_size)
+    # Local equirectangular projection around the origin, in metres
+    x = (lng - lng0) * METRES_PER_DEGREE * math.cos(math.radians(lat0))
+    y = (lat - lat0) * METRES_PER_DEGREE
+    cells, inverse = np.unique(_hex_cells(x, y, hex_size), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    cell_cost = np.full(len(cells), np.inf)
+    np.minimum.at(cell_cost, inverse, point_cost)
+    features = []
+    for m, budget in zip(minutes, budgets):
+        inside = cells[cell_cost <= budget]
+        polygons = [[_hexagon(q, r, hex_size, lat0, lng0)] for q, r in inside.tolist()]
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "MultiPolygon", "coordinates": polygons},
+            "properties": {"minutes": m, "cells": len(polygons), "nodes": int(np.count_nonzero(dist <= budget))},
+        })
+    result = {"type": "FeatureCollection", "origin": origin, "mode": mode, "profile": profile, "features": features}
+    if key is not None:
+        isochrone_cache.put(key, result)
+    return result
+
+
+def _reached_points(
+    csr: CSRGraph, ids: np.ndarray, dist: np.ndarray, cost: np.ndarray, limit: float, hex_size: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Settled nodes plus points along every edge leaving them, each with its cost from the origin
+    reached = np.full(csr.num_nodes, np.inf)
+    reached[ids] = dist
+    edge_u, edge_v = np.asarray(csr.edge_u), np.asarray(csr.edge_v)
+    du, dv = reached[edge_u], reached[edge_v]
+    cost = np.asarray(cost, dtype=np.float64)
+    usable = np.isfinite(cost) & (np.isfinite(du) | (np.isfinite(dv) & (not csr.directed)))
+    edges = np.flatnonzero(usable)
+    length = csr.edge_length()[edges]
+    steps = np.clip(np.nan_to_num(np.ceil(length / hex_size), nan=1.0), 1, MAX_EDGE_SAMPLES).astype(np.int64)
+    e = np.repeat(edges, steps)
+    first = np.repeat(np.cumsum(steps) - steps, steps)
+    f = (np.arange(len(e)) - first + 0.5) / np.repeat(steps, steps)
+    sample_cost = du[e] + f * cost[e]
+    if not csr.directed:
+        sample_cost = np.minimum(sample_cost, dv[e] + (1 - f) * cost[e])
+    lat_u, lat_v = csr.lat[edge_u[e]], csr.lat[edge_v[e]]
+    lng_u, lng_v = csr.lng[edge_u[e]], csr.lng[edge_v[e]]
+    lat = np.concatenate([csr.lat[ids], lat_u + f * (lat_v - lat_u)])
+    lng = np.concatenate([csr.lng[ids], lng_u + f * (lng_v - lng_u)])
+    point_cost = np.concatenate([dist, sample_cost])
+    keep = (point_cost <= limit) & np.isfinite(lat) & np.isfinite(lng)
+    return lat[keep].astype(np.float64), lng[keep].astype(np.float64), point_cost[keep]
+
+
+def _hex_cells(x: np.ndarray, y: np.ndarray, size: float) -> np.ndarray:
+    # Axial (q, r) of the pointy-top hexagon containing each point, by cube rounding
+    q = (SQRT3 / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return np.stack([rq, rr], axis=1).astype(np.int64).reshape(-1, 2)
+
+
+def _hexagon(q: int, r: int, size: float, lat0: float, lng0: float) -> List[List[float]]:
+    # Closed GeoJSON ring ([lng, lat] pairs) of hexagon (q, r)
+    cx = size * SQRT3 * (q + r / 2)
+    cy = size * 1.5 * r
+    scale_x = METRES_PER_DEGREE * math.cos(math.radians(lat0))
+    ring = []
+    for i in range(7):
+        angle = math.radians(60 * (i % 6) - 30)
+        ring.append([
+            round(lng0 + (cx + size * math.cos(angle)) / scale_x, 7),
+            round(lat0 + (cy + size * math.sin(angle)) / METRES_PER_DEGREE, 7),
+        ])
+    return ring
@@ -0,0 +1,58 @@
+from typing import Hashable, Optional, Sequence
+
+import networkx as nx
+import numpy as np
+
+try:
+    from .costs import EdgeOverlay, multi_modal_cost, multi_modal_preferences, profile_cost, profile_preferences
+    from .csr import csr_graph, multi_modal_costs, profile_costs
+    from .features import _check_engine
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from costs import EdgeOverlay, multi_modal_cost, multi_modal_preferences, profile_cost, profile_preferences
+    from csr import csr_graph, multi_modal_costs, profile_costs
+    from features import _check_engine
+
+
+def distance_matrix(
+    G: nx.Graph,
+    sources: Sequence[Hashable],
+    targets: Sequence[Hashable],
+    profile: str = "safest",
+    mode: Optional[str] = None,
+    engine: str = "csr"
+) -> np.ndarray:
+    """
+    Accessible travel cost between every source and every target.
+    Costs are those get_route_with_profile (or get_route_multi_modal, when a
+    mode is given) minimises, so entry [i, j] is the cost of the route they
+    would return. One multi-target Dijkstra runs per source instead of one
+    search per pair. With engine='csr' (the default, also used for 'cch') each
+    search stops once all targets are settled; engine='networkx' grows full
+    shortest-path trees.
+    Args:
+        G: networkx.Graph or EdgeOverlay (not modified)
+        sources, targets: node names
+        profile: routing profile ('safest', 'fastest', 'scenic')
+        mode: multi-modal mode ('wheelchair', 'walking', 'public_transit'), or None
+        engine: 'networkx', 'csr' or 'cch'
+    Returns:
+        float array of shape (len(sources), len(targets)); inf where there is no route
+    """
+    _check_engine(engine)
+    costs = EdgeOverlay.of(G)
+    prefs = multi_modal_preferences(mode, profile) if mode else profile_preferences(profile)
+    if engine in ("csr", "cch"):
+        csr = csr_graph(costs)
+        attributes = csr.attributes_with(costs)
+        cost = multi_modal_costs(attributes, prefs) if mode else profile_costs(attributes, prefs)
+        return csr.cost_matrix(sources, targets, cost)
+    weight = costs.weight(multi_modal_cost(prefs) if mode else profile_cost(prefs))
+    out = np.full((len(sources), len(targets)), np.inf)
+    for i, source in enumerate(sources):
+        if source not in costs.G:
+            continue
+        lengths = nx.single_source_dijkstra_path_length(costs.G, source, weight=weight)
+        for j, target in enumerate(targets):
+            if target in lengths:
+                out[i, j] = lengths[target]
+    return out
@@ -0,0 +1,165 @@
+import math
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+import networkx as nx
+
+try:
+    from .spatial import DEFAULT_THRESHOLD, GraphIndex, graph_index
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from spatial import DEFAULT_THRESHOLD, GraphIndex, graph_index
+
+Edge = Tuple[str, str]
+
+
+class HazardOverlay:
+    """
+    Incremental hazard penalties on a live graph.
+    Every hazard id keeps an inverse-delta record of the penalty it added to
+    each nearby edge, so adding or removing a hazard only touches those edges.
+    An edge's hazard_penalty is always re-summed from its remaining
+    contributions, so removals cancel exactly instead of drifting.
+    Penalties match engine.apply_hazards with the same weights.
+    """
+
+    def __init__(
+        self,
+        G: nx.Graph,
+        nodes: Dict[str, Tuple[float, float]],
+        hazard_weight: float = 100.0,
+        severity_weight: float = 1.0,
+        confidence_weight: float = 1.0,
+        proximity_threshold: float = DEFAULT_THRESHOLD,
+        index: Optional[GraphIndex] = None
+    ):
+        """
+        Args:
+            G: networkx.Graph to keep hazard_penalty/weight up to date on
+            nodes: dict mapping node names to (lat, lng)
+            hazard_weight, severity_weight, confidence_weight: as in engine.apply_hazards
+            proximity_threshold: how close a hazard must be to affect an edge
+            index: prebuilt GraphIndex for G (optional)
+        """
+        self.G = G
+        self.hazard_weight = hazard_weight
+        self.severity_weight = severity_weight
+        self.confidence_weight = confidence_weight
+        self.proximity_threshold = proximity_threshold
+        self.index = index or graph_index(G, nodes, proximity_threshold)
+        # hazard id -> {edge: penalty it contributed}
+        self._records: Dict[Any, Dict[FrozenSet[str], float]] = {}
+        # hazard id -> fingerprints of the features behind the record
+        self._fingerprints: Dict[Any, Tuple] = {}
+        # edge -> {hazard id: penalty}
+        self._contributions: Dict[FrozenSet[str], Dict[Any, float]] = {}
+        self._endpoints: Dict[FrozenSet[str], Edge] = {}
+        for u, v in G.edges():
+            G[u][v]['hazard_penalty'] = 0
+            G[u][v]['weight'] = G[u][v].get('base_cost', 1)
+
+    def __contains__(self, hazard_id: Any) -> bool:
+        return hazard_id in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def penalty(self, feature: Dict[str, Any]) -> float:
+        """Penalty one hazard feature adds to each edge near it."""
+        props = feature.get('properties', {})
+        confidence = props.get('confidence', 1.0) * self.confidence_weight
+        severity = props.get('severity', 1.0) * self.severity_weight
+        return confidence * severity * self.hazard_weight
+
+    def add(self, feature: Dict[str, Any]) -> Set[Edge]:
+        """
+        Add or replace a hazard. A feature whose id is already present replaces it.
+        Returns:
+            Edges whose penalty changed
+        """
+        hazard_id = _hazard_id(feature)
+        affected = self._drop(hazard_id)
+        affected |= self._put(hazard_id, [feature])
+        return self._refresh(affected)
+
+    def remove(self, hazard_id: Any) -> Set[Edge]:
+        """
+        Remove a hazard by subtracting exactly what it contributed.
+        Returns:
+            Edges whose penalty changed (empty if the id was unknown)
+        """
+        return self._refresh(self._drop(hazard_id))
+
+    def sync(self, hazards: Dict[str, Any]) -> Set[Edge]:
+        """
+        Bring the overlay in line with a full hazard set, touching only hazards
+        that were added, removed or changed. Features sharing an id are combined.
+        Returns:
+            Edges whose penalty changed
+        """
+        wanted: Dict[Any, List[Dict[str, Any]]] = {}
+        for feature in hazards.get('features', []):
+            wanted.setdefault(_hazard_id(feature), []).append(feature)
+        affected: Set[FrozenSet[str]] = set()
+        for hazard_id in list(self._records):
+            if hazard_id not in wanted:
+                affected |= self._drop(hazard_id)
+        for hazard_id, features in wanted.items():
+            if self._fingerprints.get(hazard_id) == _fingerprint(features):
+                continue
+            affected |= self._drop(hazard_id)
+            affected |= self._put(hazard_id, features)
+        return self._refresh(affected)
+
+    def _put(self, hazard_id: Any, features: List[Dict[str, Any]]) -> Set[FrozenSet[str]]:
+        record: Dict[FrozenSet[str], float] = {}
+        for feature in features:
+            lng, lat = feature['geometry']['coordinates'][:2]
+            penalty = self.penalty(feature)
+            for u, v in self.index.edges_near(lat, lng, self.proximity_threshold):
+                key = frozenset((u, v))
+                self._endpoints[key] = (u, v)
+                record[key] = record.get(key, 0) + penalty
+        for key, penalty in record.items():
+            self._contributions.setdefault(key, {})[hazard_id] = penalty
+        self._records[hazard_id] = record
+        self._fingerprints[hazard_id] = _fingerprint(features)
+        return set(record)
+
+    def _drop(self, hazard_id: Any) -> Set[FrozenSet[str]]:
+        record = self._records.pop(hazard_id, None)
+        self._fingerprints.pop(hazard_id, None)
+        if not record:
+            return set()
+        for key in record:
+            contributions = self._contributions[key]
+            del contributions[hazard_id]
+            if not contributions:
+                del self._contributions[key]
+        return set(record)
+
+    def _refresh(self, keys: Set[FrozenSet[str]]) -> Set[Edge]:
+        edges = set()
+        for key in keys:
+            u, v = self._endpoints[key]
+            penalty = math.fsum(self._contributions.get(key, {}).values())
+            data = self.G[u][v]
+            data['hazard_penalty'] = penalty
+            data['weight'] = data.get('base_cost', 1) + penalty
+            edges.add((u, v))
+        return edges
+
+
+def _hazard_id(feature: Dict[str, Any]) -> Any:
+    props = feature.get('properties', {})
+    if props.get('id') is not None:
+        return props['id']
+    # Anonymous hazards are identified by where they are and what they are
+    return ('anon', tuple(feature['geometry']['coordinates'][:2]), props.get('type'))
+
+
+def _fingerprint(features: List[Dict[str, Any]]) -> Tuple:
+    return tuple(
+        (tuple(f['geometry']['coordinates'][:2]),
+         f.get('properties', {}).get('severity', 1.0),
+         f.get('properties', {}).get('confidence', 1.0))
+        for f in features
+    )
@@ -0,0 +1,368 @@
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import networkx as nx
+
+INF = float('inf')
+# Active navigation sessions kept before the least recently used one is dropped
+DEFAULT_MAX_SESSIONS = 10000
+# Seconds without an update after which a session expires
+DEFAULT_SESSION_TTL = 1800.0
+
+Weight = Callable[[Hashable, Hashable, Dict[str, Any]], Optional[float]]
+
+
+class IncrementalPlanner:
+    """
+    D* Lite planner for one navigation: the route from a moving start to a fixed goal.
+    The search runs backwards from the goal and keeps its state (g, rhs and
+    the priority queue) between calls, so when edge costs change only the
+    nodes whose distance to the goal changes are expanded again, and moving
+    the start along the route costs nothing. Costs are read from G through
+    `weight` at search time; callers report which edges changed.
+    """
+
+    def __init__(
+        self,
+        G: nx.Graph,
+        start: Hashable,
+        goal: Hashable,
+        weight: Weight,
+        heuristic: Optional[Callable[[Hashable, Hashable], float]] = None
+    ):
+        """
+        Args:
+            G: networkx.Graph or DiGraph, read (never modified) on every search
+            start, goal: node names
+            weight: networkx-style weight function (u, v, data) -> cost, None for impassable
+            heuristic: admissible, consistent lower bound on the cost between two nodes (default 0)
+        Raises:
+            nx.NodeNotFound: if start or goal is not in G
+        """
+        for node in (start, goal):
+            if node not in G:
+                raise nx.NodeNotFound(f"Node {node} is not in G")
+        self.G = G
+        self.weight = weight
+        self.heuristic = heuristic or (lambda a, b: 0.0)
+        self.start = start
+        self.goal = goal
+        self.expanded = 0
+        self._km = 0.0
+        self._g: Dict[Hashable, float] = {}
+        self._rhs: Dict[Hashable, float] = {goal: 0.0}
+        self._queue: List[Tuple[Tuple[float, float], int, Hashable]] = []
+        self._queued: Dict[Hashable, Tuple[float, float]] = {}
+        self._tie = itertools.count()
+        self._push(goal)
+
+    def path(self) -> List[Hashable]:
+        """
+        Current best route from start to goal, repairing the search first if needed.
+        Raises:
+            nx.NetworkXNoPath: if the goal cannot be reached
+        """
+        self._compute()
+        if self._g.get(self.start, INF) == INF:
+            raise nx.NetworkXNoPath(f"No path between {self.start} and {self.goal}")
+        path = [self.start]
+        seen = {self.start}
+        node = self.start
+        while node != self.goal:
+            best, best_cost = None, INF
+            for succ in self._successors(node):
+                total = self._cost(node, succ) + self._g.get(succ, INF)
+                if total < best_cost:
+                    best, best_cost = succ, total
+            if best is None or best in seen:
+                raise nx.NetworkXNoPath(f"No path between {self.start} and {self.goal}")
+            path.append(best)
+            seen.add(best)
+            node = best
+        return path
+
+    def cost(self) -> float:
+        """Cost of the current route (inf if there is none)."""
+        self._compute()
+        return self._g.get(self.start, INF)
+
+    def move_to(self, node: Hashable) -> None:
+        """
+        The traveller is now at node (usually the next one on the route).
+        Raises:
+            nx.NodeNotFound: if node is not in G
+        """
+        if node not in self.G:
+            raise nx.NodeNotFound(f"Node {node} is not in G")
+        self._km += self.heuristic(self.start, node)
+        self.start = node
+
+    def update_edges(self, edges: Iterable[Tuple[Hashable, Hashable]]) -> None:
+        """Edges whose cost changed; the search is repaired lazily on the next path()."""
+        directed = self.G.is_directed()
+        for u, v in edges:
+            self._update(u)
+            if not directed:
+                self._update(v)
+
+    def touched(self, u: Hashable, v: Hashable) -> bool:
+        """Whether the search has seen u or v; changes to other edges cannot affect it."""
+        return u in self._g or u in self._rhs or v in self._g or v in self._rhs
+
+    def _key(self, node: Hashable) -> Tuple[float, float]:
+        m = min(self._g.get(node, INF), self._rhs.get(node, INF))
+        return (m + self.heuristic(self.start, node) + self._km, m)
+
+    def _push(self, node: Hashable) -> None:
+        key = self._key(node)
+        self._queued[node] = key
+        heapq.heappush(self._queue, (key, next(self._tie), node))
+
+    def _update(self, node: Hashable) -> None:
+        if node not in self.G:
+            return
+        if node != self.goal:
+            self._rhs[node] = min((self._cost(node, succ) + self._g.get(succ, INF) for succ in self._successors(node)), default=INF)
+        if self._g.get(node, INF) != self._rhs.get(node, INF):
+            self._push(node)
+        else:
+            # Entries already in the heap are skipped when popped
+            self._queued.pop(node, None)
+
+    def _top(self) -> Optional[Tuple[Tuple[float, float], Hashable]]:
+        while self._queue:
+            key, _, node = self._queue[0]
+            if self._queued.get(node) == key:
+                return key, node
+            heapq.heappop(self._queue)
+        return None
+
+    def _compute(self) -> None:
+        while True:
+            top = self._top()
+            start_key = self._key(self.start)
+            if top is None or (top[0] >= start_key and self._rhs.get(self.start, INF) == self._g.get(self.start, INF)):
+                return
+            key, node = top
+            self.expanded += 1
+            fresh = self._key(node)
+            if key < fresh:
+                self._push(node)
+                continue
+            heapq.heappop(self._queue)
+            del self._queued[node]
+            g, rhs = self._g.get(node, INF), self._rhs.get(node, INF)
+            if g > rhs:
+                self._g[node] = rhs
+                for pred in self._predecessors(node):
+                    self._update(pred)
+            else:
+                self._g[node] = INF
+                self._update(node)
+                for pred in self._predecessors(node):
+                    self._update(pred)
+
+    def _cost(self, u: Hashable, v: Hashable) -> float:
+        w = self.weight(u, v, self.G[u][v])
+        return INF if w is None else w
+
+    def _successors(self, node: Hashable) -> Iterable[Hashable]:
+        return self.G.successors(node) if self.G.is_directed() else self.G.neighbors(node)
+
+    def _predecessors(self, node: Hashable) -> Iterable[Hashable]:
+        return self.G.predecessors(node) if self.G.is_directed() else self.G.neighbors(node)
+
+
+class NavigationSession:
+    """One active navigation: its planner, current route and reroute count."""
+
+    def __init__(self, session_id: str, planner: IncrementalPlanner, meta: Optional[Dict[str, Any]] = None):
+        self.session_id = session_id
+        self.planner = planner
+        self.meta = dict(meta or {})
+        self.route: List[Hashable] = []
+        self.reroutes = 0
+        self.pending: Set[Tuple[Hashable, Hashable]] = set()
+        self.updated_at = 0.0
+
+
+class NavigationSessions:
+    """
+    Registry of active navigations, each with its own IncrementalPlanner.
+    A reverse index from edges to the sessions whose current route uses them
+    finds the navigations an edge update affects; those are repaired at once.
+    Other sessions whose search has seen a changed edge (a cheaper edge nearby
+    can still shorten their route) queue the change and repair on next access.
+    Thread-safe; edges_changed can be subscribed to GraphStore updates.
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, ttl: Optional[float] = DEFAULT_SESSION_TTL, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            max_sessions: sessions kept before the least recently updated is dropped
+            ttl: seconds of inactivity before a session expires (None = never)
+            clock: time source, injectable for tests
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.clock = clock
+        self.repairs = 0
+        self._sessions: "OrderedDict[str, NavigationSession]" = OrderedDict()
+        self._by_edge: Dict[Hashable, Set[str]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def start(
+        self,
+        G: nx.Graph,
+        start: Hashable,
+        goal: Hashable,
+        weight: Weight,
+        meta: Optional[Dict[str, Any]] = None,
+        heuristic: Optional[Callable[[Hashable, Hashable], float]] = None
+    ) -> NavigationSession:
+        """
+        Open a session and plan its first route.
+        Args:
+            G, start, goal, weight, heuristic: as IncrementalPlanner
+            meta: caller data kept on the session (e.g. the profile)
+        Raises:
+            nx.NodeNotFound, nx.NetworkXNoPath
+        """
+        planner = IncrementalPlanner(G, start, goal, weight, heuristic)
+        session = NavigationSession(uuid.uuid4().hex, planner, meta)
+        route = planner.path()
+        with self._lock:
+            self._expire()
+            self._sessions[session.session_id] = session
+            self._set_route(session, route)
+            self._touch(session)
+            while len(self._sessions) > self.max_sessions:
+                self._drop(next(iter(self._sessions)))
+        return session
+
+    def get(self, session_id: str) -> NavigationSession:
+        """
+        The session with any queued edge changes applied.
+        Raises:
+            KeyError: unknown or expired session
+            nx.NetworkXNoPath: the goal is no longer reachable
+        """
+        with self._lock:
+            self._expire()
+            session = self._sessions[session_id]
+            if session.pending:
+                self._repair(session)
+            self._touch(session)
+            return session
+
+    def advance(self, session_id: str, node: Hashable) -> NavigationSession:
+        """
+        Move the session's traveller to node and return the session with its route from there.
+        Raises:
+            KeyError, nx.NodeNotFound, nx.NetworkXNoPath
+        """
+        with self._lock:
+            self._expire()
+            session = self._sessions[session_id]
+            session.planner.move_to(node)
+            changes, session.pending = session.pending, set()
+            session.planner.update_edges(changes)
+            route = session.planner.path()
+            self._set_route(session, route)
+            self._touch(session)
+            return session
+
+    def close(self, session_id: str) -> bool:
+        """End a session; False if it did not exist."""
+        with self._lock:
+            return self._drop(session_id)
+
+    def edges_changed(self, edges: Iterable[Tuple[Hashable, Hashable]]) -> Dict[str, List[Hashable]]:
+        """
+        Tell the sessions that these edges' costs changed.
+        Returns:
+            session id -> new route for sessions whose route used a changed edge
+            (sessions left without a route are reported with an empty list)
+        """
+        edges = list(edges)
+        rerouted = {}
+        with self._lock:
+            affected = set()
+            for u, v in edges:
+                # Undirected routes are indexed by frozenset, directed ones by (u, v)
+                affected |= self._by_edge.get(frozenset((u, v)), set()) | self._by_edge.get((u, v), set())
+            for session in self._sessions.values():
+                seen = [(u, v) for u, v in edges if session.planner.touched(u, v)]
+                session.pending.update(seen)
+            for session_id in affected:
+                session = self._sessions[session_id]
+                try:
+                    self._repair(session)
+                    rerouted[session_id] = list(session.route)
+                except nx.NetworkXNoPath:
+                    rerouted[session_id] = []
+        return rerouted
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sessions": len(self._sessions), "indexed_edges": len(self._by_edge), "repairs": self.repairs}
+
+    def _repair(self, session: NavigationSession) -> None:
+        changes, session.pending = session.pending, set()
+        session.planner.update_edges(changes)
+        self.repairs += 1
+        try:
+            route = session.planner.path()
+        except nx.NetworkXNoPath:
+            self._set_route(session, [])
+            raise
+        if route != session.route:
+            session.reroutes += 1
+        self._set_route(session, route)
+
+    def _set_route(self, session: NavigationSession, route: List[Hashable]) -> None:
+        for key in self._route_keys(session):
+            ids = self._by_edge.get(key)
+            if ids is not None:
+                ids.discard(session.session_id)
+                if not ids:
+                    del self._by_edge[key]
+        session.route = route
+        for key in self._route_keys(session):
+            self._by_edge.setdefault(key, set()).add(session.session_id)
+
+    def _route_keys(self, session: NavigationSession) -> List[Hashable]:
+        route = session.route
+        G = session.planner.G
+        if G.is_directed():
+            return list(zip(route, route[1:]))
+        return [frozenset(e) for e in zip(route, route[1:])]
+
+    def _touch(self, session: NavigationSession) -> None:
+        session.updated_at = self.clock()
+        self._sessions.move_to_end(session.session_id)
+
+    def _drop(self, session_id: str) -> bool:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        self._set_route(session, [])
+        del self._sessions[session_id]
+        return True
+
+    def _expire(self) -> None:
+        if self.ttl is None:
+            return
+        cutoff = self.clock() - self.ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.updated_at >= cutoff:
+                break
+            self._drop(oldest.session_id)
@@ -0,0 +1,284 @@
+import math
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+import networkx as nx
+import numpy as np
+
+try:
+    from .csr import EARTH_RADIUS_M
+except ImportError:  # imported as a top-level module (tests run from routing/)
+    from csr import EARTH_RADIUS_M
+
+# Grid cell edge in metres; a few times the typical node spacing keeps rings small
+DEFAULT_CELL_M = 50.0
+# Edges whose bounding box covers more cells than this are checked on every query instead
+MAX_EDGE_CELLS = 256
+
+
+class EdgeSnap(NamedTuple):
+    """A point snapped onto an edge: the split point lies at fraction t from u to v."""
+    u: Hashable
+    v: Hashable
+    t: float
+    lat: float
+    lng: float
+    distance_m: float
+
+
+class _CellGrid:
+    """Static bucket grid over projected points: cell key -> slice of an index array."""
+
+    def __init__(self, cx: np.ndarray, cy: np.ndarray, items: np.ndarray):
+        keys = _cell_key(cx, cy)
+        order = np.argsort(keys, kind='stable')
+        self.items = items[order]
+        unique, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        self.cells: Dict[int, Tuple[int, int]] = {
+            k: (s, s + c) for k, s, c in zip(unique.tolist(), starts.tolist(), counts.tolist())
+        }
+        self.bounds = (int(cx.min()), int(cx.max()), int(cy.min()), int(cy.max())) if len(cx) else None
+
+    def min_ring(self, ix: int, iy: int) -> int:
+        """Ring before which every cell is empty (the distance to the occupied bounds)."""
+        if self.bounds is None:
+            return 0
+        x0, x1, y0, y1 = self.bounds
+        return max(x0 - ix, ix - x1, y0 - iy, iy - y1, 0)
+
+    def scan_cheaper(self, r: int) -> bool:
+        """Whether ring r has more cells than are occupied, so scanning all items is cheaper."""
+        return 8 * r > len(self.cells)
+
+    def max_ring(self, ix: int, iy: int) -> int:
+        """Ring beyond which no cell holds anything."""
+        if self.bounds is None:
+            return -1
+        x0, x1, y0, y1 = self.bounds
+        return max(abs(ix - x0), abs(ix - x1), abs(iy - y0), abs(iy - y1))
+
+    def ring(self, ix: int, iy: int, r: int) -> np.ndarray:
+        """Items in the cells at Chebyshev distance exactly r from (ix, iy)."""
+        if r == 0:
+            coords = [(ix, iy)]
+        else:
+            coords = [(ix + dx, iy + dy) for dx in range(-r, r + 1) for dy in (-r, r)]
+            coords += [(ix + dx, iy + dy) for dx in (-r, r) for dy in range(-r + 1, r)]
+        parts = []
+        for cx, cy in coords:
+            bounds = self.cells.get(_cell_key(cx, cy))
+            if bounds is not None:
+                parts.append(self.items[bounds[0]:bounds[1]])
+        if not parts:
+            return np.zeros(0, dtype=self.items.dtype)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+class NodeSnapper:
+    """
+    Nearest-node and nearest-edge lookup on a persistent grid index.
+    Points are projected to metres (equirectangular around the graph's mean
+    latitude, which is accurate at city scale), so longitude is scaled correctly.
+    A query visits grid rings outward from its cell and stops as soon as no
+    unvisited cell can hold anything closer, so its cost does not grow with
+    graph size. Rings start at the grid's occupied bounds, and a query far
+    off the graph, whose rings would outnumber the occupied cells, scans
+    every point instead.
+    """
+
+    def __init__(
+        self,
+        lat: np.ndarray,
+        lng: np.ndarray,
+        node_names: Optional[Sequence[Hashable]] = None,
+        edges: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+        cell_m: float = DEFAULT_CELL_M
+    ):
+        """
+        Args:
+            lat, lng: node coordinates in degrees, indexed by node id
+            node_names: names for node ids (None = the ids themselves)
+            edges: (edge_u, edge_v) node id arrays, to enable snap_to_edge (optional)
+            cell_m: grid cell size in metres
+        """
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.node_names = node_names if node_names is not None else range(len(self.lat))
+        self.cell_m = cell_m
+        self.lat0 = float(np.nanmean(self.lat)) if len(self.lat) else 0.0
+        self._kx = EARTH_RADIUS_M * math.radians(1) * math.cos(math.radians(self.lat0))
+        self._ky = EARTH_RADIUS_M * math.radians(1)
+        self.x, self.y = self.project(self.lat, self.lng)
+        known = ~(np.isnan(self.x) | np.isnan(self.y))
+        ids = np.flatnonzero(known)
+        self._nodes = _CellGrid(self._cell(self.x[ids]), self._cell(self.y[ids]), ids)
+        self.source: Any = None
+        self.edge_u = self.edge_v = None
+        self._edges: Optional[_CellGrid] = None
+        self._long_edges = np.zeros(0, dtype=np.int64)
+        if edges is not None:
+            self._index_edges(np.asarray(edges[0]), np.asarray(edges[1]))
+
+    @classmethod
+    def from_graph(cls, G: nx.Graph, nodes: Dict[Hashable, Tuple[float, float]], cell_m: float = DEFAULT_CELL_M) -> "NodeSnapper":
+        """Build from a networkx graph and its nodes dict (edges are indexed too)."""
+        names = list(nodes)
+        index = {name: i for i, name in enumerate(names)}
+        coords = np.array([nodes[n] for n in names], dtype=np.float64).reshape(-1, 2)
+        pairs = [(index[u], index[v]) for u, v in G.edges() if u in index and v in index]
+        edge_u = np.array([p[0] for p in pairs], dtype=np.int64)
+        edge_v = np.array([p[1] for p in pairs], dtype=np.int64)
+        return cls(coords[:, 0], coords[:, 1], names, (edge_u, edge_v), cell_m)
+
+    @classmethod
+    def from_csr(cls, csr: Any, cell_m: float = DEFAULT_CELL_M) -> "NodeSnapper":
+        """Build from a csr.CSRGraph (e.g. a memory-mapped artifact) without touching networkx."""
+        return cls(csr.lat, csr.lng, csr.node_names, (csr.edge_u, csr.edge_v), cell_m)
+
+    def __len__(self) -> int:
+        return len(self._nodes.items)
+
+    def project(self, lat: Any, lng: Any) -> Tuple[Any, Any]:
+        """Degrees to local metres."""
+        return (np.asarray(lng, dtype=np.float64) * self._kx, np.asarray(lat, dtype=np.float64) * self._ky)
+
+    def nearest(self, lat: float, lng: float, k: int = 1) -> List[Tuple[Hashable, float]]:
+        """
+        The k nodes closest to (lat, lng).
+        Returns:
+            List of (node name, distance in metres), closest first
+        """
+        ids, dist = self._nearest_ids(lat, lng, k)
+        return [(self.node_names[i], d) for i, d in zip(ids, dist)]
+
+    def nearest_node(self, lat: float, lng: float) -> Optional[Hashable]:
+        """Name of the closest node, or None for an empty graph."""
+        hits = self.nearest(lat, lng, 1)
+        return hits[0][0] if hits else None
+
+    def nearest_batch(self, lats: Sequence[float], lngs: Sequence[float], k: int = 1) -> List[List[Tuple[Hashable, float]]]:
+        """nearest() for many coordinates in one call."""
+        return [self.nearest(lat, lng, k) for lat, lng in zip(lats, lngs)]
+
+    def snap_to_edge(self, lat: float, lng: float) -> Optional[EdgeSnap]:
+        """
+        Project (lat, lng) onto the closest edge.
+        Returns:
+            EdgeSnap with the edge, split fraction t and split point, or None if no edges are indexed
+        Raises:
+            ValueError: if the snapper was built without edges
+        """
+        if self._edges is None:
+            raise ValueError("NodeSnapper was built without edges")
+        if not len(self._edges.items) and not len(self._long_edges):
+            return None
+        px, py = self.project(lat, lng)
+        ix, iy = self._cell(px), self._cell(py)
+        ix, iy = int(ix), int(iy)
+        best, best_d, best_t = -1, math.inf, 0.0
+        if len(self._long_edges):
+            t, d = self._segment_distance(self._long_edges, px, py)
+            j = int(np.argmin(d))
+            best, best_d, best_t = int(self._long_edges[j]), float(d[j]), float(t[j])
+        for r in range(self._edges.min_ring(ix, iy), self._edges.max_ring(ix, iy) + 1):
+            scan = self._edges.scan_cheaper(r)
+            candidates = np.unique(self._edges.items) if scan else self._edges.ring(ix, iy, r)
+            if len(candidates):
+                t, d = self._segment_distance(candidates, px, py)
+                j = int(np.argmin(d))
+                if d[j] < best_d:
+                    best, best_d, best_t = int(candidates[j]), float(d[j]), float(t[j])
+            # Edges are bucketed in every cell their bounding box touches, so every
+            # edge within r cells' distance of the query has been seen
+            if scan or (best >= 0 and best_d <= r * self.cell_m):
+                break
+        u, v = int(self.edge_u[best]), int(self.edge_v[best])
+        x = self.x[u] + best_t * (self.x[v] - self.x[u])
+        y = self.y[u] + best_t * (self.y[v] - self.y[u])
+        return EdgeSnap(self.node_names[u], self.node_names[v], best_t, y / self._ky, x / self._kx, best_d)
+
+    def snap_batch(self, lats: Sequence[float], lngs: Sequence[float]) -> List[Optional[EdgeSnap]]:
+        """snap_to_edge() for many coordinates in one call."""
+        return [self.snap_to_edge(lat, lng) for lat, lng in zip(lats, lngs)]
+
+    def _nearest_ids(self, lat: float, lng: float, k: int) -> Tuple[List[int], List[float]]:
+        k = min(k, len(self))
+        if k <= 0:
+            return [], []
+        px, py = self.project(lat, lng)
+        ix, iy = int(self._cell(px)), int(self._cell(py))
+        found: List[np.ndarray] = []
+        count = 0
+        for r in range(self._nodes.min_ring(ix, iy), self._nodes.max_ring(ix, iy) + 1):
+            if self._nodes.scan_cheaper(r):
+                found = [self._nodes.items]
+                break
+            ring = self._nodes.ring(ix, iy, r)
+            if len(ring):
+                found.append(ring)
+                count += len(ring)
+            # Everything within r cells' distance of the query has been seen
+            if count >= k:
+                ids = np.concatenate(found)
+                d = np.hypot(self.x[ids] - px, self.y[ids] - py)
+                if np.partition(d, k - 1)[k - 1] <= r * self.cell_m:
+                    break
+        ids = np.concatenate(found)
+        d = np.hypot(self.x[ids] - px, self.y[ids] - py)
+        order = np.argsort(d, kind='stable')[:k]
+        return ids[order].tolist(), d[order].tolist()
+
+    def _index_edges(self, edge_u: np.ndarray, edge_v: np.ndarray) -> None:
+        self.edge_u, self.edge_v = edge_u, edge_v
+        known = ~(np.isnan(self.x[edge_u]) | np.isnan(self.x[edge_v]))
+        ids = np.flatnonzero(known)
+        x0, x1 = self._cell(self.x[edge_u[ids]]), self._cell(self.x[edge_v[ids]])
+        y0, y1 = self._cell(self.y[edge_u[ids]]), self._cell(self.y[edge_v[ids]])
+        lo_x, hi_x = np.minimum(x0, x1), np.maximum(x0, x1)
+        lo_y, hi_y = np.minimum(y0, y1), np.maximum(y0, y1)
+        # One entry per (edge, cell of its bounding box)
+        nx_cells = hi_x - lo_x + 1
+        ny_cells = hi_y - lo_y + 1
+        repeat = nx_cells * ny_cells
+        long = repeat > MAX_EDGE_CELLS
+        self._long_edges = ids[long]
+        ids, lo_x, lo_y, ny_cells, repeat = ids[~long], lo_x[~long], lo_y[~long], ny_cells[~long], repeat[~long]
+        owner = np.repeat(np.arange(len(ids)), repeat)
+        offset = np.arange(repeat.sum()) - np.repeat(np.cumsum(repeat) - repeat, repeat)
+        cx = lo_x[owner] + offset // ny_cells[owner]
+        cy = lo_y[owner] + offset % ny_cells[owner]
+        self._edges = _CellGrid(cx, cy, ids[owner])
+
+    def _segment_distance(self, edges: np.ndarray, px: float, py: float) -> Tuple[np.ndarray, np.ndarray]:
+        u, v = self.edge_u[edges], self.edge_v[edges]
+        ax, ay = self.x[u], self.y[u]
+        dx, dy = self.x[v] - ax, self.y[v] - ay
+        length2 = dx * dx + dy * dy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.where(length2 > 0, ((px - ax) * dx + (py - ay) * dy) / length2, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        return t, np.hypot(ax + t * dx - px, ay + t * dy - py)
+
+    def _cell(self, value: Any) -> Any:
+        return np.floor(np.asarray(value) / self.cell_m).astype(np.int64)
+
+
+def _cell_key(cx: Any, cy: Any) -> Any:
+    # Pack two signed cell coordinates into one int64 key (same value for Python ints)
+    return cx * (1 << 32) + (cy + (1 << 31))
+
+
+def node_snapper(G: nx.Graph, nodes: Dict[Hashable, Tuple[float, float]], cell_m: float = DEFAULT_CELL_M) -> NodeSnapper:
+    """
+    Get the NodeSnapper cached on G.graph, building one if missing or stale.
+    Graphs carrying a CSRGraph (e.g. memory-mapped artifacts) are indexed from its arrays.
+    """
+    snapper = G.graph.get('snapper')
+    if snapper is None or snapper.source is not nodes or snapper.cell_m != cell_m:
+        csr = G.graph.get('csr')
+        if csr is not None and csr.num_nodes == len(nodes):
+            snapper = NodeSnapper.from_csr(csr, cell_m)
+        else:
+            snapper = NodeSnapper.from_graph(G, nodes, cell_m)
+        snapper.source = nodes
+        G.graph['snapper'] = snapper
+    return snapper
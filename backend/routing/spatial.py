@@ -0,0 +1,305 @@
+import math
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import networkx as nx
+
+# Same box size the proximity checks have always used (approx. 5m)
+DEFAULT_THRESHOLD = 0.00005
+
+
+class GridIndex:
+    """
+    Uniform lat/lng grid over keyed points.
+    Queries use the same box test as the original proximity checks
+    (|dlat| < threshold and |dlng| < threshold), but only visit the grid cells
+    the box overlaps instead of every point.
+    """
+
+    def __init__(self, cell_size: float = DEFAULT_THRESHOLD):
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[float, float, int]]] = {}
+        self._points: Dict[Hashable, Tuple[float, float, int]] = {}
+        self._seq = 0
+        # Cells whose bucket this index created; any other bucket is shared with a copy
+        self._owned: set = set()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._points
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+    def _own(self, cell: Tuple[int, int]) -> Dict[Hashable, Tuple[float, float, int]]:
+        # Bucket of a cell, copied first if it is shared with another index
+        bucket = self._cells.get(cell)
+        if cell not in self._owned:
+            bucket = dict(bucket or {})
+            self._cells[cell] = bucket
+            self._owned.add(cell)
+        return bucket
+
+    def copy(self) -> "GridIndex":
+        """
+        Copy that shares every bucket with this index until either changes it,
+        so updating the copy costs the cells it touches, not the whole grid.
+        """
+        clone = GridIndex(self.cell_size)
+        clone._cells = dict(self._cells)
+        clone._points = dict(self._points)
+        clone._seq = self._seq
+        self._owned = set()
+        return clone
+
+    def insert(self, key: Hashable, lat: float, lng: float) -> None:
+        """Add a point, replacing any previous point stored under the same key."""
+        if key in self._points:
+            self.remove(key)
+        entry = (lat, lng, self._seq)
+        self._seq += 1
+        self._points[key] = entry
+        self._own(self._cell(lat, lng))[key] = entry
+
+    def remove(self, key: Hashable) -> bool:
+        """Remove a point. Returns False if the key was not indexed."""
+        entry = self._points.pop(key, None)
+        if entry is None:
+            return False
+        cell = self._cell(entry[0], entry[1])
+        bucket = self._own(cell)
+        del bucket[key]
+        if not bucket:
+            del self._cells[cell]
+            self._owned.discard(cell)
+        return True
+
+    def position(self, key: Hashable) -> Tuple[float, float]:
+        lat, lng, _ = self._points[key]
+        return lat, lng
+
+    def query(self, lat: float, lng: float, threshold: Optional[float] = None) -> List[Hashable]:
+        """
+        Find keys whose point lies within the threshold box around (lat, lng).
+        Args:
+            lat, lng: query point
+            threshold: box half-size in degrees (defaults to the cell size)
+        Returns:
+            Matching keys in insertion order
+        """
+        t = self.cell_size if threshold is None else threshold
+        return self.query_box(lat - t, lat + t, lng - t, lng + t, strict=True)
+
+    def query_box(self, min_lat: float, max_lat: float, min_lng: float, max_lng: float, strict: bool = False) -> List[Hashable]:
+        """
+        Find keys inside a lat/lng bounding box.
+        Args:
+            strict: exclude points lying exactly on the box edge
+        Returns:
+            Matching keys in insertion order
+        """
+        lo_i, lo_j = self._cell(min_lat, min_lng)
+        hi_i, hi_j = self._cell(max_lat, max_lng)
+        hits = []
+        if (hi_i - lo_i + 1) * (hi_j - lo_j + 1) > len(self._cells):
+            # Box covers more cells than exist: scanning the buckets is cheaper
+            buckets = (b for (i, j), b in self._cells.items() if lo_i <= i <= hi_i and lo_j <= j <= hi_j)
+        else:
+            buckets = (self._cells.get((i, j)) for i in range(lo_i, hi_i + 1) for j in range(lo_j, hi_j + 1))
+        for bucket in buckets:
+            if not bucket:
+                continue
+            for key, (plat, plng, seq) in bucket.items():
+                if strict:
+                    inside = min_lat < plat < max_lat and min_lng < plng < max_lng
+                else:
+                    inside = min_lat <= plat <= max_lat and min_lng <= plng <= max_lng
+                if inside:
+                    hits.append((seq, key))
+        hits.sort(key=lambda h: h[0])
+        return [key for _, key in hits]
+
+    def query_segment(
+        self, lat1: float, lng1: float, lat2: float, lng2: float, threshold: Optional[float] = None
+    ) -> List[Tuple[Hashable, float, float]]:
+        """
+        Find keys whose point lies within the threshold box around some point of a segment,
+        visiting only the grid cells along the segment's corridor.
+        At the endpoints this is exactly the query() box test.
+        Args:
+            lat1, lng1, lat2, lng2: segment ends
+            threshold: box half-size in degrees (defaults to the cell size)
+        Returns:
+            (key, lo, hi) in insertion order, where (lo, hi) is the range of segment
+            fractions (0 at the first end, 1 at the second) the key's point is near
+        """
+        t = self.cell_size if threshold is None else threshold
+        dlat, dlng = lat2 - lat1, lng2 - lng1
+        c = self.cell_size
+        get = self._cells.get
+        buckets = []
+        lat_lo, lat_hi = min(lat1, lat2), max(lat1, lat2)
+        for i in range(math.floor((lat_lo - t) / c), math.floor((lat_hi + t) / c) + 1):
+            # Part of the segment whose latitude comes within t of this row of cells
+            band_lo, band_hi = max(i * c - t, lat_lo), min((i + 1) * c + t, lat_hi)
+            if dlat == 0:
+                s_lo, s_hi = 0.0, 1.0
+            else:
+                s_lo, s_hi = sorted(((band_lo - lat1) / dlat, (band_hi - lat1) / dlat))
+                s_lo, s_hi = max(s_lo, 0.0), min(s_hi, 1.0)
+            lng_a, lng_b = lng1 + s_lo * dlng, lng1 + s_hi * dlng
+            lo_j = math.floor((min(lng_a, lng_b) - t) / c)
+            hi_j = math.floor((max(lng_a, lng_b) + t) / c)
+            for j in range(lo_j, hi_j + 1):
+                bucket = get((i, j))
+                if bucket:
+                    buckets.append(bucket)
+        hits = []
+        for bucket in buckets:
+            for key, (plat, plng, seq) in bucket.items():
+                lo, hi = 0.0, 1.0
+                near = True
+                for offset, delta in ((plat - lat1, dlat), (plng - lng1, dlng)):
+                    # Fractions s with |offset - s * delta| < t
+                    if delta == 0:
+                        near = near and abs(offset) < t
+                        continue
+                    a, b = sorted(((offset - t) / delta, (offset + t) / delta))
+                    lo, hi = max(lo, a), min(hi, b)
+                if near and lo < hi:
+                    hits.append((seq, key, lo, hi))
+        hits.sort(key=lambda h: h[0])
+        return [(key, lo, hi) for _, key, lo, hi in hits]
+
+
+class GraphIndex:
+    """
+    Spatial index over graph nodes, answering node and edge proximity queries.
+    An edge counts as near a point when either endpoint is, matching apply_hazards.
+    """
+
+    def __init__(self, G: nx.Graph, nodes: Dict[str, Tuple[float, float]], cell_size: float = DEFAULT_THRESHOLD):
+        """
+        Args:
+            G: networkx.Graph whose topology is indexed
+            nodes: dict mapping node names to (lat, lng)
+            cell_size: grid cell size in degrees, ideally the usual proximity threshold
+        """
+        self.G = G
+        self.node_positions = nodes
+        self.grid = GridIndex(cell_size)
+        for n, (lat, lng) in nodes.items():
+            self.grid.insert(n, lat, lng)
+
+    def nodes_near(self, lat: float, lng: float, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+        """Nodes within the threshold box around (lat, lng)."""
+        return self.grid.query(lat, lng, threshold)
+
+    def edges_near(self, lat: float, lng: float, threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[str, str]]:
+        """
+        Edges with at least one endpoint within the threshold box around (lat, lng).
+        Returns:
+            List of (u, v) tuples, each edge once
+        """
+        seen = set()
+        edges = []
+        for n in self.nodes_near(lat, lng, threshold):
+            if n not in self.G:
+                continue
+            for nbr in self.G[n]:
+                key = frozenset((n, nbr))
+                if key in seen:
+                    continue
+                seen.add(key)
+                edges.append((n, nbr))
+        return edges
+
+
+class HazardIndex:
+    """
+    Spatial index over GeoJSON hazard point features, updatable in place.
+    An index shared between threads (GraphStore's) is never updated: changes
+    are made to a copy(), and `hazards` names the set the index covers.
+    """
+
+    def __init__(self, hazards: Optional[Dict[str, Any]] = None, cell_size: float = DEFAULT_THRESHOLD):
+        """
+        Args:
+            hazards: GeoJSON dict with hazard features (optional)
+            cell_size: grid cell size in degrees
+        """
+        self.hazards = hazards
+        self.features: Dict[int, Dict[str, Any]] = {}
+        self.grid = GridIndex(cell_size)
+        self._by_id: Dict[Any, List[int]] = {}
+        self._next_key = 0
+        for feature in (hazards or {}).get('features', []):
+            self.add(feature)
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def add(self, feature: Dict[str, Any]) -> int:
+        """
+        Index one hazard feature.
+        Returns:
+            Internal key of the feature; keys increase in insertion order
+        """
+        key = self._next_key
+        self._next_key += 1
+        lng, lat = feature['geometry']['coordinates'][:2]
+        self.features[key] = feature
+        self.grid.insert(key, lat, lng)
+        hazard_id = feature.get('properties', {}).get('id')
+        # New list rather than append: copies share the old one
+        self._by_id[hazard_id] = self._by_id.get(hazard_id, []) + [key]
+        return key
+
+    def copy(self) -> "HazardIndex":
+        """Copy-on-write copy (see GridIndex.copy); features are shared, not copied."""
+        clone = HazardIndex(cell_size=self.grid.cell_size)
+        clone.hazards = self.hazards
+        clone.features = dict(self.features)
+        clone.grid = self.grid.copy()
+        clone._by_id = dict(self._by_id)
+        clone._next_key = self._next_key
+        return clone
+
+    def __contains__(self, hazard_id: Any) -> bool:
+        return hazard_id in self._by_id
+
+    def remove(self, hazard_id: Any) -> int:
+        """
+        Drop every feature with the given hazard id.
+        Returns:
+            Number of features removed
+        """
+        keys = self._by_id.pop(hazard_id, [])
+        for key in keys:
+            del self.features[key]
+            self.grid.remove(key)
+        return len(keys)
+
+    def query(self, lat: float, lng: float, threshold: float = DEFAULT_THRESHOLD) -> List[int]:
+        """Keys of hazards within the threshold box around (lat, lng), in insertion order."""
+        return self.grid.query(lat, lng, threshold)
+
+    def near(self, lat: float, lng: float, threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+        """Hazard features within the threshold box around (lat, lng), in insertion order."""
+        return [self.features[k] for k in self.query(lat, lng, threshold)]
+
+    def near_node(self, pos: Tuple[float, float], threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+        """Hazard features near a node position given as (lat, lng)."""
+        return self.near(pos[0], pos[1], threshold)
+
+
+def graph_index(G: nx.Graph, nodes: Dict[str, Tuple[float, float]], cell_size: float = DEFAULT_THRESHOLD) -> GraphIndex:
+    """
+    Get the spatial index cached on G.graph, building one if missing or stale.
+    """
+    index = G.graph.get('spatial_index')
+    if index is None or index.node_positions is not nodes or index.grid.cell_size != cell_size:
+        index = GraphIndex(G, nodes, cell_size)
+        G.graph['spatial_index'] = index
+    return index
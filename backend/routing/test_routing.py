@@ -250,6 +250,454 @@ def test_get_route_multi_modal():
     assert 'B' in path_transit or 'C' in path_transit
 
 
+
+def test_graph_store_loads_once_and_tracks_hazards():
+    from graph_store import GraphStore
+    import engine
+    calls = []
+    def loader():
+        calls.append(1)
+        return engine.load_graph()
+    store = GraphStore(loader=loader)
+    G, nodes, _ = store.snapshot()
+    assert G['A']['B']['hazard_penalty'] == 0
+    store.snapshot()
+    assert len(calls) == 1
+    hazards = {'features': [{'geometry': {'coordinates': [103.851959, 1.290270]}, 'properties': {'id': 'h1', 'severity': 0.5, 'confidence': 1.0}}]}
+    store.set_hazards(hazards)
+    G2, _, _ = store.snapshot()
+    assert G2 is G
+    assert G2['A']['B']['hazard_penalty'] == 50
+    assert nx.is_frozen(G2)
+    assert len(calls) == 1
+
+
+def test_spatial_index_matches_brute_force():
+    import random
+    from spatial import GraphIndex, HazardIndex
+    rng = random.Random(7)
+    G = nx.Graph()
+    nodes = {}
+    for i in range(300):
+        nodes[str(i)] = (1.29 + rng.random() * 0.002, 103.85 + rng.random() * 0.002)
+        G.add_node(str(i))
+    for i in range(600):
+        G.add_edge(str(rng.randrange(300)), str(rng.randrange(300)))
+    t = 0.0002
+    index = GraphIndex(G, nodes, cell_size=0.0001)
+    for _ in range(50):
+        lat, lng = 1.29 + rng.random() * 0.002, 103.85 + rng.random() * 0.002
+        near = lambda p: abs(p[0] - lat) < t and abs(p[1] - lng) < t
+        expected = {frozenset((u, v)) for u, v in G.edges() if near(nodes[u]) or near(nodes[v])}
+        assert {frozenset(e) for e in index.edges_near(lat, lng, t)} == expected
+    hazards = {'features': [{'geometry': {'coordinates': [lng, lat]}, 'properties': {'id': n}} for n, (lat, lng) in nodes.items()]}
+    hazard_idx = HazardIndex(hazards)
+    pos = nodes['0']
+    ids = [f['properties']['id'] for f in hazard_idx.near_node(pos, t)]
+    assert ids == [n for n, p in nodes.items() if abs(p[0] - pos[0]) < t and abs(p[1] - pos[1]) < t]
+
+
+def test_hazard_overlay_incremental_matches_full_apply():
+    import random
+    import engine
+    from overlay import HazardOverlay
+    rng = random.Random(3)
+    G, nodes = engine.load_graph()
+    overlay = HazardOverlay(G, nodes)
+    features = []
+    for i in range(20):
+        lat, lng = rng.choice(list(nodes.values()))
+        features.append({'geometry': {'coordinates': [lng, lat]}, 'properties': {'id': f'h{i}', 'severity': rng.random(), 'confidence': rng.random()}})
+    for feature in features:
+        overlay.add(feature)
+    touched = overlay.remove('h3')
+    assert touched and all(G.has_edge(u, v) for u, v in touched)
+    overlay.remove('h7')
+    overlay.remove('unknown')
+    remaining = {'features': [f for f in features if f['properties']['id'] not in ('h3', 'h7')]}
+    expected, _ = engine.load_graph()
+    engine.apply_hazards(expected, nodes, remaining)
+    for u, v in G.edges():
+        assert abs(G[u][v]['hazard_penalty'] - expected[u][v]['hazard_penalty']) < 1e-9
+        assert abs(G[u][v]['weight'] - expected[u][v]['weight']) < 1e-9
+    for feature in features:
+        overlay.remove(feature['properties']['id'])
+    assert all(G[u][v]['hazard_penalty'] == 0 for u, v in G.edges())
+
+
+def test_lru_cache_evicts_and_expires():
+    from cache import LRUCache
+    now = [0.0]
+    cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)  # evicts 'b', the least recently used
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    now[0] = 11
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['expirations']) == (1, 2, 1, 1)
+
+
+def test_route_cache_invalidated_by_hazards_and_external_data():
+    import features
+    from graph_store import GraphStore
+    features.route_cache.clear()
+    store = GraphStore()
+    G, nodes, _ = store.snapshot()
+    first = features.get_route_with_profile(G.copy(), 'A', 'G', 'fastest')
+    assert first == ['A', 'C', 'E', 'G']
+    assert features.get_route_with_profile(G.copy(), 'A', 'G', 'fastest') == first
+    assert features.route_cache.stats()['hits'] == 1
+    # A hazard on E must not be answered from the cache
+    store.add_hazard({'geometry': {'coordinates': [nodes['E'][1], nodes['E'][0]]}, 'properties': {'id': 'he', 'severity': 1.0, 'confidence': 1.0}})
+    G, _, _ = store.snapshot()
+    assert 'E' not in features.get_route_with_profile(G.copy(), 'A', 'G', 'fastest')
+    store.remove_hazard('he')
+    G, _, _ = store.snapshot()
+    assert features.get_route_with_external_data(G.copy(), nodes, 'A', 'G', 'fastest') == first
+    crowded = features.get_route_with_external_data(G.copy(), nodes, 'A', 'G', 'fastest', external_data={'crowd_density': {'E': 50}})
+    assert 'E' not in crowded
+    # Unversioned graphs are never cached
+    H = nx.Graph()
+    H.add_edge('A', 'B', base_cost=1)
+    size = len(features.route_cache)
+    features.get_route_with_profile(H, 'A', 'B', 'fastest')
+    assert len(features.route_cache) == size
+
+
+def test_graph_store_publishes_new_hazard_index_per_change():
+    from graph_store import GraphStore
+    store = GraphStore()
+    G, nodes, hazards = store.snapshot()
+    hazard = {'geometry': {'coordinates': [nodes['E'][1], nodes['E'][0]]}, 'properties': {'id': 'he', 'severity': 1.0, 'confidence': 1.0}}
+    store.add_hazard(hazard)
+    index = G.graph['hazard_index']
+    assert index.hazards is not hazards
+    _, _, added = store.snapshot()
+    assert index.hazards is added and len(index) == 1
+    store.remove_hazard('he')
+    # A reader still holding the previous index sees it unchanged
+    assert len(index) == 1 and index.near_node(nodes['E'])[0] is hazard
+    assert len(G.graph['hazard_index']) == 0
+    # Copy-on-write updates give the same answers as rebuilding, and leave earlier indexes alone
+    import random
+    from spatial import HazardIndex
+    rng = random.Random(2)
+    published = [G.graph['hazard_index']]
+    for i in range(200):
+        hazard_id = f"h{rng.randrange(40)}"
+        if rng.random() < 0.3:
+            store.remove_hazard(hazard_id)
+        else:
+            lat, lng = 1.2902 + rng.random() * 0.0004, 103.8519 + rng.random() * 0.0004
+            store.add_hazard({'geometry': {'coordinates': [lng, lat]}, 'properties': {'id': hazard_id, 'severity': 0.5, 'confidence': 1.0}})
+        published.append(G.graph['hazard_index'])
+    _, _, hazards = store.snapshot()
+    rebuilt = HazardIndex(hazards)
+    for lat, lng in nodes.values():
+        assert [f['properties']['id'] for f in G.graph['hazard_index'].near(lat, lng)] == [f['properties']['id'] for f in rebuilt.near(lat, lng)]
+    for earlier in published:
+        assert len(earlier) == len(earlier.hazards['features'])
+        assert sorted(f['properties']['id'] for f in earlier.features.values()) == sorted(f['properties']['id'] for f in earlier.hazards['features'])
+        assert sum(len(b) for b in earlier.grid._cells.values()) == len(earlier)
+
+
+def test_feature_helpers_leave_shared_graph_untouched():
+    import features
+    from graph_store import GraphStore
+    store = GraphStore()
+    G, nodes, _ = store.snapshot()
+    before = {(u, v): dict(d) for u, v, d in G.edges(data=True)}
+    costs = features.merge_external_data(G, nodes, {'crowd_density': {'B': 2}, 'weather': {'rain': True}})
+    assert costs['A']['B']['hazard_penalty'] == 45
+    fed = features.process_realtime_feedback(costs, ['A', 'B', 'C'], [{'node': 'C', 'severity': 2}])
+    assert fed['B']['C']['hazard_penalty'] == 95
+    assert costs['B']['C']['hazard_penalty'] == 45
+    features.apply_user_preferences(G, {'prefer_covered': True})
+    features.simulate_realtime_hazard(G, nodes, ['A', 'B', 'D', 'F'])
+    features.get_collaborative_route(G, nodes, 'A', 'H', {'features': []}, [{'node': 'B', 'severity': 2}])
+    features.get_predictive_route(G, nodes, 'A', 'H', {'features': []}, time_of_day='morning')
+    assert {(u, v): dict(d) for u, v, d in G.edges(data=True)} == before
+    # Multi-modal weights start from the stored weight every time, so they never compound
+    H = nx.Graph()
+    H.add_edge('A', 'B', weight=10, transit=False)
+    first = features.apply_user_preferences_multi_modal(H, {'prefer_transit': True})
+    second = features.apply_user_preferences_multi_modal(H, {'prefer_transit': True})
+    assert first['A']['B']['weight'] == second['A']['B']['weight'] == 20
+    assert H['A']['B']['weight'] == 10
+
+
+def test_csr_engine_matches_networkx():
+    import random
+    import engine
+    from csr import CSRGraph, profile_costs
+    from costs import profile_cost
+    rng = random.Random(11)
+    G = nx.Graph()
+    nodes = {}
+    for i in range(200):
+        nodes[i] = (1.29 + rng.random() * 0.01, 103.85 + rng.random() * 0.01)
+        G.add_node(i)
+    for i in range(600):
+        u, v = rng.randrange(200), rng.randrange(200)
+        if u != v:
+            G.add_edge(u, v, base_cost=rng.randint(5, 50), hazard_penalty=rng.choice([0, 0, 40]),
+                       slope=rng.random() * 0.1, covered=rng.random() < 0.5)
+    csr = CSRGraph.from_networkx(G, nodes)
+    prefs = {'avoid_slope': False, 'prefer_covered': True}
+    cost = profile_costs(csr.attributes, prefs)
+    weight = profile_cost(prefs)
+    path_cost = lambda p: sum(weight(G[a][b]) for a, b in zip(p, p[1:]))
+    for _ in range(30):
+        s, t = rng.randrange(200), rng.randrange(200)
+        if not nx.has_path(G, s, t):
+            continue
+        expected = nx.dijkstra_path_length(G, s, t, weight=lambda a, b, d: weight(d))
+        for path in (csr.dijkstra(s, t, cost), csr.astar(s, t, cost)):
+            assert path[0] == s and path[-1] == t
+            assert abs(path_cost(path) - expected) < 1e-6 * max(1, expected)
+    # One tree answers many targets, unreachable ones are left out
+    tree = csr.shortest_paths(0, range(200), cost)
+    assert set(tree) == nx.node_connected_component(G, 0)
+    for t in rng.sample(sorted(tree), 20):
+        assert tree[t][0] == 0 and tree[t][-1] == t
+        assert abs(path_cost(tree[t]) - nx.dijkstra_path_length(G, 0, t, weight=lambda a, b, d: weight(d))) < 1e-6 * max(1, path_cost(tree[t]))
+    G2, _ = engine.load_graph()
+    length = lambda p: sum(G2[a][b]['base_cost'] for a, b in zip(p, p[1:]))
+    assert length(engine.compute_route(G2, 'A', 'H', engine='csr')) == length(engine.compute_route(G2, 'A', 'H'))
+
+
+def test_graph_store_keeps_csr_in_sync():
+    import features
+    from csr import csr_graph
+    from graph_store import GraphStore
+    store = GraphStore()
+    G, nodes, _ = store.snapshot()
+    csr = csr_graph(G)
+    assert features.get_route_with_profile(G, 'A', 'G', 'fastest', engine='csr') == ['A', 'C', 'E', 'G']
+    store.add_hazard({'geometry': {'coordinates': [nodes['E'][1], nodes['E'][0]]}, 'properties': {'id': 'he', 'severity': 1.0, 'confidence': 1.0}})
+    G, _, _ = store.snapshot()
+    assert csr_graph(G) is csr
+    assert csr.attributes['hazard_penalty'][csr.edge_id('C', 'E')] == 100
+    assert 'E' not in features.get_route_with_profile(G, 'A', 'G', 'fastest', engine='csr')
+    crowded = features.get_route_multi_modal(features.merge_external_data(G, nodes, {'crowd_density': {'D': 50}}), 'A', 'H', 'walking', 'fastest', engine='csr')
+    assert 'D' not in crowded
+
+
+def test_build_graph_artifact_roundtrip(tmp_path):
+    import json
+    import numpy as np
+    import engine
+    from build_graph import build
+    from csr import load_csr
+    osm = tmp_path / "region.osm"
+    osm.write_text("""<osm>
+      <node id="1" lat="1.2900" lon="103.8500"/><node id="2" lat="1.2901" lon="103.8500"/>
+      <node id="3" lat="1.2902" lon="103.8500"/><node id="4" lat="1.2901" lon="103.8501"/>
+      <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="footway"/></way>
+      <way id="11"><nd ref="2"/><nd ref="4"/><tag k="highway" v="steps"/><tag k="incline" v="10%"/></way>
+      <way id="12"><nd ref="3"/><nd ref="4"/><tag k="highway" v="motorway"/></way>
+    </osm>""")
+    stats = build(str(osm), str(tmp_path / "osm_graph"))
+    assert stats == {'ways': 2, 'nodes': 4, 'edges': 3}
+    csr = load_csr(str(tmp_path / "osm_graph"))
+    assert isinstance(csr.targets, np.memmap)
+    steps = csr.edge_id(1, 3)
+    assert csr.attributes['stairs'][steps] and abs(csr.attributes['slope'][steps] - 0.1) < 1e-6
+    assert abs(csr.attributes['base_cost'][csr.edge_id(0, 1)] - 11.1) < 0.1  # metres
+    network = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [[103.85, 1.29], [103.8501, 1.29], [103.8502, 1.29]]}, 'properties': {'covered': 'yes'}},
+        {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [[103.85, 1.29], [103.8501, 1.2901], [103.8502, 1.29]]}, 'properties': {'base_cost': 5}},
+    ]}
+    path = tmp_path / "network.geojson"
+    path.write_text(json.dumps(network))
+    build(str(path), str(tmp_path / "geo_graph"))
+    G, nodes = engine.load_graph(str(tmp_path / "geo_graph"))
+    assert G.number_of_nodes() == 4 and G.number_of_edges() == 4
+    assert engine.compute_route(G, '0', '2') == ['0', '3', '2']
+    assert engine.compute_route(G, '0', '2', engine='csr') == ['0', '3', '2']
+    assert G['0']['1']['covered'] is True
+
+
+def test_cch_matches_dijkstra_and_recustomizes(tmp_path):
+    import json
+    import random
+    import numpy as np
+    import engine
+    import features
+    from build_graph import build
+    from cch import CCH, load_cch
+    from csr import CSRGraph, multi_modal_costs
+    from costs import multi_modal_cost, multi_modal_preferences
+    from graph_store import GraphStore
+    rng = random.Random(3)
+    G = nx.Graph()
+    nodes = {i: (1.29 + rng.random() * 0.01, 103.85 + rng.random() * 0.01) for i in range(300)}
+    G.add_nodes_from(nodes)
+    for i in range(300):
+        # Mostly near neighbours, like a street network
+        for j in sorted(nodes, key=lambda j: (nodes[i][0] - nodes[j][0]) ** 2 + (nodes[i][1] - nodes[j][1]) ** 2)[1:rng.randint(2, 4)]:
+            G.add_edge(i, j, base_cost=rng.randint(5, 50), stairs=rng.random() < 0.05, slope=rng.random() * 0.1)
+    csr = CSRGraph.from_networkx(G, nodes)
+    hierarchy = CCH.from_csr(csr)
+    prefs = multi_modal_preferences('wheelchair', 'safest')
+    weight = multi_modal_cost(prefs)
+    cost = multi_modal_costs(csr.attributes, prefs)
+    hierarchy.customize('wheelchair', cost)
+
+    def check(cost):
+        for _ in range(60):
+            s, t = rng.randrange(300), rng.randrange(300)
+            path = hierarchy.path('wheelchair', s, t)
+            try:
+                expected = nx.dijkstra_path_length(G, s, t, weight=lambda a, b, d: cost[csr.edge_id(a, b)])
+            except nx.NetworkXNoPath:
+                expected = np.inf
+            if expected == np.inf:
+                assert path is None
+                continue
+            assert path[0] == s and path[-1] == t
+            assert abs(sum(cost[csr.edge_id(a, b)] for a, b in zip(path, path[1:])) - expected) < 1e-6 * max(1, expected)
+    check(cost)
+    assert np.array_equal(cost, [weight(G[csr.node_names[u]][csr.node_names[v]]) for u, v in zip(csr.edge_u, csr.edge_v)])
+    # A few changed edges re-customize incrementally to the same weights as from scratch
+    changed = cost.copy()
+    changed[rng.sample(range(len(cost)), 5)] += 100
+    hierarchy.customize('wheelchair', changed)
+    hierarchy.customize('scratch', changed)
+    assert np.array_equal(hierarchy.metrics['wheelchair']['weight'], hierarchy.metrics['scratch']['weight'])
+    check(changed)
+    hierarchy.save(str(tmp_path / "cch"))
+    loaded = load_cch(str(tmp_path / "cch"))
+    assert loaded.matches(csr)
+    loaded.customize('wheelchair', changed)
+    assert np.array_equal(loaded.metrics['wheelchair']['weight'], hierarchy.metrics['scratch']['weight'])
+
+    # Engine integration: hazard updates re-customize the hierarchy kept on the graph
+    store = GraphStore()
+    G2, nodes2, _ = store.snapshot()
+    assert features.get_route_with_profile(G2, 'A', 'G', 'fastest', engine='cch') == ['A', 'C', 'E', 'G']
+    assert engine.compute_route(G2, 'A', 'H', engine='cch') == engine.compute_route(G2, 'A', 'H')
+    store.add_hazard({'geometry': {'coordinates': [nodes2['E'][1], nodes2['E'][0]]}, 'properties': {'id': 'he', 'severity': 1.0, 'confidence': 1.0}})
+    G2, _, _ = store.snapshot()
+    assert 'E' not in features.get_route_with_profile(G2, 'A', 'G', 'fastest', engine='cch')
+    assert G2.graph['cch'].matches(G2.graph['csr'])
+    # build_graph --cch stores the hierarchy with the artifact
+    network = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [[103.85, 1.29], [103.8501, 1.29], [103.8502, 1.29]]}, 'properties': {}},
+        {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [[103.85, 1.29], [103.8501, 1.2901], [103.8502, 1.29]]}, 'properties': {'base_cost': 5}},
+    ]}
+    (tmp_path / "network.geojson").write_text(json.dumps(network))
+    assert build(str(tmp_path / "network.geojson"), str(tmp_path / "graph"), cch=True)['cch_arcs'] >= 4
+    G3, _ = engine.load_graph(str(tmp_path / "graph"))
+    assert 'cch' in G3.graph
+    assert engine.compute_route(G3, '0', '2', engine='cch') == ['0', '3', '2']
+
+
+def test_snapper_matches_brute_force():
+    import math
+    import random
+    from snap import NodeSnapper, node_snapper
+    rng = random.Random(11)
+    G = nx.Graph()
+    nodes = {f"n{i}": (1.29 + rng.random() * 0.01, 103.85 + rng.random() * 0.01) for i in range(400)}
+    G.add_nodes_from(nodes)
+    names = list(nodes)
+    for _ in range(600):
+        a = rng.choice(names)
+        # Mostly short edges plus a few long ones
+        b = min(names, key=lambda n: (nodes[n][0] - nodes[a][0] - rng.gauss(0, 3e-4)) ** 2 + (nodes[n][1] - nodes[a][1]) ** 2) if rng.random() < 0.9 else rng.choice(names)
+        if a != b:
+            G.add_edge(a, b)
+    snapper = NodeSnapper.from_graph(G, nodes, cell_m=30)
+    kx = math.cos(math.radians(snapper.lat0))
+
+    def metres(p, q):
+        return math.hypot((p[1] - q[1]) * kx, p[0] - q[0]) * snapper._ky
+
+    def segment(q, a, b):
+        dx, dy = (b[1] - a[1]) * kx, b[0] - a[0]
+        length2 = dx * dx + dy * dy
+        t = 0 if not length2 else max(0, min(1, ((q[1] - a[1]) * kx * dx + (q[0] - a[0]) * dy) / length2))
+        return metres(q, (a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1])))
+
+    for _ in range(100):
+        q = (1.285 + rng.random() * 0.02, 103.845 + rng.random() * 0.02)
+        expected = sorted(metres(q, p) for p in nodes.values())[:3]
+        hits = snapper.nearest(q[0], q[1], k=3)
+        assert [round(d, 6) for _, d in hits] == [round(d, 6) for d in expected]
+        assert metres(q, nodes[hits[0][0]]) == min(metres(q, p) for p in nodes.values())
+        snap = snapper.snap_to_edge(*q)
+        best = min(segment(q, nodes[u], nodes[v]) for u, v in G.edges())
+        assert abs(snap.distance_m - best) < 1e-6 and G.has_edge(snap.u, snap.v) and 0 <= snap.t <= 1
+        split = (nodes[snap.u][0] + snap.t * (nodes[snap.v][0] - nodes[snap.u][0]), nodes[snap.u][1] + snap.t * (nodes[snap.v][1] - nodes[snap.u][1]))
+        assert abs(split[0] - snap.lat) < 1e-9 and abs(split[1] - snap.lng) < 1e-9
+        assert abs(metres(q, split) - snap.distance_m) < 1e-6
+    assert snapper.nearest_batch([1.29, 1.295], [103.85, 103.855]) == [snapper.nearest(1.29, 103.85), snapper.nearest(1.295, 103.855)]
+    assert node_snapper(G, nodes) is node_snapper(G, nodes)
+    # Far off the graph (100 km to 1000 km) the answer is the same, without walking thousands of empty rings
+    import time
+    started = time.perf_counter()
+    for q in ((2.2, 103.85), (1.29, 112.9), (-7.7, 112.9)):
+        expected = min(metres(q, p) for p in nodes.values())
+        assert abs(snapper.nearest(*q)[0][1] - expected) < 1e-6
+        assert abs(snapper.snap_to_edge(*q).distance_m - min(segment(q, nodes[u], nodes[v]) for u, v in G.edges())) < 1e-6
+    assert time.perf_counter() - started < 1
+
+
+def test_distance_matrix_matches_single_routes():
+    import random
+    from costs import multi_modal_cost, multi_modal_preferences, profile_cost, profile_preferences
+    from matrix import distance_matrix
+    rng = random.Random(5)
+    G = nx.Graph()
+    nodes = {i: (1.29 + rng.random() * 0.01, 103.85 + rng.random() * 0.01) for i in range(120)}
+    G.add_nodes_from(nodes)
+    for _ in range(300):
+        u, v = rng.randrange(120), rng.randrange(120)
+        if u != v:
+            G.add_edge(u, v, base_cost=rng.randint(5, 50), slope=rng.random() * 0.08,
+                       stairs=rng.random() < 0.1, covered=rng.random() < 0.5)
+    G.add_node(999)  # unreachable
+    sources, targets = rng.sample(range(120), 10) + [999], rng.sample(range(120), 15) + [999, 'missing']
+    for mode, weight in ((None, profile_cost(profile_preferences('safest'))),
+                         ('wheelchair', multi_modal_cost(multi_modal_preferences('wheelchair', 'safest')))):
+        for engine in ('csr', 'networkx'):
+            M = distance_matrix(G, sources, targets, mode=mode, engine=engine)
+            assert M.shape == (len(sources), len(targets))
+            for i, s in enumerate(sources):
+                for j, t in enumerate(targets):
+                    if t in G and s in G and nx.has_path(G, s, t):
+                        expected = nx.dijkstra_path_length(G, s, t, weight=lambda a, b, d: weight(d))
+                        assert M[i, j] == expected or abs(M[i, j] - expected) < 1e-6 * expected
+                    else:
+                        assert M[i, j] == float('inf')
+
+
+def test_alternative_routes_are_bounded_and_dissimilar():
+    import time
+    from alternatives import alternative_routes, path_cost, shared_fraction, _edge_keys
+    # A 40x40 grid has astronomically many simple paths between opposite corners
+    G = nx.grid_2d_graph(40, 40)
+    nx.set_edge_attributes(G, 1, 'weight')
+    weight = lambda u, v, d: d['weight']
+    for method in ('penalty', 'yen'):
+        began = time.monotonic()
+        paths = alternative_routes(G, (0, 0), (39, 39), k=3, method=method, max_overlap=0.7, max_stretch=1.2, time_budget=2)
+        assert time.monotonic() - began < 5
+        best = path_cost(G, paths[0], weight)
+        assert best == 78 and 1 <= len(paths) <= 4
+        for i, p in enumerate(paths[1:], 1):
+            assert p[0] == (0, 0) and p[-1] == (39, 39)
+            assert path_cost(G, p, weight) <= 1.2 * best
+            assert all(shared_fraction(G, p, _edge_keys(G, q)) <= 0.7 for q in paths[:i])
+    assert len(alternative_routes(G, (0, 0), (39, 39), k=3, time_budget=0)) == 2
+    assert len(get_alternative_routes(G, (0, 0), (39, 39), k=0)) == 1
+
+
 if __name__ == "__main__":
     print("\n--- Route with External Data Integration Demo ---")
     test_get_route_with_external_data()
@@ -271,3 +719,171 @@ if __name__ == "__main__":
     test_get_predictive_route()
     test_get_collaborative_route()
     print("All routing feature tests passed.")
+
+
+def test_incremental_planner_repairs_after_edge_changes():
+    import random
+    from replan import IncrementalPlanner, NavigationSessions
+    rng = random.Random(8)
+    G = nx.grid_2d_graph(15, 15)
+    for u, v in G.edges():
+        G[u][v]['w'] = rng.uniform(1, 10)
+    weight = lambda u, v, d: d['w']
+    planner = IncrementalPlanner(G, (0, 0), (14, 14), weight)
+    for _ in range(15):
+        path = planner.path()
+        changed = []
+        for _ in range(4):
+            i = rng.randrange(len(path) - 1) if len(path) > 1 and rng.random() < 0.5 else None
+            u, v = (path[i], path[i + 1]) if i is not None else rng.choice(list(G.edges()))
+            G[u][v]['w'] = rng.choice([0.5, 50, rng.uniform(1, 10)])
+            changed.append((u, v))
+        planner.update_edges(changed)
+        if len(path) > 2:
+            planner.move_to(path[1])
+        expected = nx.dijkstra_path_length(G, planner.start, (14, 14), weight='w')
+        route = planner.path()
+        assert route[0] == planner.start and route[-1] == (14, 14)
+        assert abs(sum(G[a][b]['w'] for a, b in zip(route, route[1:])) - expected) < 1e-9
+        assert abs(planner.cost() - expected) < 1e-9
+
+    # Only sessions routed over a changed edge are repaired at once
+    sessions = NavigationSessions()
+    a = sessions.start(G, (0, 0), (0, 14), weight)
+    b = sessions.start(G, (14, 0), (14, 14), weight)
+    u, v = a.route[3], a.route[4]
+    G[u][v]['w'] = float('inf')
+    rerouted = sessions.edges_changed([(u, v)])
+    assert list(rerouted) == [a.session_id]
+    assert frozenset((u, v)) not in {frozenset(e) for e in zip(rerouted[a.session_id], rerouted[a.session_id][1:])}
+    assert sessions.get(a.session_id).reroutes == 1 and sessions.get(b.session_id).reroutes == 0
+    step = a.route[1]
+    assert sessions.advance(a.session_id, step).route[0] == step
+    assert sessions.close(b.session_id) and len(sessions) == 1
+
+def test_heatmap_scores_match_loop_and_tiles_cover_nodes():
+    import math
+    import random
+    from features import accessibility_heatmap
+    from heatmap import AccessibilityHeatmap, RollingMean
+    rng = random.Random(3)
+    for directed in (False, True):
+        G = nx.gnm_random_graph(60, 200, seed=5, directed=directed)
+        G.add_edge(7, 7)
+        for u, v in G.edges():
+            if rng.random() < 0.6:
+                G[u][v]['hazard_penalty'] = rng.choice([12.5, 100, 333, rng.uniform(0, 80)])
+        expected = {}
+        for n in G.nodes():
+            score = 100
+            for nbr in G.neighbors(n):
+                score -= G[n][nbr].get('hazard_penalty', 0) / 10
+            expected[n] = max(0, round(score, 1))
+        heatmap = accessibility_heatmap(G, dict.fromkeys(G.nodes()))
+        assert all(abs(heatmap[n] - expected[n]) <= 0.1 + 1e-9 for n in G.nodes())
+
+    trend = RollingMean(window=2)
+    for snapshot in ({'A': 80, 'B': 90}, {'A': 70, 'B': 95}, {'A': 60, 'C': 50}):
+        trend.add(snapshot)
+    assert trend.means() == {'A': 65.0, 'B': 95.0, 'C': 50.0}
+
+    G = nx.Graph(version=1, hazard_epoch=0)
+    nodes = {'A': (1.3000, 103.8000), 'B': (1.3001, 103.8010), 'C': (1.3500, 103.9000)}
+    G.add_edge('A', 'B', hazard_penalty=500)
+    G.add_edge('B', 'C')
+    from csr import csr_graph
+    csr = csr_graph(G, nodes)
+    tiles = AccessibilityHeatmap(cache_size=8)
+    z = 16
+    lat, lng = nodes['A']
+    x = int((lng + 180) / 360 * 2 ** z)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * 2 ** z)
+    tile = tiles.tile(G, z, x, y, 'json')
+    cells = [s for row in tile['scores'] for s in row if s is not None]
+    assert tile['nodes'] == 2 and set(cells) == {50.0}
+    assert tiles.tile(G, z, x, y, 'png').startswith(b'\x89PNG')
+    assert tiles.tile(G, z, x, y, 'json') is tile
+    # As GraphStore does on a hazard change: update the CSR in place and bump its stamp
+    G['A']['B']['hazard_penalty'] = 0
+    G.graph['hazard_epoch'] = 1
+    csr.set_edge_attributes(G, [('A', 'B')])
+    csr.stamp = (1, 1)
+    assert all(s in (None, 100.0) for row in tiles.tile(G, z, x, y, 'json')['scores'] for s in row)
+
+def test_isochrones_bounded_by_mode_and_cached():
+    from isochrone import MODE_SPEEDS, isochrone_cache, isochrones
+    # 11x11 street grid about 100 m apart; the rung south of the origin is stairs
+    G = nx.Graph(version=1, hazard_epoch=0)
+    nodes = {}
+    for i in range(11):
+        for j in range(11):
+            nodes[(i, j)] = (1.30 + i * 0.0009, 103.80 + j * 0.0009)
+    for (i, j) in nodes:
+        for di, dj in ((1, 0), (0, 1)):
+            if (i + di, j + dj) in nodes:
+                G.add_edge((i, j), (i + di, j + dj), base_cost=100.0, weight=100.0)
+    G[(5, 5)][(4, 5)]['stairs'] = True
+    from csr import csr_graph
+    csr = csr_graph(G, nodes)
+    walk = isochrones(G, (5, 5), [5, 2.5], mode="walking")
+    assert [f['properties']['minutes'] for f in walk['features']] == [2.5, 5.0]
+    small, large = walk['features']
+    assert 0 < small['properties']['cells'] < large['properties']['cells']
+    # 400 m of walking reaches the 41 nodes within four blocks
+    assert large['properties']['nodes'] == 41
+    ring = large['geometry']['coordinates'][0][0]
+    assert len(ring) == 7 and ring[0] == ring[-1]
+    assert isochrones(G, (5, 5), [2.5, 5], mode="walking") is walk
+
+    wheelchair = isochrones(G, (5, 5), [5], mode="wheelchair")
+    dist = nx.single_source_dijkstra_path_length(G, (5, 5), weight=lambda u, v, d: None if d.get('stairs') else 100.0)
+    assert wheelchair['features'][0]['properties']['nodes'] == sum(d <= 5 * MODE_SPEEDS['wheelchair'] for d in dist.values())
+    # A new hazard epoch is a new cache entry
+    G.graph['hazard_epoch'] = 1
+    csr.stamp = (1, 1)
+    assert isochrones(G, (5, 5), [2.5, 5], mode="walking") is not walk
+    assert len(isochrone_cache) >= 3
+
+def test_route_annotation_corridor_dedupes_and_orders_alerts():
+    import random
+    from annotate import RouteAnnotator
+    from spatial import HazardIndex
+    rng = random.Random(11)
+    t = 0.00005
+    nodes = {i: (1.3 + i * 0.0003, 103.8 + (i % 2) * 0.0002) for i in range(12)}
+    path = list(range(12))
+    features = []
+    for k in range(300):
+        i = rng.randrange(11)
+        f = rng.random()
+        lat = nodes[i][0] + f * (nodes[i + 1][0] - nodes[i][0]) + rng.uniform(-2 * t, 2 * t)
+        lng = nodes[i][1] + f * (nodes[i + 1][1] - nodes[i][1]) + rng.uniform(-2 * t, 2 * t)
+        features.append({'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+                         'properties': {'id': f'h{k % 250}', 'severity': rng.random()}})
+    index = HazardIndex({'features': features}, t)
+    near, alerts = RouteAnnotator(nodes, index, t).annotate(path)
+
+    # Per-point hazards are exactly the old per-node box scan
+    for n, point_hazards in zip(path, near):
+        lat, lng = nodes[n]
+        expected = [f['properties']['id'] for f in features
+                    if abs(f['geometry']['coordinates'][1] - lat) < t and abs(f['geometry']['coordinates'][0] - lng) < t]
+        assert [h['id'] for h in point_hazards] == expected
+        assert all(h['recommended_action'] in ('avoid', 'caution') for h in point_hazards)
+
+    # Alerts: every hazard within the box of some point of the polyline, once per id, in route order
+    def near_polyline(lat, lng):
+        for i in range(11):
+            (a_lat, a_lng), (b_lat, b_lng) = nodes[i], nodes[i + 1]
+            for s in (j / 2000 for j in range(2001)):
+                if abs(a_lat + s * (b_lat - a_lat) - lat) < t and abs(a_lng + s * (b_lng - a_lng) - lng) < t:
+                    return True
+        return False
+    expected_ids = {f['properties']['id'] for f in features if near_polyline(f['geometry']['coordinates'][1], f['geometry']['coordinates'][0])}
+    ids = [a['id'] for a in alerts]
+    assert len(ids) == len(set(ids)) and set(ids) == expected_ids
+    distances = [a['distance_along_route'] for a in alerts]
+    from csr import haversine
+    length = sum(haversine(*nodes[i], *nodes[i + 1]) for i in range(11))
+    assert distances == sorted(distances) and 0 <= distances[0] and distances[-1] <= length + 0.1
+    assert 'recommended_action' not in alerts[0]
@@ -1,3 +1,4 @@
+import os
 import pytest
 from fastapi.testclient import TestClient
 from backend.main import app
@@ -55,3 +56,610 @@ def test_route():
     assert "route" in response.json()
     assert "route_geojson" in response.json()
     assert "hazard_alerts" in response.json()
+
+def test_route_sees_new_hazard():
+    payload = {"from_node": "A", "to_node": "C", "profile": "fastest"}
+    before = client.post("/route", json=payload).json()
+    hazard = {
+        "lng": 103.852000,
+        "lat": 1.290300,
+        "hazard_type": "obstacle",
+        "severity": 1.0,
+        "confidence": 1.0,
+        "hazard_id": "testblock"
+    }
+    client.post("/hazards", json=hazard)
+    try:
+        after = client.post("/route", json=payload).json()
+        assert not any(h["id"] == "testblock" for h in before["hazard_alerts"])
+        assert any(h["id"] == "testblock" for h in after["hazard_alerts"])
+    finally:
+        client.delete("/hazards/testblock")
+
+def test_hazard_store_log_replay_and_compaction(tmp_path):
+    from backend.hazard_store import HazardStore
+    path = str(tmp_path / "hazards.geojson")
+    store = HazardStore(path, compact_every=0)
+    for i in range(5):
+        store.add({"type": "Feature", "geometry": {"type": "Point", "coordinates": [103.85, 1.29]}, "properties": {"id": f"h{i}", "severity": 0.5}})
+    store.delete("h1")
+    store.update("h2", {"severity": 0.9})
+    # Crash recovery: a new instance replays the log, ignoring a torn last record
+    with open(store.log_path, "a") as f:
+        f.write('{"op":"add","id":"torn"')
+    recovered = HazardStore(path, compact_every=0)
+    assert [f["properties"]["id"] for f in recovered.all()] == ["h0", "h2", "h3", "h4"]
+    assert recovered.get("h2")["properties"]["severity"] == 0.9
+    # Another instance's writes are picked up by refresh()
+    store.add({"type": "Feature", "geometry": {"type": "Point", "coordinates": [103.85, 1.29]}, "properties": {"id": "h5"}})
+    assert recovered.refresh()
+    assert "h5" in recovered
+    recovered.compact()
+    assert os.path.getsize(recovered.log_path) == 0
+    assert len(HazardStore(path)) == 5
+    assert store.refresh() and len(store) == 5
+
+def test_hazard_store_writers_share_the_log(tmp_path):
+    from backend.hazard_store import HazardStore
+    path = str(tmp_path / "hazards.geojson")
+    a, b = HazardStore(path, compact_every=4), HazardStore(path, compact_every=0)
+    point = {"type": "Point", "coordinates": [103.85, 1.29]}
+    ids = [a.next_id(), b.next_id()]
+    assert ids[0] != ids[1] and ids[0].startswith("hazard_")
+    a.add({"type": "Feature", "geometry": point, "properties": {"id": ids[0]}})
+    b.add({"type": "Feature", "geometry": point, "properties": {"id": ids[1]}})
+    # b's write replayed a's first, so b knows both; then a delete in b is seen by a's next write
+    assert b.delete(ids[0]) == 1
+    assert a.update(ids[0], {"severity": 1.0}) is None
+    # a's fourth record (two replayed) compacted the log from inside the write without deadlocking
+    a.add({"type": "Feature", "geometry": point, "properties": {"id": "h3"}})
+    assert os.path.getsize(a.log_path) == 0
+    assert sorted(HazardStore(path).get(i) is not None for i in (ids[0], ids[1], "h3")) == [False, True, True]
+
+@pytest.mark.parametrize("backend", ["geojson", "sqlite"])
+def test_hazard_store_queries(tmp_path, backend):
+    from backend.hazard_store import open_hazard_store
+    store = open_hazard_store(backend, str(tmp_path / "hazards.geojson"), str(tmp_path / "hazards.db"))
+    for i in range(10):
+        store.add({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [103.85 + i * 0.001, 1.29 + i * 0.001]},
+            "properties": {"id": f"h{i}", "type": "curb" if i % 2 else "obstacle", "last_seen": f"2025-12-{i + 1:02d}T00:00:00Z"}
+        })
+    ids = lambda fs: [f["properties"]["id"] for f in fs]
+    assert ids(store.query(bbox=(103.8515, 1.2915, 103.8535, 1.2935))[0]) == ["h2", "h3"]
+    assert ids(store.query(since="2025-12-08T00:00:00+00:00")[0]) == ["h7", "h8", "h9"]
+    assert ids(store.query(hazard_type="curb", since="2025-12-04")[0]) == ["h3", "h5", "h7", "h9"]
+    page, cursor = store.query(limit=4)
+    seen = ids(page)
+    while cursor:
+        page, cursor = store.query(limit=4, cursor=cursor)
+        seen += ids(page)
+    assert seen == [f"h{i}" for i in range(10)]
+    for bad in ({"since": "zzz"}, {"cursor": "abc"}, {"cursor": "-4"}):
+        with pytest.raises(ValueError):
+            store.query(**bad)
+    store.delete("h0")
+    store.update("h1", {"severity": 0.2})
+    assert len(store) == 9 and store.get("h1")["properties"]["severity"] == 0.2
+
+def test_sqlite_hazard_store_change_feed(tmp_path):
+    from backend.hazard_store import SQLiteHazardStore
+    path = str(tmp_path / "hazards.db")
+    a, b = SQLiteHazardStore(path), SQLiteHazardStore(path)
+    events = []
+    b.subscribe(lambda op, hazard_id, feature: events.append((op, hazard_id)))
+    a.add({"type": "Feature", "geometry": {"type": "Point", "coordinates": [103.85, 1.29]}, "properties": {"id": "x"}})
+    a.delete("x")
+    assert b.refresh()
+    assert events == [("add", "x"), ("delete", "x")]
+    assert not b.refresh()
+
+def test_get_hazards_bbox():
+    response = client.get("/hazards", params={"bbox": "103.8519,1.2902,103.85197,1.29028"})
+    assert response.status_code == 200
+    ids = [f["properties"]["id"] for f in response.json()["features"]]
+    assert "hazard1" in ids and "hazard2" not in ids
+    assert client.get("/hazards", params={"bbox": "1,2,3"}).status_code == 400
+    for params, error in (({"since": "zzz"}, "Invalid since"), ({"cursor": "abc"}, "Invalid cursor")):
+        response = client.get("/hazards", params=params)
+        assert response.status_code == 400 and response.json()["error"] == error
+
+@pytest.fixture
+def onemap_stub():
+    """Local stand-in for OneMap: counts calls, with a settable status and delay."""
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state = {"calls": 0, "status": 200, "delay": 0.0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state["calls"] += 1
+            time.sleep(state["delay"])
+            body = b'{"status_message": "Found route between points", "route_geometry": "_p~iF~ps|U_ulLnnqC"}'
+            self.send_response(state["status"])
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{server.server_port}/route"
+    yield state
+    server.shutdown()
+
+def test_onemap_client_caches_and_coalesces(onemap_stub):
+    import asyncio
+    from onemap import OneMapClient
+
+    async def scenario():
+        om = OneMapClient(onemap_stub["url"])
+        onemap_stub["delay"] = 0.2
+        # Concurrent identical misses share one upstream call
+        results = await asyncio.gather(*[om.route((1.2900001, 103.85), (1.2906, 103.8523)) for _ in range(5)])
+        assert onemap_stub["calls"] == 1 and om.coalesced == 4
+        assert all(r["route_geometry"] == results[0]["route_geometry"] for r in results)
+        # Coordinates within rounding hit the cache
+        await om.route((1.29, 103.85), (1.2906, 103.8523))
+        assert onemap_stub["calls"] == 1
+        await om.route((1.29, 103.85), (1.2906, 103.8523), "drive")
+        assert onemap_stub["calls"] == 2
+        await om.aclose()
+    asyncio.run(scenario())
+
+def test_onemap_circuit_breaker_fails_fast(onemap_stub):
+    import asyncio
+    from onemap import CircuitBreaker, OneMapClient, OneMapUnavailable
+    now = [0.0]
+
+    async def scenario():
+        om = OneMapClient(onemap_stub["url"], timeout=0.1, breaker=CircuitBreaker(2, 30, clock=lambda: now[0]))
+        onemap_stub["delay"] = 0.3  # slower than the timeout
+        for lng in (103.80, 103.81):
+            with pytest.raises(OneMapUnavailable):
+                await om.route((1.29, lng), (1.30, 103.85))
+        assert om.breaker.state == "open"
+        calls = onemap_stub["calls"]
+        with pytest.raises(OneMapUnavailable):
+            await om.route((1.29, 103.82), (1.30, 103.85))
+        assert onemap_stub["calls"] == calls
+        # After the reset period one trial call goes through and closes the breaker
+        now[0] = 31
+        onemap_stub["delay"] = 0
+        await om.route((1.29, 103.83), (1.30, 103.85))
+        assert om.breaker.state == "closed"
+        await om.aclose()
+    asyncio.run(scenario())
+
+def test_onemap_route_falls_back_to_local_engine(onemap_stub, monkeypatch):
+    from backend import main
+    from onemap import OneMapClient
+    monkeypatch.setattr(main, "onemap_client", OneMapClient(onemap_stub["url"]))
+    onemap_stub["status"] = 503
+    completed = main.route_executor.completed
+    response = client.get("/route/onemap", params={"start": "1.290270,103.851959", "end": "1.290600,103.852300"})
+    assert response.status_code == 200
+    assert response.json()["source"] == "local" and response.json()["route_geometry"]
+    # The fallback runs in the route pool, not on the event loop
+    assert main.route_executor.completed == completed + 1
+    onemap_stub["status"] = 200
+    response = client.get("/route/onemap", params={"start": "1.2902,103.8519", "end": "1.2906,103.8523"})
+    assert response.json()["route_geometry"] == "_p~iF~ps|U_ulLnnqC"
+    assert client.get("/route/onemap", params={"start": "x", "end": "1,2"}).status_code == 400
+
+def test_route_executor_backpressure_and_process_pool():
+    import asyncio
+    import time
+    from backend import main
+    from route_executor import RouteExecutor, RouteExecutorSaturated
+    from routing import engine
+    from routing.graph_store import GraphStore
+    request = {"from_node": "A", "to_node": "G", "profile": "safest"}
+
+    def slow_loader():
+        time.sleep(0.3)
+        return engine.load_graph()
+
+    async def saturate():
+        executor = RouteExecutor(main.route_executor.settings, max_pending=1, store=GraphStore(loader=slow_loader))
+        results = await asyncio.gather(executor.run(request), executor.run(request), return_exceptions=True)
+        executor.shutdown()
+        return results
+    first, second = asyncio.run(saturate())
+    assert first["route"][0]["node"] == "A" and isinstance(second, RouteExecutorSaturated)
+    # A batch gives its slot back when finished, closed, or dropped without ever being iterated
+    executor = RouteExecutor(main.route_executor.settings, max_pending=1, store=GraphStore())
+    batch = executor.run_batch([request])
+    with pytest.raises(RouteExecutorSaturated):
+        executor.run_batch([request])
+    del batch
+    assert executor.in_flight == 0
+
+    async def drain():
+        return [r async for r in executor.run_batch([request])]
+    assert asyncio.run(drain())[0]["index"] == 0 and executor.in_flight == 0
+    asyncio.run(executor.run_batch([request]).aclose())
+    assert executor.in_flight == 0
+    executor.shutdown()
+
+    async def in_processes():
+        executor = RouteExecutor(main.route_executor.settings, workers=2)
+        await executor.warm_up()
+        results = await asyncio.gather(*[executor.run(request) for _ in range(4)])
+        executor.shutdown()
+        return results
+    expected = client.post("/route", json=request).json()
+    assert all(r["route"] == expected["route"] for r in asyncio.run(in_processes()))
+
+def test_route_batch_streams_ndjson():
+    import json
+    reqs = [
+        {"from_node": "A", "to_node": "G"},
+        {"from_node": "A", "to_node": "H"},
+        {"from_node": "A", "to_node": "H", "profile": "fastest"},
+        {"from_node": "B", "to_node": "E", "external_data": {"weather": {"rain": True}}},
+        {"from_node": "A", "to_node": "nowhere"},
+    ]
+    response = client.post("/route/batch", json=reqs)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    results = {r["index"]: r for r in lines}
+    assert sorted(results) == list(range(len(reqs)))
+    for i, req in enumerate(reqs[:4]):
+        single = client.post("/route", json=req).json()
+        assert results[i]["route"] == single["route"]
+        assert results[i]["hazard_alerts"] == single["hazard_alerts"]
+    assert results[4]["error"] == "No route found"
+
+def test_route_matrix():
+    payload = {
+        "sources": [{"node": "A"}, {"lat": 1.290270, "lng": 103.851959}],
+        "targets": [{"node": "G"}, {"node": "H"}, {"node": "A"}],
+        "profile": "fastest"
+    }
+    response = client.post("/route/matrix", json=payload)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["sources"][0] == "A" and body["targets"] == ["G", "H", "A"]
+    assert len(body["costs"]) == 2 and all(len(row) == 3 for row in body["costs"])
+    assert body["costs"][0][2] == 0 and body["costs"][0][0] > 0
+    assert client.post("/route/matrix", json={"sources": [{}], "targets": [{"node": "A"}]}).status_code == 400
+
+def test_routes_on_graph_artifact(tmp_path, monkeypatch):
+    import json
+    from backend import main
+    from routing import engine
+    from routing.build_graph import build
+    from routing.graph_store import GraphStore
+    network = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[103.85, 1.29], [103.8501, 1.29], [103.8502, 1.29]]}, "properties": {}},
+        {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[103.85, 1.29], [103.8501, 1.2901], [103.8502, 1.29]]}, "properties": {"base_cost": 5}},
+    ]}
+    (tmp_path / "network.geojson").write_text(json.dumps(network))
+    build(str(tmp_path / "network.geojson"), str(tmp_path / "graph"))
+    store = GraphStore(loader=lambda: engine.load_graph(str(tmp_path / "graph")))
+    monkeypatch.setattr(main, "graph_store", store)
+    monkeypatch.setattr(main.route_executor, "store", store)
+    by_point = client.post("/route", json={"from_lat": 1.29, "from_lng": 103.85, "to_lat": 1.29, "to_lng": 103.8502})
+    assert by_point.status_code == 200
+    assert [p["node"] for p in by_point.json()["route"]] == ["0", "3", "2"]
+    by_node = client.post("/route", json={"from_node": "0", "to_node": "2"})
+    assert by_node.status_code == 200 and by_node.json()["route"] == by_point.json()["route"]
+    matrix = client.post("/route/matrix", json={"sources": [{"node": "0"}], "targets": [{"lat": 1.29, "lng": 103.8502}]})
+    assert matrix.status_code == 200 and matrix.json()["targets"] == ["2"]
+    session = client.post("/navigate", json={"from_node": "0", "to_node": "2"})
+    assert session.status_code == 200
+    client.delete(f"/navigate/{session.json()['session_id']}")
+
+def test_route_alternatives():
+    response = client.post("/route", json={"from_node": "A", "to_node": "H", "alternatives": 2})
+    assert response.status_code == 200
+    body = response.json()
+    assert 1 <= len(body["alternatives"]) <= 2
+    for alt in body["alternatives"]:
+        nodes = [p["node"] for p in alt["route"]]
+        assert nodes[0] == "A" and nodes[-1] == "H"
+        assert nodes != [p["node"] for p in body["route"]]
+    assert client.post("/route", json={"from_node": "A", "to_node": "H"}).json()["alternatives"] == []
+    assert client.post("/route", json={"from_node": "A", "to_node": "H", "alternatives": 99}).status_code == 422
+
+def test_navigation_session_reroutes_on_hazard():
+    start = client.post("/navigate", json={"from_node": "A", "to_node": "H", "profile": "fastest"})
+    assert start.status_code == 200
+    session = start.json()
+    route = [p["node"] for p in session["route"]]
+    assert route[0] == "A" and route[-1] == "H" and session["reroutes"] == 0
+    blocked = route[len(route) // 2]
+    lat, lng = next((p["lat"], p["lng"]) for p in session["route"] if p["node"] == blocked)
+    client.post("/hazards", json={"lng": lng, "lat": lat, "hazard_type": "lift_breakdown", "severity": 1.0, "confidence": 1.0, "hazard_id": "navblock"})
+    try:
+        current = client.get(f"/navigate/{session['session_id']}").json()
+        assert current["reroutes"] == 1 and blocked not in [p["node"] for p in current["route"]]
+        moved = client.post(f"/navigate/{session['session_id']}/position", json={"node": current["route"][1]["node"]}).json()
+        assert [p["node"] for p in moved["route"]] == [p["node"] for p in current["route"]][1:]
+    finally:
+        client.delete("/hazards/navblock")
+    assert client.delete(f"/navigate/{session['session_id']}").status_code == 200
+    assert client.get(f"/navigate/{session['session_id']}").status_code == 404
+
+def test_heatmap_tiles():
+    import math
+    route = client.post("/route", json={"from_node": "A", "to_node": "H", "profile": "fastest"}).json()["route"]
+    lat, lng = route[0]["lat"], route[0]["lng"]
+    z = 17
+    x = int((lng + 180) / 360 * 2 ** z)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * 2 ** z)
+    png = client.get(f"/heatmap/{z}/{x}/{y}.png")
+    assert png.status_code == 200 and png.headers["content-type"] == "image/png"
+    assert png.content.startswith(b"\x89PNG")
+    tile = client.get(f"/heatmap/{z}/{x}/{y}.json").json()
+    assert tile["nodes"] >= 1
+    assert any(0 <= s <= 100 for row in tile["scores"] for s in row if s is not None)
+    assert client.get(f"/heatmap/{z}/{2 ** z}/{y}.png").status_code == 400
+
+def test_isochrone():
+    response = client.get("/isochrone", params={"node": "A", "minutes": "1,3", "mode": "wheelchair"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["type"] == "FeatureCollection" and body["origin"] == "A"
+    assert [f["properties"]["minutes"] for f in body["features"]] == [1, 3]
+    assert body["features"][0]["properties"]["nodes"] >= 1
+    assert client.get("/isochrone", params={"node": "A", "minutes": "0"}).status_code == 400
+    assert client.get("/isochrone", params={"node": "A", "mode": "teleport"}).status_code == 400
+
+def test_submit_photo_streams_and_checks_uploads(monkeypatch, tmp_path):
+    import hashlib
+    from backend import main
+    from photo_store import PhotoStore
+    store = PhotoStore(str(tmp_path))
+    monkeypatch.setattr(main, "photo_store", store)
+    png = b"\x89PNG\r\n\x1a\n" + os.urandom(200_000)
+    form = {"gps_lat": "1.29027", "gps_lng": "103.851959", "gps_accuracy": "5"}
+    response = client.post("/submit_photo", data=form, files={"photo": ("../../curb.png", png, "image/png")})
+    assert response.status_code == 200
+    meta = response.json()["meta"]
+    sha = hashlib.sha256(png).hexdigest()
+    assert meta["content_type"] == "image/png" and meta["size"] == len(png)
+    assert meta["photo_id"] == sha and meta["duplicate"] is None
+    with open(os.path.join(str(tmp_path), sha[:2], sha[2:4], sha + ".png"), "rb") as f:
+        assert f.read() == png
+    # Content type comes from the bytes, not the client's claim
+    response = client.post("/submit_photo", data=form, files={"photo": ("x.png", b"<html></html>", "image/png")})
+    assert response.status_code == 415
+    store.max_bytes = 100_000
+    response = client.post("/submit_photo", data=form, files={"photo": ("big.png", png, "image/png")})
+    assert response.status_code == 413
+    assert not os.listdir(store.incoming_dir)
+
+def test_body_size_limit_checks_content_length_first():
+    from fastapi import FastAPI, Request
+    from io_utils import BodySizeLimit
+    received = []
+    small = FastAPI()
+    small.add_middleware(BodySizeLimit, limits={"/upload": 1000})
+
+    @small.post("/upload")
+    async def upload(request: Request):
+        received.append(len(await request.body()))
+        return {"ok": True}
+    limited = TestClient(small)
+    assert limited.post("/upload", content=b"x" * 1000).status_code == 200
+    response = limited.post("/upload", content=b"x" * 5000)
+    assert response.status_code == 413 and response.json()["error"] == "Request too large"
+    assert received == [1000]
+
+def test_photo_store_deduplicates(tmp_path, monkeypatch):
+    import asyncio
+    import io
+    from PIL import Image
+    from starlette.datastructures import UploadFile
+    from photo_store import PhotoStore
+    store = PhotoStore(str(tmp_path))
+
+    def encode(fmt, **kwargs):
+        img = Image.new("L", (120, 90))
+        img.putdata([(x * 2 + (y // 30) * 60) % 256 for y in range(90) for x in range(120)])
+        out = io.BytesIO()
+        img.save(out, fmt, **kwargs)
+        return out.getvalue()
+
+    async def put(data, lat=1.29, lng=103.85):
+        return await store.put(UploadFile(io.BytesIO(data), filename="p"), lat, lng)
+    photo = encode("PNG")
+    first = asyncio.run(put(photo))
+    assert first.duplicate is None and os.path.exists(first.path) and first.phash is not None
+    store.link_hazard(first.photo_id, "h1")
+    retry = asyncio.run(put(photo))
+    assert retry.duplicate == "exact" and retry.photo_id == first.photo_id and retry.hazard_id == "h1"
+    assert store.stats()["photos"] == 1 and not os.listdir(store.incoming_dir)
+    # The same scene re-encoded a few metres away collapses into the first photo, but not 1 km away
+    again = encode("JPEG", quality=70)
+    assert asyncio.run(put(again, lat=1.29005)).duplicate_of == first.photo_id
+    far = asyncio.run(put(encode("JPEG", quality=60), lat=1.30))
+    assert far.duplicate is None and far.hazard_id is None
+    # Hashes with the top bit set are stored as negative SQLite integers and still compare by bits
+    import photo_store
+    high = 0xF0F0F0F0F0F0F0F0
+    hashes = iter([high - (1 << 64), (high ^ 0b11) - (1 << 64)])
+    monkeypatch.setattr(photo_store, "perceptual_hash", lambda path: next(hashes))
+    top = asyncio.run(put(encode("JPEG", quality=50), lat=1.31))
+    assert top.duplicate is None and store.get(top.photo_id).phash == high - (1 << 64)
+    assert asyncio.run(put(encode("JPEG", quality=40), lat=1.31)).duplicate_of == top.photo_id
+
+def test_classification_queue_micro_batches():
+    import threading
+    import time
+    from classification import ClassificationQueue, ClassificationQueueFull
+    release = threading.Event()
+    batches = []
+
+    def classify_batch(payloads):
+        release.wait(5)
+        batches.append(len(payloads))
+        return [("curb_drop", 0.9) if p["n"] != 3 else ValueError("unreadable image") for p in payloads]
+    saved = []
+    q = ClassificationQueue(classify_batch, lambda p, c: saved.append(p["n"]) or {"id": p["n"], "type": c[0]},
+                            workers=1, max_batch=4, max_wait=0.05, max_pending=6)
+    first = q.submit({"n": 0})
+    time.sleep(0.2)  # the worker is now holding job 0 inside classify_batch
+    jobs = [q.submit({"n": n}) for n in range(1, 7)]
+    with pytest.raises(ClassificationQueueFull):
+        q.submit({"n": 99})
+    assert q.status(first.job_id)["status"] == "running"
+    assert q.status(jobs[-1].job_id) == {**q.status(jobs[-1].job_id), "status": "queued", "queued_ahead": 5}
+    release.set()
+    deadline = time.monotonic() + 5
+    while q.stats()["completed"] + q.stats()["failed"] < 7 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batches == [1, 4, 2] and sorted(saved) == [0, 1, 2, 4, 5, 6]
+    done = q.status(jobs[0].job_id)
+    assert done["status"] == "done" and done["result"] == {"id": 1, "type": "curb_drop"} and done["batch_size"] == 4
+    assert q.status(jobs[2].job_id)["error"] == "unreadable image"
+    assert q.status("nope") is None
+
+def test_duplicates_share_a_pending_classification(tmp_path, monkeypatch):
+    import asyncio
+    import io
+    import threading
+    import time
+    import db
+    import ingestion
+    import photo_store
+    from classification import ClassificationQueue
+    from hazard_store import HazardStore
+    from starlette.datastructures import UploadFile
+    (tmp_path / "hazards.geojson").write_text('{"type": "FeatureCollection", "features": []}')
+    monkeypatch.setattr(db, "_store", HazardStore(str(tmp_path / "hazards.geojson")))
+    monkeypatch.setattr(photo_store, "_photo_store", photo_store.PhotoStore(str(tmp_path / "photos")))
+    release = threading.Event()
+
+    def classify_batch(payloads):
+        release.wait(5)
+        return [("curb", 0.9) for _ in payloads]
+    queue = ClassificationQueue(classify_batch, ingestion.store_classification, workers=1, max_wait=0.01)
+    monkeypatch.setattr(ingestion, "_queue", queue)
+    png = b"\x89PNG\r\n\x1a\n" + os.urandom(1000)
+
+    def submit():
+        return asyncio.run(ingestion.process_submission(UploadFile(io.BytesIO(png), filename="p.png"), 1.29, 103.85, "dev"))
+    first = submit()
+    retry = submit()  # arrives while the first upload is still being classified
+    assert retry["job_id"] == first["job_id"] and queue.stats()["collapsed"] == 1
+    release.set()
+    deadline = time.monotonic() + 5
+    while queue.status(first["job_id"])["status"] != "done" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    hazard_id = queue.status(first["job_id"])["result"]["id"]
+    assert len(db.get_store()) == 1
+    later = submit()
+    assert later["id"] == hazard_id and later["duplicate"] == "exact"
+
+def imu_trace(n, rough=None, tilt=None, seed=0):
+    """Synthetic 10 Hz trace of a level device walking north, with optional vibration and tilt spans."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    s = np.zeros((n, 9))
+    s[:, 0] = 1_765_000_000 + np.arange(n) / 10
+    s[:, 1:4] = rng.normal(0, 0.02, (n, 3))
+    s[:, 3] += 1.0
+    s[:, 7], s[:, 8] = 1.29 + np.arange(n) * 1e-6, 103.85
+    if rough:
+        s[rough[0]:rough[1], 3] += rng.normal(0, 0.8, rough[1] - rough[0])
+    if tilt:
+        s[tilt[0]:tilt[1], 1], s[tilt[0]:tilt[1], 3] = 0.139, 0.990  # ~8 degrees
+    return s
+
+def test_imu_pipeline_detects_and_merges(tmp_path):
+    from hazard_store import HazardStore
+    from imu import ImuPipeline, encode_binary, parse_batches
+    store = HazardStore(str(tmp_path / "hazards.geojson"))
+    pipeline = ImuPipeline(store)
+    s = imu_trace(100, rough=(20, 35), tilt=(50, 90))
+    (device, decoded), = parse_batches(encode_binary("dev1", s), "application/octet-stream")
+    assert device == "dev1" and abs(decoded - s).max() < 1e-5
+    # The slope is still running after the first batch, so only the rough patch is emitted
+    first = pipeline.ingest(encode_binary("dev1", s[:60]), "application/octet-stream")
+    assert [c["type"] for c in first["candidates"]] == ["rough_surface"]
+    second = pipeline.ingest(encode_binary("dev1", s[60:]), "application/octet-stream")
+    assert [c["type"] for c in second["candidates"]] == ["steep_slope"]
+    assert len(store) == 2
+    # Another device over the same spot reinforces the hazards instead of adding more
+    third = pipeline.ingest(encode_binary("dev2", s), "application/octet-stream")
+    assert len(third["candidates"]) == 2 and all(c["merged"] for c in third["candidates"])
+    assert len(store) == 2 and all(f["properties"]["reports"] == 2 for f in store.all())
+    assert pipeline.stats() == {"devices": 2, "samples": 200, "candidates": 4}
+
+def test_ingest_iot_formats(tmp_path, monkeypatch):
+    import json
+    from backend import main
+    from hazard_store import HazardStore
+    from imu import ImuPipeline
+    monkeypatch.setattr(main, "imu_pipeline", ImuPipeline(HazardStore(str(tmp_path / "hazards.geojson"))))
+    s = imu_trace(100, rough=(20, 35))
+    batch = {"device_id": "phone", "t": s[:, 0].tolist(), "ax": s[:, 1].tolist(), "ay": s[:, 2].tolist(),
+             "az": s[:, 3].tolist(), "lat": 1.3, "lng": 103.8}
+    response = client.post("/ingest_iot", json=batch)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["samples"] == 100 and [c["type"] for c in body["candidates"]] == ["rough_surface"]
+    assert body["candidates"][0]["lat"] == pytest.approx(1.3)
+    ndjson = "\n".join(json.dumps({**batch, "device_id": f"p{i}"}) for i in range(3))
+    response = client.post("/ingest_iot", content=ndjson, headers={"content-type": "application/x-ndjson"})
+    assert response.json()["devices"] == 3
+    assert client.post("/ingest_iot", json={"device_id": "x", "t": [1]}).status_code == 400
+    assert client.post("/ingest_iot", content=b"IMU1\x05ab", headers={"content-type": "application/octet-stream"}).status_code == 400
+    # Oversized bodies are refused from Content-Length, or once a chunked body passes the limit
+    monkeypatch.setattr(main, "IMU_MAX_BODY_BYTES", 1000)
+    assert client.post("/ingest_iot", content=ndjson).status_code == 413
+    chunked = client.post("/ingest_iot", content=(ndjson[i:i + 500].encode() for i in range(0, len(ndjson), 500)))
+    assert chunked.status_code == 413
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_trace_store_chunks_and_rollups(tmp_path, compress):
+    import numpy as np
+    from trace_store import TraceStore
+    store = TraceStore(str(tmp_path), chunk_samples=1000, compress=compress)
+    s = imu_trace(2500)
+    for i in range(0, len(s), 10):
+        store.append("dev", s[i:i + 10])
+    # Two full chunks on disk, the rest still buffered; reads see both
+    assert store.stats()["chunks_written"] == 2 and store.stats()["buffered_samples"] == 500
+    raw = store.read("dev")
+    assert np.allclose(raw["t"], s[:, 0], atol=1e-3) and np.allclose(raw["az"], s[:, 3], atol=1e-6)
+    store.stop()
+    assert store.stats() == {"buffered_samples": 0, "chunks_written": 3, "rollups_written": 3, "pending_rollups": 0}
+    t0 = s[0, 0]
+    part = store.read("dev", t0 + 100, t0 + 105)
+    assert len(part["t"]) == 51 and part["t"][0] == pytest.approx(t0 + 100, abs=1e-3)
+    # 1min buckets split across chunk files are merged on read
+    minutes = store.read("dev", level="1min")
+    assert minutes["count"].sum() == len(s) and len(np.unique(minutes["t"])) == len(minutes["t"])
+    inside = (s[:, 0] >= minutes["t"][1]) & (s[:, 0] < minutes["t"][1] + 60)
+    assert minutes["az_mean"][1] == pytest.approx(s[inside, 3].mean(), abs=1e-5)
+    assert minutes["az_max"][1] == pytest.approx(s[inside, 3].max(), abs=1e-5)
+    assert len(store.read("dev", t0 + 100.5, t0 + 101.2, level="1s")["t"]) == 2
+    with pytest.raises(ValueError):
+        store.read("dev", level="1h")
+
+def test_get_trace(tmp_path, monkeypatch):
+    from backend import main
+    from imu import ImuPipeline, encode_binary
+    from trace_store import TraceStore
+    traces = TraceStore(str(tmp_path))
+    monkeypatch.setattr(main, "trace_store", traces)
+    monkeypatch.setattr(main, "imu_pipeline", ImuPipeline(trace_store=traces))
+    s = imu_trace(300)
+    client.post("/ingest_iot", content=encode_binary("tracer", s), headers={"content-type": "application/octet-stream"})
+    raw = client.get("/traces/tracer", params={"start": s[100, 0] - 0.01, "end": s[199, 0] + 0.01}).json()
+    assert len(raw["columns"]["t"]) == 100 and set(raw["columns"]) == {"t", "ax", "ay", "az", "gx", "gy", "gz"}
+    seconds = client.get("/traces/tracer", params={"level": "1s"}).json()["columns"]
+    assert sum(seconds["count"]) == 300 and "gz_mean" in seconds
+    assert client.get("/traces/tracer", params={"level": "weekly"}).status_code == 400
+    assert client.get("/traces/nobody").json()["columns"]["t"] == []
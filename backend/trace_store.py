@@ -0,0 +1,333 @@
+import hashlib
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import uuid
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Raw trace columns; "t" is always the first column of a chunk
+TRACE_COLUMNS = ("t", "ax", "ay", "az", "gx", "gy", "gz")
+SENSOR_COLUMNS = TRACE_COLUMNS[1:]
+# Rollup levels: name -> bucket width in seconds
+ROLLUP_LEVELS = {"1s": 1.0, "1min": 60.0}
+ROLLUP_COLUMNS = ("t", "count") + tuple(f"{c}_{stat}" for c in SENSOR_COLUMNS for stat in ("min", "max", "mean"))
+
+# Chunk file: b"TRC1", flags (bit 0 = zlib), uint32 rows, uint16 columns, float64 first
+# and last timestamp, then per column a 16-byte name and the uint32 size of its
+# block, then the blocks. Each block is `rows` float32 values; "t" is stored as
+# float32 differences from the previous timestamp (first = 0), so values stay
+# small and repetitive at a steady sample rate.
+CHUNK_MAGIC = b"TRC1"
+FLAG_ZLIB = 1
+_HEADER = struct.Struct("<4sBIHdd")
+_COLUMN = struct.Struct("<16sI")
+
+
+def write_chunk(path: str, columns: Dict[str, np.ndarray], compress: bool = False) -> None:
+    """Write columns (first one "t", float64 seconds) as an immutable chunk file."""
+    names = list(columns)
+    t = np.asarray(columns[names[0]], dtype=np.float64)
+    blocks = []
+    for name in names:
+        if name == names[0]:
+            values = np.diff(t, prepend=t[:1]).astype(np.float32)
+        else:
+            values = np.asarray(columns[name], dtype=np.float32)
+        data = values.astype("<f4").tobytes()
+        blocks.append(zlib.compress(data, 6) if compress else data)
+    header = _HEADER.pack(CHUNK_MAGIC, FLAG_ZLIB if compress else 0, len(t), len(names), float(t[0]), float(t[-1]))
+    header += b"".join(_COLUMN.pack(name.encode("ascii"), len(block)) for name, block in zip(names, blocks))
+    # Written aside and renamed, so readers never see a partial chunk
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        for block in blocks:
+            f.write(block)
+    os.replace(tmp, path)
+
+
+def read_chunk(path: str) -> Dict[str, np.ndarray]:
+    """
+    Columns of a chunk file. Uncompressed chunks are memory-mapped, so only the
+    pages a query touches are read; "t" is rebuilt as float64 seconds.
+    """
+    with open(path, "rb") as f:
+        magic, flags, rows, ncols, t0, _ = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != CHUNK_MAGIC:
+            raise ValueError(f"Not a trace chunk: {path}")
+        layout = [_COLUMN.unpack(f.read(_COLUMN.size)) for _ in range(ncols)]
+        offset = f.tell()
+        compressed = [f.read(size) for _, size in layout] if flags & FLAG_ZLIB else None
+    columns = {}
+    for i, (raw_name, size) in enumerate(layout):
+        name = raw_name.rstrip(b"\0").decode("ascii")
+        if compressed is not None:
+            values = np.frombuffer(zlib.decompress(compressed[i]), dtype="<f4")
+        else:
+            values = np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=(rows,)) if rows else np.empty(0, "<f4")
+            offset += size
+        if i == 0:
+            values = t0 + np.cumsum(values, dtype=np.float64)
+        columns[name] = values
+    return columns
+
+
+def chunk_range(filename: str) -> Optional[Tuple[float, float]]:
+    """(first, last) timestamp of a chunk from its file name, or None if it is not a chunk."""
+    if not filename.endswith(".trc"):
+        return None
+    try:
+        first, last = filename.split("_")[:2]
+        return int(first) / 1000.0, int(last) / 1000.0
+    except ValueError:
+        return None
+
+
+def rollup(columns: Dict[str, np.ndarray], width: float) -> Dict[str, np.ndarray]:
+    """min/max/mean of each sensor column per `width`-second bucket, plus sample counts."""
+    t = np.asarray(columns["t"], dtype=np.float64)
+    if not len(t):
+        return {name: np.empty(0) for name in ROLLUP_COLUMNS}
+    buckets = np.floor(t / width)
+    keys, starts, counts = np.unique(buckets, return_index=True, return_counts=True)
+    out = {"t": keys * width, "count": counts.astype(np.float64)}
+    for name in SENSOR_COLUMNS:
+        values = np.asarray(columns[name], dtype=np.float64)
+        out[f"{name}_min"] = np.minimum.reduceat(values, starts)
+        out[f"{name}_max"] = np.maximum.reduceat(values, starts)
+        out[f"{name}_mean"] = np.add.reduceat(values, starts) / counts
+    return out
+
+
+def merge_rollups(parts: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Combine rollup rows from several chunks; buckets split across chunks are merged."""
+    parts = [p for p in parts if len(p["t"])]
+    if not parts:
+        return {name: np.empty(0) for name in ROLLUP_COLUMNS}
+    joined = {name: np.concatenate([np.asarray(p[name], dtype=np.float64) for p in parts]) for name in ROLLUP_COLUMNS}
+    order = np.argsort(joined["t"], kind="stable")
+    joined = {name: values[order] for name, values in joined.items()}
+    keys, starts = np.unique(joined["t"], return_index=True)
+    if len(keys) == len(joined["t"]):
+        return joined
+    counts = np.add.reduceat(joined["count"], starts)
+    out = {"t": keys, "count": counts}
+    for name in SENSOR_COLUMNS:
+        out[f"{name}_min"] = np.minimum.reduceat(joined[f"{name}_min"], starts)
+        out[f"{name}_max"] = np.maximum.reduceat(joined[f"{name}_max"], starts)
+        out[f"{name}_mean"] = np.add.reduceat(joined[f"{name}_mean"] * joined["count"], starts) / counts
+    return out
+
+
+class TraceStore:
+    """
+    Append-only columnar storage of raw IMU traces.
+
+    Samples are buffered per device and written as immutable chunk files of
+    float32 columns (t delta-encoded, optionally zlib-compressed) under
+    {root}/{device key}/, named by their first and last timestamp so a range
+    query only opens the chunks it overlaps. A chunk is cut every
+    chunk_samples samples, or after flush_seconds without one. A background
+    thread flushes idle buffers and writes 1s and 1min min/max/mean rollups of
+    every new chunk next to it; a chunk whose rollup is not written yet is
+    rolled up on read.
+    """
+
+    def __init__(self, root: str, chunk_samples: int = 6000, flush_seconds: float = 60.0, compress: bool = False):
+        """
+        Args:
+            root: directory holding one subdirectory per device (created on the first write)
+            chunk_samples: samples per chunk file
+            flush_seconds: longest time samples stay buffered in memory
+            compress: zlib-compress chunk columns (smaller, but read by decompressing instead of mmap)
+        """
+        self.root = root
+        self.chunk_samples = chunk_samples
+        self.flush_seconds = flush_seconds
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, List[np.ndarray]] = {}
+        self._buffered: Dict[str, int] = {}
+        self._first_buffered: Dict[str, float] = {}
+        self._rollups: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.chunks_written = 0
+        self.rollups_written = 0
+
+    def device_dir(self, device_id: str) -> str:
+        return os.path.join(self.root, hashlib.sha1(device_id.encode("utf-8")).hexdigest()[:20])
+
+    # Writes
+
+    def append(self, device_id: str, samples: np.ndarray) -> None:
+        """
+        Buffer samples (rows of t, ax, ay, az, gx, gy, gz, in time order; extra
+        columns are ignored) and write any chunks that filled up.
+        """
+        rows = np.asarray(samples, dtype=np.float64)[:, :len(TRACE_COLUMNS)]
+        if not len(rows):
+            return
+        full = []
+        with self._lock:
+            self._buffers.setdefault(device_id, []).append(rows)
+            self._buffered[device_id] = self._buffered.get(device_id, 0) + len(rows)
+            self._first_buffered.setdefault(device_id, time.monotonic())
+            if self._buffered[device_id] >= self.chunk_samples:
+                full.append((device_id, self._take(device_id)))
+        for device_id, rows in full:
+            self._write_rows(device_id, rows)
+
+    def flush(self, older_than: float = 0.0) -> int:
+        """Write out buffers that have waited at least older_than seconds; returns chunks written."""
+        now = time.monotonic()
+        with self._lock:
+            due = [d for d, first in self._first_buffered.items() if now - first >= older_than]
+            taken = [(d, self._take(d)) for d in due]
+        written = 0
+        for device_id, rows in taken:
+            written += self._write_rows(device_id, rows)
+        return written
+
+    def _take(self, device_id: str) -> np.ndarray:
+        rows = np.concatenate(self._buffers.pop(device_id))
+        del self._buffered[device_id], self._first_buffered[device_id]
+        return rows
+
+    def _write_rows(self, device_id: str, rows: np.ndarray) -> int:
+        directory = self.device_dir(device_id)
+        os.makedirs(directory, exist_ok=True)
+        rows = rows[np.argsort(rows[:, 0], kind="stable")]
+        written = 0
+        for start in range(0, len(rows), self.chunk_samples):
+            part = rows[start:start + self.chunk_samples]
+            name = f"{int(part[0, 0] * 1000):013d}_{int(np.ceil(part[-1, 0] * 1000)):013d}_{uuid.uuid4().hex[:8]}.trc"
+            path = os.path.join(directory, name)
+            write_chunk(path, {c: part[:, i] for i, c in enumerate(TRACE_COLUMNS)}, self.compress)
+            self._rollups.put(path)
+            written += 1
+        self.chunks_written += written
+        return written
+
+    def write_rollups(self, chunk_path: str) -> None:
+        """Write the 1s and 1min rollups of a raw chunk into its device's level directories."""
+        columns = read_chunk(chunk_path)
+        directory, name = os.path.split(chunk_path)
+        for level, width in ROLLUP_LEVELS.items():
+            os.makedirs(os.path.join(directory, level), exist_ok=True)
+            write_chunk(os.path.join(directory, level, name), rollup(columns, width), self.compress)
+        self.rollups_written += 1
+
+    # Background flush and rollup
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._background, name="trace-store", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Write every buffered sample and pending rollup, then stop the background thread."""
+        if self._thread is not None:
+            self._stop.set()
+            self._rollups.put(None)
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self._drain_rollups()
+
+    def _background(self) -> None:
+        interval = max(min(self.flush_seconds / 4, 5.0), 0.05)
+        next_flush = time.monotonic() + interval
+        while not self._stop.is_set():
+            try:
+                path = self._rollups.get(timeout=max(next_flush - time.monotonic(), 0))
+                if path is not None:
+                    self._rollup_safely(path)
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_flush:
+                try:
+                    self.flush(older_than=self.flush_seconds)
+                except Exception as e:
+                    logger.error(f"Trace flush failed: {e}")
+                next_flush = time.monotonic() + interval
+
+    def _drain_rollups(self) -> None:
+        while True:
+            try:
+                path = self._rollups.get_nowait()
+            except queue.Empty:
+                return
+            if path is not None:
+                self._rollup_safely(path)
+
+    def _rollup_safely(self, path: str) -> None:
+        try:
+            self.write_rollups(path)
+        except Exception as e:
+            logger.error(f"Trace rollup of {path} failed: {e}")
+
+    # Reads
+
+    def read(self, device_id: str, start: float = -np.inf, end: float = np.inf, level: str = "raw") -> Dict[str, np.ndarray]:
+        """
+        A device's samples (level "raw") or rollup buckets ("1s", "1min") with
+        start <= t <= end, including samples still buffered in memory.
+        Returns:
+            column name -> array, ordered by t
+        """
+        if level != "raw" and level not in ROLLUP_LEVELS:
+            raise ValueError(f"Unknown level {level!r}; expected raw, {', '.join(ROLLUP_LEVELS)}")
+        directory = self.device_dir(device_id)
+        parts = []
+        names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+        # Rollup buckets start up to one width before their first sample
+        margin = ROLLUP_LEVELS.get(level, 0.0)
+        for name in names:
+            span = chunk_range(name)
+            if span is None or span[1] < start - margin or span[0] > end:
+                continue
+            path = os.path.join(directory, name)
+            if level == "raw":
+                parts.append(read_chunk(path))
+            elif os.path.exists(os.path.join(directory, level, name)):
+                parts.append(read_chunk(os.path.join(directory, level, name)))
+            else:
+                parts.append(rollup(read_chunk(path), ROLLUP_LEVELS[level]))
+        with self._lock:
+            buffered = list(self._buffers.get(device_id, []))
+        if buffered:
+            rows = np.concatenate(buffered)
+            columns = {c: rows[:, i] for i, c in enumerate(TRACE_COLUMNS)}
+            parts.append(columns if level == "raw" else rollup(columns, ROLLUP_LEVELS[level]))
+        if level == "raw":
+            if not parts:
+                return {c: np.empty(0) for c in TRACE_COLUMNS}
+            joined = {c: np.concatenate([np.asarray(p[c], dtype=np.float64) for p in parts]) for c in TRACE_COLUMNS}
+            order = np.argsort(joined["t"], kind="stable")
+            joined = {c: v[order] for c, v in joined.items()}
+        else:
+            joined = merge_rollups(parts)
+        # A bucket is included when its interval overlaps [start, end]
+        width = ROLLUP_LEVELS.get(level)
+        keep = ((joined["t"] >= start) if width is None else (joined["t"] + width > start)) & (joined["t"] <= end)
+        return {c: v[keep] for c, v in joined.items()}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            buffered = sum(self._buffered.values())
+        return {
+            "buffered_samples": buffered,
+            "chunks_written": self.chunks_written,
+            "rollups_written": self.rollups_written,
+            "pending_rollups": self._rollups.qsize()
+        }
@@ -0,0 +1,40 @@
+import { Platform } from 'react-native';
+
+// Backend API URL - Use 10.0.2.2 for Android emulator, localhost for iOS/web
+const BACKEND_URL = Platform.OS === 'android'
+  ? 'http://10.0.2.2:8000'
+  : 'http://localhost:8000';
+
+export type MapRegion = {
+  latitude: number;
+  longitude: number;
+  latitudeDelta: number;
+  longitudeDelta: number;
+};
+
+// Fetch only the hazards inside the visible map region, following next_cursor pages
+export async function fetchHazardsInRegion(region: MapRegion, pageSize = 500): Promise<any[]> {
+  const minLng = region.longitude - region.longitudeDelta / 2;
+  const maxLng = region.longitude + region.longitudeDelta / 2;
+  const minLat = region.latitude - region.latitudeDelta / 2;
+  const maxLat = region.latitude + region.latitudeDelta / 2;
+  const bbox = [minLng, minLat, maxLng, maxLat].map((v) => v.toFixed(6)).join(',');
+
+  const features: any[] = [];
+  let cursor: string | undefined;
+  do {
+    const params = new URLSearchParams({ bbox, limit: String(pageSize) });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${BACKEND_URL}/hazards?${params.toString()}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error: ${response.status}`);
+    }
+    const data = await response.json();
+    features.push(...(data.features ?? []));
+    cursor = data.next_cursor;
+  } while (cursor);
+  return features;
+}
+
+// Accessibility heatmap as map tiles: each tile only carries gridded scores for its area
+export const HEATMAP_TILE_URL = `${BACKEND_URL}/heatmap/{z}/{x}/{y}.png`;
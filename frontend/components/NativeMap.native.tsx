@@ -1,6 +1,7 @@
 import React, { useRef, useEffect } from 'react';
 import { StyleSheet } from 'react-native';
-import MapView, { Marker, Polyline, PROVIDER_GOOGLE, Circle } from 'react-native-maps';
+import MapView, { Marker, Polyline, PROVIDER_GOOGLE, Circle, UrlTile } from 'react-native-maps';
+import { HEATMAP_TILE_URL } from './MapComponent';
 
 interface Hazard {
   id: string;
@@ -22,9 +23,10 @@ interface NativeMapProps {
   themeColors: any;
   hazards?: Hazard[];
   currentPosition?: { latitude: number; longitude: number } | null;
+  showHeatmap?: boolean;
 }
 
-export const NativeMap: React.FC<NativeMapProps> = ({ routeCoords, initialRegion, themeColors, hazards = [], currentPosition = null }) => {
+export const NativeMap: React.FC<NativeMapProps> = ({ routeCoords, initialRegion, themeColors, hazards = [], currentPosition = null, showHeatmap = false }) => {
   const mapRef = useRef<MapView>(null);
   
   const getMarkerColor = (severity: string) => {
@@ -55,6 +57,7 @@ export const NativeMap: React.FC<NativeMapProps> = ({ routeCoords, initialRegion
       showsUserLocation
       showsMyLocationButton
     >
+      {showHeatmap && <UrlTile urlTemplate={HEATMAP_TILE_URL} maximumZ={19} opacity={0.6} zIndex={-1} />}
       <Polyline coordinates={routeCoords} strokeColor="#007AFF" strokeWidth={4} />
       {hazards.map((hazard) => (
         <Marker